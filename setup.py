@@ -22,6 +22,11 @@ requires = [
     'zappa==0.45.1'
 ]
 
+extra_requirements = {
+    # the asyncio serving mode (src.dzbot.async_server), not needed on lambda
+    'async': ['aiohttp==3.7.4.post0'],
+}
+
 test_requirements = [
     'mock',
     'pytest'
@@ -31,6 +36,7 @@ setup(
     package_dir={'': 'src'},
     include_package_data=True,
     install_requires=requires,
+    extras_require=extra_requirements,
     zip_safe=True,
     tests_require=test_requirements,
     setup_requires=['pytest-runner'],
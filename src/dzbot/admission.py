@@ -0,0 +1,97 @@
+import threading
+import time
+
+from src.dzbot.cli import COMMAND_DELIMITER
+
+MAX_IN_FLIGHT = 20
+RESERVED_FOR_HIGH_PRIORITY = 5
+ROOM_MAX_IN_FLIGHT = 3
+ROOM_RATE_PER_MINUTE = 12
+
+HIGH_PRIORITY_ACTIONS = {'notify', 'override'}
+
+
+class AdmissionController():
+    """
+    decides immediately (without queuing) whether a command can run: at most max_in_flight commands run at once, the
+    last reserved slots are kept for high priority commands, and every room has its own concurrency limit and a token
+    bucket rate limit, so one noisy room can't use up every worker
+    """
+    def __init__(self, max_in_flight=MAX_IN_FLIGHT, reserved=RESERVED_FOR_HIGH_PRIORITY,
+                 room_max_in_flight=ROOM_MAX_IN_FLIGHT, room_rate_per_minute=ROOM_RATE_PER_MINUTE):
+        self.max_in_flight = max_in_flight
+        self.reserved = reserved
+        self.room_max_in_flight = room_max_in_flight
+        self.room_rate_per_second = room_rate_per_minute / 60.0
+        self.room_burst = room_rate_per_minute
+
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.room_in_flight = {}
+        self.room_buckets = {}
+        self.rejected = 0
+
+    def admit(self, room, high_priority=False):
+        """
+        try to admit a command, every admitted command must be released with release()
+
+        :param room: name or id of the room the command was sent from
+        :param high_priority: True for commands that may use the reserved slots (i.e. notify)
+        :return: a tuple of (True if the command was admitted, the reason it was rejected)
+        """
+        with self._lock:
+            reason = self._rejection_reason(room, high_priority)
+            if reason:
+                self.rejected += 1
+                return False, reason
+
+            self.in_flight += 1
+            self.room_in_flight[room] = self.room_in_flight.get(room, 0) + 1
+            self.room_buckets[room][0] -= 1
+
+        return True, None
+
+    def release(self, room):
+        """
+        release a command admitted with admit()
+
+        :param room: name or id of the room the command was sent from
+        :return: the number of commands still in flight
+        """
+        with self._lock:
+            self.in_flight -= 1
+            self.room_in_flight[room] -= 1
+            if not self.room_in_flight[room]:
+                del self.room_in_flight[room]
+
+            return self.in_flight
+
+    def _rejection_reason(self, room, high_priority):
+        capacity = self.max_in_flight if high_priority else self.max_in_flight - self.reserved
+        if self.in_flight >= capacity:
+            return 'too many commands are running'
+        if self.room_in_flight.get(room, 0) >= self.room_max_in_flight:
+            return 'too many commands are running in this room'
+
+        now = time.monotonic()
+        bucket = self.room_buckets.setdefault(room, [self.room_burst, now])
+        bucket[0] = min(self.room_burst, bucket[0] + (now - bucket[1]) * self.room_rate_per_second)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return 'this room is sending commands too quickly'
+
+        return None
+
+
+controller = AdmissionController()
+
+
+def is_high_priority(message):
+    """
+    :param message: the /dzbot message sent from hipchat, i.e. '/dzbot notify --entity users ...'
+    :return: True if the command (or any of the pipelined commands) should be ranked above read-only commands
+    """
+    words = message.split()
+    actions = words[1:2] + [word for previous, word in zip(words, words[1:]) if previous == COMMAND_DELIMITER]
+
+    return any(action in HIGH_PRIORITY_ACTIONS for action in actions)
@@ -1,7 +1,20 @@
-from flask import Flask, request
+import hmac
+import os
+import uuid
 
+from flask import Flask, request, jsonify
+
+from src.dzbot import admission, idempotency
+from src.dzbot.batch import run_batch
 from src.dzbot.utils import create_outbound_msg
-from src.pager_duty.pd import monitor_primary_secondary
+from src.dzbot.warm_up import warm_up
+from src.outbound import circuit_breaker, deadline, memory_cache, tracing
+from src.outbound.circuit_breaker import CircuitOpen
+from src.pager_duty import oncall_index, roster
+from src.pager_duty.coverage import monitor_primary_secondary
+from src.pager_duty.pd import hedged_gets
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
 
 try:
     from src.hipchat import send_room_notification, get_capabilities_descriptor
@@ -10,18 +23,187 @@ except ImportError:
 
 app = Flask(__name__)
 
+# shared secret that callers of the json api must send as 'Authorization: Bearer <token>', the api is closed without it
+API_TOKEN = os.environ.get('DZBOT_API_TOKEN')
+
 
 @app.route('/', methods=['POST'])
 def app_dzbot():
     """
     the route/url that receives the http request from the webhook
 
-    :return: a string representation of send_room_notification() if a POST request is received, else 'no request yet'
+    :return: a string representation of send_room_notification() if a POST request is received, else 'no request yet'.
+    Duplicate deliveries of the same message get the outcome of the first delivery without running the command again.
+    Each delivery is traced, and its trace can be retrieved by message id at /traces/<request_id>
+    """
+    return handle_webhook(request.json['item'])
+
+
+def handle_webhook(inbound_request):
+    """
+    handle a webhook delivery, independently of the server that received it (this flask app or the asyncio server)
+
+    :param inbound_request: the inbound request sent from hipchat
+    :return: a string representation of send_room_notification(), or the outcome of the first delivery for duplicates
+    """
+    with _trace(inbound_request):
+        return _handle_delivery(inbound_request)
+
+
+def create_traced_msg(inbound_request):
+    """
+    run a command that admit_command() admitted under a trace of the delivery and return its outbound message without
+    sending it, for servers that handle idempotency, admission and replies themselves (the asyncio server)
+
+    :param inbound_request: the inbound request sent from hipchat
+    :return: the outbound message of the command
+    """
+    with _trace(inbound_request):
+        return create_admitted_msg(inbound_request)
+
+
+def _trace(inbound_request):
+    message = inbound_request.get('message', {})
+    request_id = str(message.get('id') or uuid.uuid4())
+
+    return tracing.trace(request_id, 'webhook', room=inbound_request.get('room', {}).get('name'),
+                         command=message.get('message'))
+
+
+def _handle_delivery(inbound_request):
+    with idempotency.delivery(inbound_request) as delivery:
+        if delivery.duplicate is not None:
+            tracing.annotate(duplicate=True)
+            return delivery.duplicate
+
+        admitted, outcome = handle_command(inbound_request)
+        return delivery.record(outcome, admitted)
+
+
+def handle_command(inbound_request):
+    """
+    run a /dzbot command if admission control admits it, and send its outbound message to the room
+
+    :param inbound_request: the inbound request sent from hipchat
+    :return: a tuple of (True if the command was admitted, a string representation of send_room_notification())
+    """
+    busy_msg = admit_command(inbound_request)
+    if busy_msg:
+        return False, send_busy_reply(inbound_request, busy_msg)
+
+    return True, run_admitted_command(inbound_request)
+
+
+def admit_command(inbound_request):
+    """
+    ask admission control whether a /dzbot command may run now. Every admitted command must be run with
+    create_admitted_msg() (or run_admitted_command()), which releases it
+
+    :param inbound_request: the inbound request sent from hipchat
+    :return: None if the command was admitted, else the message telling the room that DZbot is busy
+    """
+    high_priority = admission.is_high_priority(inbound_request['message']['message'])
+    admitted, reason = admission.controller.admit(inbound_request['room']['name'], high_priority)
+    if admitted:
+        return None
+
+    return 'DZbot is busy ({}), please retry shortly'.format(reason)
+
+
+def send_busy_reply(inbound_request, busy_msg):
+    """
+    :param inbound_request: the inbound request sent from hipchat
+    :param busy_msg: the message from admit_command()
+    :return: a string representation of send_room_notification()
+    """
+    return send_reply(inbound_request, busy_msg, 'yellow')
+
+
+def run_admitted_command(inbound_request):
+    """
+    run a /dzbot command admitted by admit_command() and send its outbound message to the room
+
+    :param inbound_request: the inbound request sent from hipchat
+    :return: a string representation of send_room_notification()
+    """
+    outbound_msg = create_admitted_msg(inbound_request)
+
+    return send_reply(inbound_request, outbound_msg, 'purple')
+
+
+def send_reply(inbound_request, message, color):
+    """
+    send a message to the room of a webhook delivery. A reply that can't be sent because hipchat's circuit is open is
+    still the outcome of the delivery, so that hipchat's retries of it don't run the command again
+
+    :param inbound_request: the inbound request sent from hipchat
+    :param message: the message to send
+    :param color: background color of the message
+    :return: a string representation of send_room_notification(), or of a failed Status if the circuit is open
+    """
+    try:
+        return str(send_room_notification(reply_room(inbound_request), message, color))
+    except CircuitOpen as e:
+        return str(Status(False, str(e)))
+
+
+def reply_room(inbound_request):
+    """
+    :param inbound_request: the inbound request sent from hipchat
+    :return: the id of the room the request came from, so that replies don't depend on the room's name (or its name if
+    hipchat didn't send the id)
+    """
+    room = inbound_request['room']
+
+    return room.get('id', room.get('name'))
+
+
+def create_admitted_msg(inbound_request):
+    """
+    run a /dzbot command admitted by admit_command() within the command time budget and release its admission
+
+    :param inbound_request: the inbound request sent from hipchat
+    :return: the outbound message of the command
+    """
+    try:
+        with deadline.start():
+            return create_outbound_msg(inbound_request)
+    finally:
+        admission.controller.release(inbound_request['room']['name'])
+
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    the route/url that lets tooling resolve a batch of queries in one POST and get structured json back, i.e.
+    {"queries": [{"type": "contact_methods", "name": "Test User 1"}, {"type": "oncalls", "name": "Operations"},
+    {"type": "coverage"}]}
+
+    :return: json representation of the EntitiesResp from run_batch(), with a 400 status code for invalid batches and
+    a 401 status code unless the request carries the DZBOT_API_TOKEN bearer token
+    """
+    if not is_authorized(request.headers.get('Authorization', '')):
+        return jsonify(EntitiesResp(Status(False, 'missing or invalid api token')).to_dict()), 401
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(EntitiesResp(Status(False, 'expected a json object with a list of \'queries\'')).to_dict()), 400
+
+    with deadline.start():
+        batch_resp = run_batch(body.get('queries'))
+
+    return jsonify(batch_resp.to_dict()), 200 if batch_resp.status.success else 400
+
+
+def is_authorized(authorization):
+    """
+    :param authorization: the Authorization header of a json api request
+    :return: True if it is 'Bearer <DZBOT_API_TOKEN>'. Always False when DZBOT_API_TOKEN isn't set
     """
-    inbound_request = request.json['item']
-    outbound_msg = create_outbound_msg(inbound_request)
+    if not API_TOKEN:
+        return False
 
-    return str(send_room_notification(inbound_request['room']['name'], outbound_msg, 'purple'))
+    return hmac.compare_digest(authorization.encode('utf-8'), 'Bearer {}'.format(API_TOKEN).encode('utf-8'))
 
 
 @app.route('/capability-descriptor', methods=['GET'])
@@ -46,8 +228,96 @@ def capability_descriptor():
 def monitor_pager_duty():
     """
     this is the route that the cron job calls for checking whether each team/escalation policy has a primary and
-    secondary set in pager duty
+    secondary set in pager duty over the next 24 hours
+
+    :return: json representation of the monitoring Status
+    """
+    return monitor_primary_secondary().to_json()
+
+
+@app.route('/refresh-oncall-index')
+def refresh_oncall_index(event=None, context=None):
+    """
+    this is the route/scheduled function that periodically rebuilds the local oncall index used by /dzbot oncall-at
+
+    :param event: the scheduled event when called by zappa (unused)
+    :param context: the lambda context when called by zappa (unused)
+    :return: json representation of the refresh Status
+    """
+    return oncall_index.refresh_oncall_index().to_json()
+
+
+@app.route('/warm-up')
+def keep_warm(event=None, context=None):
+    """
+    this is the route/scheduled function that keeps the lambda container warm and preloads everything a command needs,
+    so that the first command after an idle period doesn't pay for cold imports, connections and lookups
+
+    :param event: the scheduled event when called by zappa (unused)
+    :param context: the lambda context when called by zappa (unused)
+    :return: json representation of the warm up result, including how long each step took
+    """
+    return warm_up().to_json()
+
+
+@app.route('/refresh-roster')
+def refresh_roster(event=None, context=None):
+    """
+    this is the route/scheduled function that periodically rebuilds the materialized oncall roster used by
+    /dzbot roster and /dzbot list --entity eps --name
+
+    :param event: the scheduled event when called by zappa (unused)
+    :param context: the lambda context when called by zappa (unused)
+    :return: json representation of the refresh Status
+    """
+    return roster.refresh_roster().to_json()
+
+
+@app.route('/hedging-stats')
+def hedging_stats():
+    """
+    the route/url that reports how many pager duty GETs were hedged (DZBOT_HEDGE_GETS=on) and how often the hedge won
+
+    :return: json of the hedging metrics
+    """
+    return jsonify(hedged_gets.stats())
+
+
+@app.route('/circuit-breakers')
+def circuit_breakers():
+    """
+    the route/url that reports the state of the circuit breaker of each pager duty and hipchat endpoint family
+
+    :return: json of 'host/family' to 'closed', 'open' or 'half open'
+    """
+    return jsonify(circuit_breaker.states())
+
 
-    :return: Status object
+@app.route('/cache-stats')
+def cache_stats():
     """
-    return monitor_primary_secondary()
+    the route/url that reports the memory budget shared by the pager duty and hipchat caches, and the size, hit rate
+    and evictions of each cache
+
+    :return: json of the cache metrics
+    """
+    return jsonify(memory_cache.budget.stats())
+
+
+@app.route('/traces/<request_id>')
+def get_trace(request_id):
+    """
+    the route/url that returns the span tree of a recent webhook request, i.e. to see why one command was slow
+
+    :param request_id: the hipchat message id of the request
+    :return: json of the trace, with a 404 status code if the trace isn't kept in memory and a 401 status code unless
+    the request carries the DZBOT_API_TOKEN bearer token (traces include what users sent to DZbot)
+    """
+    if not is_authorized(request.headers.get('Authorization', '')):
+        return Status(False, 'missing or invalid api token').to_json(), 401
+
+    trace = tracing.get_trace(request_id)
+    if trace is None:
+        return Status(False, 'no trace for request {}'.format(request_id)).to_json(), 404
+
+    return jsonify(trace)
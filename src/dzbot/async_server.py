@@ -0,0 +1,155 @@
+import argparse
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from src.dzbot import admission, idempotency
+from src.dzbot.app import admit_command, create_traced_msg, reply_room
+from src.hipchat.hipchat import send_room_notification_async
+from src.outbound import async_http
+from src.outbound.async_http import run_blocking
+from src.outbound.circuit_breaker import CircuitOpen
+from src.value_objects.status import Status
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+MAX_PENDING = 500
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class AsyncServer():
+    """
+    an aiohttp server for the hipchat webhook, for running DZbot as a long lived process instead of on lambda. aiohttp
+    handles http (keep-alive connections, chunked bodies, size limits) and every delivery is a coroutine. Duplicate
+    deliveries, admission control and every reply to the room are handled on the event loop with the async hipchat
+    client, so they never wait for a thread. Only the admitted commands themselves (unchanged from the flask app) run
+    in a thread pool with one thread per admission slot, so admission control still bounds how many run at once
+    """
+    def __init__(self, max_pending=MAX_PENDING, handler=None):
+        if web is None:
+            raise RuntimeError('aiohttp is required to run the asyncio server, pip install aiohttp')
+
+        self.max_pending = max_pending
+        self.pending = 0
+        self.handler = handler or self.handle_delivery
+        self._command_executor = ThreadPoolExecutor(max_workers=admission.controller.max_in_flight)
+
+    async def handle_delivery(self, inbound_request):
+        """
+        handle a webhook delivery like the flask app does, running only the command itself in a thread
+
+        :param inbound_request: the inbound request sent from hipchat
+        :return: a string representation of the reply's Status, or the outcome of the first delivery for duplicates
+        """
+        with idempotency.delivery(inbound_request) as delivery:
+            if delivery.duplicate is not None:
+                return delivery.duplicate
+
+            busy_msg = admit_command(inbound_request)
+            if busy_msg:
+                return delivery.record(await self.reply(inbound_request, busy_msg, 'yellow'), admitted=False)
+
+            outbound_msg = await run_blocking(create_traced_msg, inbound_request, executor=self._command_executor)
+            return delivery.record(await self.reply(inbound_request, outbound_msg, 'purple'))
+
+    async def reply(self, inbound_request, message, color):
+        """
+        :param inbound_request: the inbound request sent from hipchat
+        :param message: the message to send to the room of the request
+        :param color: background color of the message
+        :return: a string representation of the Status of send_room_notification_async(), or of a failed Status if
+        hipchat's circuit is open (the delivery still finishes, like with send_reply())
+        """
+        try:
+            return str(await send_room_notification_async(reply_room(inbound_request), message, color))
+        except CircuitOpen as e:
+            return str(Status(False, str(e)))
+
+    async def webhook(self, request):
+        """
+        the aiohttp handler of the webhook route
+
+        :param request: the aiohttp Request
+        :return: the aiohttp Response
+        """
+        try:
+            inbound_request = json.loads(await request.text())['item']
+        except (ValueError, KeyError, TypeError):
+            return web.Response(status=400, text='expected a hipchat webhook payload')
+
+        if self.pending >= self.max_pending:
+            return web.Response(status=503, text='DZbot is busy ({} webhooks pending), please retry shortly'.
+                                format(self.pending))
+
+        self.pending += 1
+        try:
+            return web.Response(text=str(await self.handler(inbound_request)))
+        finally:
+            self.pending -= 1
+
+    async def healthz(self, request):
+        return web.Response(text='ok')
+
+    async def close(self, application):
+        await async_http.close_session()
+
+    def application(self):
+        """
+        :return: the aiohttp Application serving POST / (the webhook) and GET /healthz
+        """
+        application = web.Application(client_max_size=MAX_BODY_BYTES)
+        application.router.add_post('/', self.webhook)
+        application.router.add_get('/healthz', self.healthz)
+        application.on_cleanup.append(self.close)
+
+        return application
+
+    async def start(self, host='127.0.0.1', port=8080):
+        """
+        start listening
+
+        :param host: the address to listen on
+        :param port: the port to listen on (0 picks a free port)
+        :return: a tuple of (the aiohttp AppRunner, which must be cleaned up to stop the server, the port listened on)
+        """
+        runner = web.AppRunner(self.application())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+
+        return runner, runner.addresses[0][1]
+
+
+def main(argv=None):
+    """
+    command line entry point, i.e. python -m src.dzbot.async_server --host 0.0.0.0 --port 8080
+
+    :param argv: optional list of command line arguments
+    :return: exit code
+    """
+    parser = argparse.ArgumentParser(description='serve the DZbot webhook from an asyncio server')
+    parser.add_argument('--host', default='127.0.0.1', help='the address to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='the port to listen on')
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help='max number of webhooks waiting on their commands before new ones are turned away')
+    args = parser.parse_args(argv)
+
+    loop = asyncio.get_event_loop()
+    runner, port = loop.run_until_complete(AsyncServer(max_pending=args.max_pending).start(args.host, args.port))
+    print('serving DZbot on http://{}:{}'.format(args.host, port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(runner.cleanup())
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
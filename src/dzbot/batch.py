@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from src.outbound import context
+from src.outbound.deadline import DeadlineExceeded
+from src.pager_duty.pd import list_contact_methods, list_ep_by_level, ensure_oncalls
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+MAX_QUERIES = 100
+MAX_WORKERS = 10
+
+QUERY_TYPES = {
+    'contact_methods': lambda name: list_contact_methods(name),
+    'oncalls': lambda name: list_ep_by_level(name),
+    'coverage': lambda name: ensure_oncalls(),
+}
+
+
+def query_key(query):
+    """
+    get the key that identifies identical queries, names are compared case insensitively like search_entity()
+
+    :param query: a query dictionary, i.e. {'type': 'oncalls', 'name': 'Operations'}
+    :return: a (type, lowercase name) tuple
+    """
+    name = query.get('name') or ''
+
+    return query.get('type'), ' '.join(name.split()).lower()
+
+
+def validate_query(query):
+    """
+    :param query: a query dictionary, i.e. {'type': 'contact_methods', 'name': 'Test User'}
+    :return: None if the query is valid, else a string describing what is wrong with it
+    """
+    if not isinstance(query, dict) or query.get('type') not in QUERY_TYPES:
+        return 'query type must be one of {}'.format(sorted(QUERY_TYPES))
+    if query['type'] != 'coverage' and not isinstance(query.get('name'), str):
+        return '{} queries require a name'.format(query['type'])
+
+    return None
+
+
+def run_query(query):
+    """
+    resolve a single query through the pager duty layer
+
+    :param query: a valid query dictionary
+    :return: a dictionary representation of the query's EntityResp/EntitiesResp
+    """
+    try:
+        return QUERY_TYPES[query['type']](query.get('name')).to_dict()
+    except DeadlineExceeded:
+        return EntitiesResp(Status(False, 'ran out of time before this query was resolved')).to_dict()
+    except requests.Timeout:
+        return EntitiesResp(Status(False, 'an upstream call took too long to answer, please retry')).to_dict()
+    except Exception as e:
+        return EntitiesResp(Status(False, 'error: {}'.format(e))).to_dict()
+
+
+def run_batch(queries, max_workers=MAX_WORKERS):
+    """
+    resolve a batch of queries. Queries with the same type and name are only resolved once, and the distinct queries
+    are resolved concurrently, sharing the caller's deadline (if any)
+
+    :param queries: list of query dictionaries
+    :param max_workers: max number of queries resolved at the same time
+    :return: an EntitiesResp containing a Status and a list of {'query': query, 'result': result} dictionaries in the
+    same order as queries
+    """
+    if not isinstance(queries, list) or not queries:
+        return EntitiesResp(Status(False, '\'queries\' must be a non empty list'))
+    if len(queries) > MAX_QUERIES:
+        return EntitiesResp(Status(False, 'a batch can contain at most {} queries'.format(MAX_QUERIES)))
+
+    errors = {i: validate_query(query) for i, query in enumerate(queries)}
+    distinct = {}
+    for i, query in enumerate(queries):
+        if not errors[i]:
+            distinct.setdefault(query_key(query), query)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {key: executor.submit(context.wrap(run_query), query) for key, query in distinct.items()}
+        resolved = {key: future.result() for key, future in futures.items()}
+
+    results = []
+    for i, query in enumerate(queries):
+        if errors[i]:
+            result = EntitiesResp(Status(False, errors[i])).to_dict()
+        else:
+            result = resolved[query_key(query)]
+        results.append({'query': query, 'result': result})
+
+    return EntitiesResp(Status(True, 'resolved {} distinct queries out of {}'.format(len(distinct), len(queries))),
+                        results)
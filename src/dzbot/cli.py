@@ -2,6 +2,9 @@ import argparse
 
 from subprocess import Popen, PIPE, TimeoutExpired
 
+# separates pipelined commands in one /dzbot message, i.e. /dzbot list --entity eps --name Ops && roster
+COMMAND_DELIMITER = '&&'
+
 
 def parse_args(message=None):
     """
@@ -37,6 +40,21 @@ def parse_args(message=None):
     subparsers. \
         add_parser('ensure-oncalls', help='ensure that each ep has an oncall level 1 and oncall level 2 user')
 
+    oncall_at_parser = subparsers.add_parser('oncall-at', help='list who is oncall for an ep or schedule at a time')
+    oncall_at_target = oncall_at_parser.add_mutually_exclusive_group(required=True)
+    oncall_at_target.add_argument('--ep', nargs='+', help='escalation policy name')
+    oncall_at_target.add_argument('--schedule', nargs='+', help='schedule name')
+    oncall_at_parser.add_argument('--at', required=True, help='time (i.e. 2018-03-03T22:00:00-05:00) or now')
+    oncall_at_parser.add_argument('--until', help='optional end time, lists everyone oncall between --at and --until')
+
+    coverage_parser = subparsers. \
+        add_parser('coverage', help='forecast gaps & duplicates in each ep\'s oncall levels 1 & 2')
+    coverage_parser.add_argument('--hours', type=int, default=24, choices=range(1, 24 * 7 + 1), metavar='1-168',
+                                 help='how many hours ahead to check, default 24')
+    coverage_parser.add_argument('--ep', nargs='+', help='only check this escalation policy')
+
+    subparsers.add_parser('roster', help='list every ep\'s oncall users & their contact info by escalation level')
+
     return parser.parse_args(message)
 
 
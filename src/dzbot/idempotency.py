@@ -0,0 +1,196 @@
+import contextlib
+import threading
+import time
+
+from src.outbound import claims
+
+WINDOW_SECONDS = 10 * 60
+# deliveries remembered at once within the window, the oldest ones are forgotten first beyond it
+MAX_DELIVERIES = 10000
+
+
+class IdempotencyCache():
+    """
+    remembers the webhook deliveries that were already handled, so that a delivery that hipchat retries (because DZbot
+    answered slowly) is short-circuited instead of running the same command, and sending the same incident, twice. At
+    most max_deliveries are remembered, so the oldest ones are forgotten early when there are more within the window
+    """
+    def __init__(self, window_seconds=WINDOW_SECONDS, max_deliveries=MAX_DELIVERIES):
+        self.window_seconds = window_seconds
+        self.max_deliveries = max_deliveries
+        self._lock = threading.Lock()
+        self._deliveries = {}
+        self.duplicates = 0
+
+    def begin(self, key):
+        """
+        record the start of a delivery
+
+        :param key: the key identifying the delivery, from delivery_key()
+        :return: a tuple of (True if this is the first delivery, the outcome of the first delivery if it has
+        finished, else None)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            delivery = self._deliveries.get(key)
+            if delivery is None:
+                for oldest in list(self._deliveries)[:len(self._deliveries) - self.max_deliveries + 1]:
+                    del self._deliveries[oldest]
+                self._deliveries[key] = {'outcome': None, 'expires_at': now + self.window_seconds}
+                return True, None
+
+            self.duplicates += 1
+            return False, delivery['outcome']
+
+    def finish(self, key, outcome):
+        """
+        record the outcome of a delivery, which is returned to every duplicate delivery within the window
+
+        :param key: the key identifying the delivery
+        :param outcome: the outcome of the delivery
+        :return: the outcome
+        """
+        with self._lock:
+            if key in self._deliveries:
+                self._deliveries[key]['outcome'] = outcome
+
+        return outcome
+
+    def discard(self, key):
+        """
+        forget a delivery that didn't finish (i.e. it failed or was rejected), so that a retry of it can run
+
+        :param key: the key identifying the delivery
+        :return: True if the delivery was known
+        """
+        with self._lock:
+            return self._deliveries.pop(key, None) is not None
+
+    def _prune(self, now):
+        expired = [key for key, delivery in self._deliveries.items() if delivery['expires_at'] <= now]
+        for key in expired:
+            del self._deliveries[key]
+
+
+class SharedIdempotencyCache():
+    """
+    an IdempotencyCache kept in a ClaimTable shared by every container. On lambda a container handles one delivery at a
+    time, so the retry of a delivery that is still running always lands on another container, which a per container
+    cache can't recognize
+    """
+    def __init__(self, table, window_seconds=WINDOW_SECONDS):
+        self.table = table
+        self.window_seconds = window_seconds
+        self.duplicates = 0
+
+    def begin(self, key):
+        """
+        record the start of a delivery
+
+        :param key: the key identifying the delivery, from delivery_key()
+        :return: a tuple of (True if this is the first delivery, the outcome of the first delivery if it has
+        finished, else None)
+        """
+        is_first, claim = self.table.claim(_table_key(key), self.window_seconds, None)
+        if is_first:
+            return True, None
+
+        self.duplicates += 1
+        return False, claim['value']
+
+    def finish(self, key, outcome):
+        """
+        record the outcome of a delivery, which is returned to every duplicate delivery within the window
+
+        :param key: the key identifying the delivery
+        :param outcome: the outcome of the delivery
+        :return: the outcome
+        """
+        self.table.set_value(_table_key(key), outcome)
+
+        return outcome
+
+    def discard(self, key):
+        """
+        forget a delivery that didn't finish (i.e. it failed or was rejected), so that a retry of it can run
+
+        :param key: the key identifying the delivery
+        :return: True if the delivery was known
+        """
+        return self.table.release(_table_key(key))
+
+
+def _table_key(key):
+    return 'delivery|{}|{}'.format(*key)
+
+
+cache = SharedIdempotencyCache(claims.ClaimTable()) if claims.TABLE_NAME else IdempotencyCache()
+
+
+def delivery_key(inbound_request):
+    """
+    :param inbound_request: the inbound request sent from hipchat
+    :return: a (room, message id) tuple identifying the delivery, or None if hipchat didn't send a message id
+    """
+    message_id = inbound_request.get('message', {}).get('id')
+    if not message_id:
+        return None
+
+    room = inbound_request.get('room', {})
+    return room.get('id', room.get('name')), message_id
+
+
+class Delivery():
+    """
+    a webhook delivery handled within delivery(). duplicate is the reply to return instead of handling a duplicate
+    delivery, else the handler calls record() with its outcome
+    """
+    def __init__(self, key):
+        self.key = key
+        self.duplicate = None
+        self.outcome = None
+        self.admitted = False
+
+    def record(self, outcome, admitted=True):
+        """
+        :param outcome: the outcome of the delivery
+        :param admitted: False if the command wasn't admitted (i.e. DZbot was busy), so that a retry of it can run
+        :return: the outcome
+        """
+        self.outcome = outcome
+        self.admitted = admitted
+
+        return outcome
+
+
+@contextlib.contextmanager
+def delivery(inbound_request):
+    """
+    handle a webhook delivery at most once within the window, for every server (the flask app and the asyncio server).
+    The outcome recorded for an admitted delivery is kept for its duplicates, a delivery that wasn't admitted or that
+    raised is forgotten so that hipchat's retry of it can run
+
+    :param inbound_request: the inbound request sent from hipchat
+    :return: a context manager giving the Delivery
+    """
+    current = Delivery(delivery_key(inbound_request))
+    if current.key:
+        is_first, outcome = cache.begin(current.key)
+        if not is_first:
+            current.duplicate = outcome if outcome is not None else \
+                'duplicate delivery, the first delivery is still running'
+            yield current
+            return
+
+    try:
+        yield current
+    except Exception:
+        if current.key:
+            cache.discard(current.key)
+        raise
+
+    if current.key and current.admitted:
+        cache.finish(current.key, current.outcome)
+    elif current.key:
+        cache.discard(current.key)
@@ -0,0 +1,223 @@
+import argparse
+import collections
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from src.dzbot.app import app
+from src.dzbot.stand_in import StandInServer
+from src.hipchat import hipchat
+from src.pager_duty import oncall_index, pd
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+DEFAULT_MIX = collections.OrderedDict([
+    ('list --entity oncalls --name Test User 1', 4),
+    ('list --entity eps --name EP 1', 3),
+    ('list --entity users', 2),
+    ('ensure-oncalls', 1),
+])
+
+
+def point_clients_at(base_url):
+    """
+    send every pager duty and hipchat call to base_url (i.e. a StandInServer) instead of the real apis
+
+    :param base_url: the url of the stand in
+    :return: None
+    """
+    pd.api_host = base_url
+    oncall_index.api_host = base_url
+    hipchat.api_host = base_url + '/v2'
+
+
+def parse_mix(specs):
+    """
+    :param specs: list of 'command=weight' strings, i.e. ['ensure-oncalls=1', 'list --entity users=3']. The weight
+    defaults to 1
+    :return: an OrderedDict of command to weight
+    """
+    mix = collections.OrderedDict()
+    for spec in specs:
+        command, _, weight = spec.rpartition('=') if '=' in spec else (spec, '', '1')
+        mix[command.strip()] = float(weight)
+
+    return mix
+
+
+def build_payload(command, index):
+    """
+    build a hipchat room_message webhook payload, like the one app_dzbot() reads from request.json['item']. Each
+    payload gets its own room so that its reply can be told apart from the others in the stand in
+
+    :param command: the /dzbot command without '/dzbot', i.e. 'ensure-oncalls'
+    :param index: the index of the request
+    :return: the payload dictionary
+    """
+    return {
+        'event': 'room_message',
+        'item': {
+            'message': {'id': str(uuid.uuid4()), 'message': '/dzbot {}'.format(command),
+                        'from': {'name': 'Test User 0'}},
+            'room': {'id': index, 'name': 'load-test-{}'.format(index)},
+        },
+    }
+
+
+def percentile(sorted_values, pct):
+    """
+    :param sorted_values: sorted list of numbers
+    :param pct: the percentile, between 0 and 100
+    :return: the nearest rank percentile, or None if there are no values
+    """
+    if not sorted_values:
+        return None
+
+    rank = max(int(math.ceil(pct / 100 * len(sorted_values))), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(results, wall_time):
+    """
+    :param results: list of (command, outcome, latency in seconds) tuples, where outcome is 'ok', 'busy' or 'error'
+    :param wall_time: seconds the whole run took
+    :return: a list of per command dictionaries (and a final 'all' dictionary) with the throughput, error rates and
+    p50/p95/p99 latencies in milliseconds
+    """
+    by_command = collections.OrderedDict()
+    for command, outcome, latency in results:
+        by_command.setdefault(command, []).append((outcome, latency))
+    by_command['all'] = [(outcome, latency) for _, outcome, latency in results]
+
+    report = []
+    for command, command_results in by_command.items():
+        latencies = sorted(latency for _, latency in command_results)
+        outcomes = collections.Counter(outcome for outcome, _ in command_results)
+        report.append({
+            'command': command,
+            'requests': len(command_results),
+            'throughput': round(len(command_results) / wall_time, 2) if wall_time else None,
+            'error_rate': round(outcomes['error'] / len(command_results), 4),
+            'busy_rate': round(outcomes['busy'] / len(command_results), 4),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        })
+
+    return report
+
+
+def _send_one(client, stand_in, command, index, scheduled):
+    payload = build_payload(command, index)
+    try:
+        response = client.post('/', data=json.dumps(payload), content_type='application/json')
+        reply = stand_in.notifications.get(str(payload['item']['room']['id']), {})
+        if response.status_code != 200 or not reply:
+            outcome = 'error'
+        else:
+            outcome = 'busy' if reply.get('color') == 'yellow' else 'ok'
+    except Exception:
+        outcome = 'error'
+
+    # latency is measured from when the request was scheduled, so that requests that queued behind slow ones count
+    return command, outcome, time.perf_counter() - scheduled
+
+
+def run_load(app, stand_in, mix=DEFAULT_MIX, rate=10.0, duration=10.0, concurrency=20, seed=None):
+    """
+    post webhook payloads for the commands of mix to app at a fixed rate (open loop, so a slow app doesn't slow down
+    the arrivals), and measure how long each one takes
+
+    :param app: the flask app
+    :param stand_in: a started StandInServer that the pager duty and hipchat clients point at
+    :param mix: dictionary of command to weight
+    :param rate: target requests per second
+    :param duration: seconds to send requests for
+    :param concurrency: max number of requests in flight
+    :param seed: optional random seed for the command choices
+    :return: an EntitiesResp containing a Status and the summarize() report
+    """
+    if not mix or rate <= 0 or duration <= 0:
+        return EntitiesResp(Status(False, 'mix must not be empty and rate and duration must be positive'))
+
+    commands = list(mix.keys())
+    choices = random.Random(seed).choices(commands, weights=list(mix.values()), k=max(int(rate * duration), 1))
+    local = threading.local()
+
+    def send(command, index, scheduled):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return _send_one(local.client, stand_in, command, index, scheduled)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for index, command in enumerate(choices):
+            scheduled = start + index / rate
+            time.sleep(max(scheduled - time.perf_counter(), 0))
+            futures.append(executor.submit(send, command, index, scheduled))
+        results = [future.result() for future in futures]
+    wall_time = time.perf_counter() - start
+
+    return EntitiesResp(Status(True, 'sent {0} requests in {1:.1f}s ({2:.1f} requests/s)'.
+                               format(len(results), wall_time, len(results) / wall_time)),
+                        summarize(results, wall_time))
+
+
+def report_to_string(report):
+    """
+    :param report: the report of summarize()
+    :return: the report as a table
+    """
+    columns = ['requests', 'throughput', 'error_rate', 'busy_rate', 'p50_ms', 'p95_ms', 'p99_ms']
+    width = max(len(row['command']) for row in report)
+    lines = ['{0:<{1}}  {2}'.format('command', width, '  '.join('{:>10}'.format(column) for column in columns))]
+    for row in report:
+        lines.append('{0:<{1}}  {2}'.format(row['command'], width,
+                                            '  '.join('{:>10}'.format(row[column]) for column in columns)))
+
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    """
+    command line entry point, i.e. python -m src.dzbot.load_generator --rate 20 --duration 30 --upstream-latency 0.05
+
+    :param argv: optional list of command line arguments
+    :return: exit code, 0 if no request failed
+    """
+    parser = argparse.ArgumentParser(description='load test the DZbot webhook against local pager duty and hipchat '
+                                                 'stand ins')
+    parser.add_argument('--rate', type=float, default=10, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to send requests for')
+    parser.add_argument('--concurrency', type=int, default=20, help='max number of requests in flight')
+    parser.add_argument('--upstream-latency', type=float, default=0.05,
+                        help='seconds each stand in pager duty/hipchat call takes')
+    parser.add_argument('--command', action='append',
+                        help='command=weight to include in the mix, i.e. "ensure-oncalls=2" (can be repeated)')
+    parser.add_argument('--seed', type=int, help='random seed for the command mix')
+    args = parser.parse_args(argv)
+
+    stand_in = StandInServer(latency=args.upstream_latency)
+    point_clients_at(stand_in.start())
+
+    try:
+        resp = run_load(app, stand_in, mix=parse_mix(args.command) if args.command else DEFAULT_MIX, rate=args.rate,
+                        duration=args.duration, concurrency=args.concurrency, seed=args.seed)
+    finally:
+        stand_in.stop()
+
+    print(resp.status.content)
+    if resp.entities:
+        print(report_to_string(resp.entities))
+
+    return 0 if resp.status.success and resp.entities[-1]['error_rate'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
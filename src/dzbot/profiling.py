@@ -0,0 +1,77 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+
+from src.outbound import context, http
+
+PROFILE_FLAG = '--profile'
+REPLY = 'reply'
+LOG = 'log'
+
+logger = logging.getLogger(__name__)
+
+
+def profiling_requested(message_list):
+    """
+    check whether a command should be profiled, either because the hidden --profile flag was sent with the command (the
+    summary is added to the reply) or because the DZBOT_PROFILE env var profiles every command (the summary is only
+    logged)
+
+    :param message_list: the command in list format, i.e. ['list', '--entity', 'users', '--profile']
+    :return: a tuple of (REPLY, LOG or None if profiling isn't requested, the command without the --profile flag)
+    """
+    stripped = [arg for arg in message_list if arg != PROFILE_FLAG]
+    if len(stripped) != len(message_list):
+        return REPLY, stripped
+
+    if os.environ.get('DZBOT_PROFILE', '').lower() in ('1', 'true', 'yes'):
+        return LOG, stripped
+
+    return None, stripped
+
+
+def profile_call(fn, *args, top=25):
+    """
+    run fn(*args) under cProfile, then log its top cumulative hot spots and the wall time of every outbound http call
+    made on behalf of fn. Calls are attributed through the request context, so the calls made from worker threads
+    started with context.wrap() are counted, while the calls of other requests running at the same time aren't. The
+    hot spots only cover the calling thread
+
+    :param fn: the function to profile
+    :param args: the arguments of fn
+    :param top: number of hot spots to log
+    :return: a tuple of (the result of fn, a one line summary of the profile)
+    """
+    outbound_calls = []
+
+    def record_outbound_call(method, url, elapsed, response):
+        if context.get('profiled_calls') is outbound_calls:
+            status_code = response.status_code if response is not None else None
+            outbound_calls.append((method.upper(), url, elapsed, status_code))
+
+    profiler = cProfile.Profile()
+    http.add_listener(record_outbound_call)
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        with context.scope(profiled_calls=outbound_calls):
+            result = fn(*args)
+    finally:
+        profiler.disable()
+        wall_time = time.perf_counter() - start
+        http.remove_listener(record_outbound_call)
+
+    stats_stream = io.StringIO()
+    pstats.Stats(profiler, stream=stats_stream).sort_stats('cumulative').print_stats(top)
+    outbound_time = sum(call[2] for call in outbound_calls)
+    summary = 'profiled {0}: {1:.3f}s wall time, {2} outbound calls took {3:.3f}s'.\
+        format(getattr(fn, '__name__', fn), wall_time, len(outbound_calls), outbound_time)
+
+    logger.info('%s\n%s', summary, stats_stream.getvalue())
+    for method, url, elapsed, status_code in outbound_calls:
+        logger.info('outbound %s %s -> %s in %.3fs', method, url, status_code, elapsed)
+
+    return result, summary
@@ -0,0 +1,146 @@
+import json
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+def build_data(user_count=50, ep_count=10):
+    """
+    build the users, escalation policies, services, schedules and oncalls served by the stand in. Escalation policy
+    'EP i' has 'Test User 2i' oncall at level 1 and 'Test User 2i+1' at level 2
+
+    :param user_count: number of users
+    :param ep_count: number of escalation policies (each with a service and a schedule)
+    :return: a dictionary of entity type to a list of entities
+    """
+    users = [{'id': 'PU{}'.format(i), 'name': 'Test User {}'.format(i), 'email': 'test.user{}@example.com'.format(i)}
+             for i in range(user_count)]
+    eps = [{'id': 'PE{}'.format(i), 'name': 'EP {}'.format(i)} for i in range(ep_count)]
+    oncalls = []
+    for i, ep in enumerate(eps):
+        for level in (1, 2):
+            user = users[(2 * i + level - 1) % user_count]
+            oncalls.append({'escalation_policy': {'id': ep['id'], 'summary': ep['name']}, 'escalation_level': level,
+                            'user': {'id': user['id'], 'summary': user['name']}, 'schedule': None,
+                            'start': None, 'end': None})
+
+    return {
+        'users': users,
+        'escalation_policies': eps,
+        'services': [{'id': 'PS{}'.format(i), 'name': 'Service {}'.format(i), 'type': 'service'}
+                     for i in range(ep_count)],
+        'schedules': [{'id': 'PC{}'.format(i), 'name': 'Schedule {}'.format(i)} for i in range(ep_count)],
+        'oncalls': oncalls,
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status_code, body=None):
+        content = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+    def do_HEAD(self):
+        self._reply(200)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        data = self.server.data
+
+        contact_methods = re.match(r'^/users/([^/]+)/contact_methods$', parts.path)
+        if contact_methods:
+            user = next((user for user in data['users'] if user['id'] == contact_methods.group(1)), None)
+            if user is None:
+                return self._reply(404, {'error': {'message': 'Not Found'}})
+            return self._reply(200, {'contact_methods': [
+                {'type': 'email_contact_method', 'address': user['email']},
+                {'type': 'phone_contact_method', 'address': '555{:07d}'.format(int(user['id'][2:]))},
+            ]})
+
+        if parts.path == '/v2/room':
+            return self._reply(200, {'items': [], 'links': {}})
+
+        entity_type = parts.path.strip('/')
+        if entity_type not in data:
+            return self._reply(404, {'error': {'message': 'Not Found'}})
+
+        entities = data[entity_type]
+        if 'query' in query:
+            entities = [entity for entity in entities if query['query'][0].lower() in entity['name'].lower()]
+        if 'escalation_policy_ids[]' in query:
+            ep_ids = query['escalation_policy_ids[]']
+            entities = [entity for entity in entities if entity['escalation_policy']['id'] in ep_ids]
+
+        offset = int(query.get('offset', [0])[0])
+        limit = int(query.get('limit', [25])[0])
+        self._reply(200, {entity_type: entities[offset:offset + limit], 'limit': limit, 'offset': offset,
+                          'more': offset + limit < len(entities)})
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        path = urlsplit(self.path).path
+        body = self._read_json()
+
+        notification = re.match(r'^/v2/room/([^/]+)/notification$', path)
+        if notification:
+            with self.server.lock:
+                self.server.notifications[notification.group(1)] = body
+            return self._reply(204)
+        if path == '/incidents':
+            with self.server.lock:
+                self.server.incidents.append(body.get('incident', {}))
+                number = len(self.server.incidents)
+            return self._reply(201, {'incident': dict(body.get('incident', {}), id='PI{}'.format(number),
+                                                      incident_number=number)})
+        if re.match(r'^/schedules/[^/]+/overrides$', path):
+            return self._reply(201, {'override': body.get('override', {})})
+
+        self._reply(404, {'error': {'message': 'Not Found'}})
+
+
+class StandInServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    a local stand in for the pager duty and hipchat apis, serving the entities of build_data() after a fixed latency.
+    The last notification sent to each hipchat room is kept in notifications, and every incident opened in incidents
+    """
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, data=None, port=0):
+        HTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.data = data if data is not None else build_data()
+        self.notifications = {}
+        self.incidents = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address)
+
+    def start(self):
+        """
+        serve requests from a daemon thread
+
+        :return: the base url of the stand in
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
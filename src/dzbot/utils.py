@@ -1,9 +1,19 @@
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pformat
 
-from src.dzbot.cli import check_stdout_stderr, parse_args
-from src.pager_duty.pd import send_incident, list_all_entities, list_specific_entity, ensure_oncalls, override_schedule
+import requests
+
+from src.dzbot.cli import check_stdout_stderr, parse_args, COMMAND_DELIMITER
+from src.dzbot.profiling import profiling_requested, profile_call, REPLY
+from src.outbound import context, deadline, tracing
+from src.outbound.circuit_breaker import CircuitOpen
+from src.pager_duty import roster
+from src.pager_duty.coverage import forecast_coverage, coverage_to_string
+from src.pager_duty.oncall_index import who_is_oncall, parse_pd_time
+from src.pager_duty.pd import send_incident, list_all_entities, list_specific_entity, ensure_oncalls, \
+    override_schedule, ordered_dict_to_string, shared_lookups
 
 logging.getLogger('werkzeug').setLevel(logging.WARNING)
 logging.getLogger('urllib3').setLevel(logging.WARNING)
@@ -11,24 +21,125 @@ logging.getLogger('urllib3').setLevel(logging.WARNING)
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
+MAX_PIPELINED_COMMANDS = 5
+READ_ONLY_ACTIONS = {'list', 'ensure-oncalls', 'oncall-at', 'coverage', 'roster'}
+
 
 def create_outbound_msg(inbound_request):
     """
-    Create the correct outbound message by comparing the /dzbot command from hipchat with our command line program
+    Create the correct outbound message by comparing the /dzbot command from hipchat with our command line program.
+    Several commands can be sent in one message, separated by ' && '
 
     :param inbound_request: the inbound request sent from hipchat
     :return: the outbound message that is sent back to hipchat
     """
     message_list = _strip_dzbot(inbound_request['message']['message']).split()
-    stdout, stderr = check_stdout_stderr(message_list)
+    profile, message_list = profiling_requested(message_list)
+    run = run_pipeline if COMMAND_DELIMITER in message_list else run_command
+    if profile:
+        outbound_msg, summary = profile_call(run, inbound_request, message_list)
+        return '{0}\n({1})'.format(outbound_msg, summary) if profile == REPLY else outbound_msg
+
+    return run(inbound_request, message_list)
+
+
+def split_commands(message_list):
+    """
+    split pipelined commands
+
+    :param message_list: the message in list format, i.e. ['list', '--entity', 'eps', '&&', 'roster']
+    :return: a list of the commands in list format, i.e. [['list', '--entity', 'eps'], ['roster']]
+    """
+    commands = [[]]
+    for arg in message_list:
+        if arg == COMMAND_DELIMITER:
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+
+    return [command for command in commands if command]
+
+
+def plan_stages(commands):
+    """
+    group pipelined commands into stages that run one after another. Consecutive read-only commands share a stage and
+    run concurrently, while each command that changes something (i.e. notify, override) gets a stage of its own, so
+    that commands sent after it see its effect
+
+    :param commands: list of commands in list format
+    :return: a list of stages, each a list of indexes into commands
+    """
+    stages = []
+    for i, command in enumerate(commands):
+        if command[0] in READ_ONLY_ACTIONS and stages and commands[stages[-1][0]][0] in READ_ONLY_ACTIONS:
+            stages[-1].append(i)
+        else:
+            stages.append([i])
+
+    return stages
+
+
+def run_pipeline(inbound_request, message_list):
+    """
+    Run several /dzbot commands sent in one message. Entities looked up by one command are reused by the others
+
+    :param inbound_request: the inbound request sent from hipchat
+    :param message_list: the commands in list format, separated by COMMAND_DELIMITER
+    :return: the outbound messages of every command, combined into one message in the order they were sent
+    """
+    commands = split_commands(message_list)
+    if len(commands) > MAX_PIPELINED_COMMANDS:
+        return 'can\'t run more than {} commands from one message'.format(MAX_PIPELINED_COMMANDS)
+
+    results = [None] * len(commands)
+    with shared_lookups():
+        for stage in plan_stages(commands):
+            if len(stage) == 1:
+                results[stage[0]] = run_command(inbound_request, commands[stage[0]])
+                continue
+
+            with ThreadPoolExecutor(max_workers=len(stage)) as executor:
+                futures = {i: executor.submit(context.wrap(run_command), inbound_request, commands[i]) for i in stage}
+                for i, future in futures.items():
+                    results[i] = future.result()
+
+    replies = ['[{0}/{1}] /dzbot {2}\n{3}'.format(i + 1, len(commands), ' '.join(command), result)
+               for i, (command, result) in enumerate(zip(commands, results))]
+
+    return '\n\n'.join(replies)
+
+
+def run_command(inbound_request, message_list):
+    """
+    Run a /dzbot command after validating it against our command line program
+
+    :param inbound_request: the inbound request sent from hipchat
+    :param message_list: the command in list format, i.e. ['list', '--entity', 'users']
+    :return: the outbound message that is sent back to hipchat
+    """
+    with tracing.span('validate_command'):
+        stdout, stderr = check_stdout_stderr(message_list)
 
     if not message_list:
         return 'can\'t leave message blank, please enter a command'
     elif stdout or stderr:
         return stdout.replace('cli.py', '/dzbot') if stdout else stderr.replace('cli.py', '/dzbot')
 
+    try:
+        with tracing.span('run_command', action=message_list[0]):
+            return _dispatch(inbound_request, message_list)
+    except deadline.DeadlineExceeded:
+        return 'DZbot ran out of time ({}s budget) before the command finished, please retry'.format(deadline.budget())
+    except requests.Timeout as e:
+        return 'DZbot gave up waiting on an upstream call before the command finished, please retry ({})'.format(e)
+    except CircuitOpen as e:
+        return 'DZbot can\'t finish this command right now: {}'.format(e)
+
+
+def _dispatch(inbound_request, message_list):
     action = message_list[0]
-    args = parse_args(message_list)
+    with tracing.span('parse_args'):
+        args = parse_args(message_list)
     if action == 'override':
         return pd_override(args)
     elif action == 'list' and args.name:
@@ -37,6 +148,12 @@ def create_outbound_msg(inbound_request):
         return pd_list_all_entities(args)
     elif action == 'ensure-oncalls':
         return pd_ensure_oncalls()
+    elif action == 'oncall-at':
+        return pd_oncall_at(args)
+    elif action == 'coverage':
+        return pd_coverage(args)
+    elif action == 'roster':
+        return pd_roster()
     elif action == 'notify':
         sender_name = inbound_request['message']['from']['name']
         return pd_send_incident(sender_name, args)
@@ -76,10 +193,29 @@ def pd_list_entity(args):
     :return: info on specified entity
     """
     entity_type = 'escalation_policies' if args.entity == 'eps' else args.entity
+    if entity_type == 'escalation_policies':
+        roster_resp = roster.get_ep_levels(' '.join(args.name))
+        tracing.annotate(roster='hit' if roster_resp else 'miss')
+        if roster_resp:
+            return '{0}\n({1})'.format(ordered_dict_to_string(roster_resp.entity), roster_resp.status.content)
+
     vo_resp = list_specific_entity(entity_type, ' '.join(args.name))
     return format_return(vo_resp.entity) if vo_resp.status.success else format_return(vo_resp.status.content)
 
 
+def pd_roster():
+    """
+    List every escalation policy's oncall users & their contact info by escalation level from the materialized roster
+
+    :return: the roster and the time it was built
+    """
+    vo_resp = roster.get_roster()
+    if not vo_resp.status.success:
+        return format_return(vo_resp.status.content)
+
+    return '{0}\n({1})'.format(vo_resp.entity, vo_resp.status.content)
+
+
 def pd_ensure_oncalls():
     """
     Ensure there is a primary and secondary oncall for each escalation policy
@@ -90,6 +226,42 @@ def pd_ensure_oncalls():
     return format_return(vo_resp.entities) if vo_resp.status.success else format_return(vo_resp.status.content)
 
 
+def pd_oncall_at(args):
+    """
+    List who is oncall for an escalation policy or schedule at a point in time or during a time range, answered from
+    the local oncall index
+
+    :param args: arguments from /dzbot hipchat input
+    :return: the oncall users by escalation level and their oncall times
+    """
+    entity_type, name = ('escalation_policies', args.ep) if args.ep else ('schedules', args.schedule)
+    try:
+        at = parse_pd_time(args.at)
+        until = parse_pd_time(args.until) if args.until else None
+    except ValueError as e:
+        return str(e)
+
+    vo_resp = who_is_oncall(entity_type, ' '.join(name), at, until)
+    if not vo_resp.status.success:
+        return format_return(vo_resp.status.content)
+
+    return '{0}\n({1})'.format(vo_resp.entity, vo_resp.status.content)
+
+
+def pd_coverage(args):
+    """
+    Forecast when each escalation policy's oncall level 1 or 2 will be uncovered, or covered by the same user
+
+    :param args: arguments from /dzbot hipchat input
+    :return: every forecast coverage issue and its time range
+    """
+    vo_resp = forecast_coverage(args.hours, ' '.join(args.ep) if args.ep else None)
+    if not vo_resp.status.success:
+        return format_return(vo_resp.status.content)
+
+    return '{0}\n({1})'.format(coverage_to_string(vo_resp.entities) or 'no coverage issues', vo_resp.status.content)
+
+
 def pd_send_incident(sender_name, args):
     """
     Send a pager duty incident to a pd user or escalation policy
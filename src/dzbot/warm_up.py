@@ -0,0 +1,72 @@
+import time
+
+import requests
+
+from src.dzbot.cli import check_stdout_stderr, parse_args
+from src.hipchat import hipchat
+from src.outbound.http import open_connection
+from src.pager_duty import directory, pd
+from src.value_objects.entity_resp import EntityResp
+from src.value_objects.status import Status
+
+
+def warm_up():
+    """
+    warm up this container so that the next /dzbot command runs at warm path latency: build the cli parser, spawn the
+    cli child process once, open pooled connections to pager duty and hipchat, and load the pager duty directory,
+    hipchat room directory and capability descriptor into memory. The directories are only reloaded once they are
+    stale, and a step that fails (i.e. times out or finds its upstream's circuit open) is reported in the errors
+    without stopping the others
+
+    :return: an EntityResp containing a Status and a dictionary of how many seconds each step took
+    """
+    steps = [
+        ('cli parser', lambda: parse_args(['ensure-oncalls'])),
+        ('cli child process', lambda: check_stdout_stderr(['--help'])),
+        ('pager duty connection', lambda: open_connection(pd.api_host)),
+        ('hipchat connection', lambda: open_connection(hipchat.api_host)),
+        ('capability descriptor', hipchat.load_capabilities_descriptor),
+        ('hipchat room directory', _unless_fresh(hipchat.room_directory_is_fresh, hipchat.load_room_directory)),
+        ('pager duty directory', _unless_fresh(_pd_directory_is_fresh, pd.load_directory)),
+    ]
+
+    timings = {}
+    errors = []
+    start = time.perf_counter()
+    for step_name, step in steps:
+        step_start = time.perf_counter()
+        try:
+            result = step()
+        except requests.RequestException as e:
+            result = Status(False, str(e))
+        timings[step_name] = round(time.perf_counter() - step_start, 3)
+
+        if isinstance(result, Status) and not result.success:
+            errors.append('{}: {}'.format(step_name, result.content))
+        elif result is False:
+            errors.append('{}: could not connect'.format(step_name))
+    timings['total'] = round(time.perf_counter() - start, 3)
+
+    if errors:
+        return EntityResp(Status(False, 'warm up finished with errors: {}'.format('; '.join(errors))), timings)
+
+    return EntityResp(Status(True, 'warmed up in {}s'.format(timings['total'])), timings)
+
+
+def _unless_fresh(is_fresh, load):
+    """
+    :param is_fresh: function returning True if what load() loads is still fresh
+    :param load: function loading it, returning a Status
+    :return: a step running load() only if is_fresh() is False
+    """
+    def step():
+        if is_fresh():
+            return Status(True, 'already fresh')
+
+        return load()
+
+    return step
+
+
+def _pd_directory_is_fresh():
+    return all(directory.is_fresh(entity_type) for entity_type in pd.DIRECTORY_ENTITY_TYPES)
@@ -1,8 +1,13 @@
+import copy
 import os
 import json
+import threading
+import time
 
-import requests
-
+from src.outbound import async_http, tracing
+from src.outbound.http import send
+from src.outbound.memory_cache import MemoryCache
+from src.outbound.single_flight import SingleFlight
 from src.value_objects.entities_resp import EntitiesResp
 from src.value_objects.entity_resp import EntityResp
 from src.value_objects.status import Status
@@ -19,6 +24,29 @@ headers = {
     'content-type': 'application/json',
 }
 
+ROOM_DIRECTORY_TTL_SECONDS = 15 * 60
+
+_capabilities_template = {}
+
+_rooms_lock = threading.Lock()
+# (loaded at, {lowercase room name: room id}), counted against the cache memory budget and reloaded if evicted
+_room_directory = MemoryCache('hipchat room directory')
+_room_webhooks = MemoryCache('hipchat room webhooks')
+_room_loads = SingleFlight()
+
+
+def load_capabilities_descriptor():
+    """
+    read the capabilities descriptor template from disk once and keep it in memory
+
+    :return: the capabilities descriptor template (must not be modified)
+    """
+    if not _capabilities_template:
+        with open('src/hipchat/capability_descriptor.json') as cd:
+            _capabilities_template.update(json.loads(cd.read()))
+
+    return _capabilities_template
+
 
 def get_capabilities_descriptor(webhook_url):
     """
@@ -27,9 +55,8 @@ def get_capabilities_descriptor(webhook_url):
 
     :return: the capabilities descriptor
     """
-    with open('src/hipchat/capability_descriptor.json') as cd:
-        capabilities_json = json.loads(cd.read())
-        capabilities_json['capabilities']['webhook'][0]['url'] = webhook_url
+    capabilities_json = copy.deepcopy(load_capabilities_descriptor())
+    capabilities_json['capabilities']['webhook'][0]['url'] = webhook_url
 
     if capabilities_json:
         return EntityResp(Status(True, 'capability descriptor read successfully'), json.dumps(capabilities_json))
@@ -37,9 +64,33 @@ def get_capabilities_descriptor(webhook_url):
     return EntityResp(Status(False, 'could not read capability descriptor'))
 
 
+@tracing.traced('send_room_notification', 'room_id_or_name', 'color')
 def send_room_notification(room_id_or_name, message, color, message_format='text'):
     """
-    sends room notification
+    sends room notification. Replies to a webhook should pass the room id of the webhook, a room name is sent to hipchat
+    as is (without looking it up in the room directory, which is only used by the room management calls)
+
+    :param room_id_or_name: id or name of hipchat room
+    :param message: message you want to send
+    :param color: background color of the message
+    :param message_format: can be 'html' or 'text', default is 'text' here
+    :return: response from the http post request
+    """
+    send_notification_url = api_host + '/room/{}/notification'.format(room_id_or_name)
+    body = {
+        'message': message,
+        "color": color,
+        "message_format": message_format
+    }
+
+    response = send('post', url=send_notification_url, headers=headers, json=body)
+
+    return _response_helper(response)
+
+
+async def send_room_notification_async(room_id_or_name, message, color, message_format='text'):
+    """
+    the coroutine version of send_room_notification() for the asyncio server
 
     :param room_id_or_name: id or name of hipchat room
     :param message: message you want to send
@@ -54,12 +105,12 @@ def send_room_notification(room_id_or_name, message, color, message_format='text
         "message_format": message_format
     }
 
-    response = requests.post(url=send_notification_url, headers=headers, json=body)
+    response = await async_http.send('post', url=send_notification_url, headers=headers, json=body)
 
     return _response_helper(response)
 
 
-def create_web_hook(room_id_or_name, regex_pattern, send_url, event):
+def create_web_hook(room_id_or_name, regex_pattern, send_url, event, name=None):
     """
     create a webhook in hipchat room
 
@@ -68,27 +119,146 @@ def create_web_hook(room_id_or_name, regex_pattern, send_url, event):
     :param send_url: the URL to send the webhook post to
     :param event: the type of event this webhook will listen for
         (i.e. room_message, room_notification, room_enter, etc)
+    :param name: optional name of the webhook, used to recognize the webhooks that DZbot manages
     :return: response from the http post request
     """
-    web_hook_url = api_host + '/room/{0}/webhook'.format(room_id_or_name)
+    room_id = resolve_room_id(room_id_or_name)
+    web_hook_url = api_host + '/room/{0}/webhook'.format(room_id)
     body = {'url': send_url, 'pattern': regex_pattern, 'event': event}
+    if name:
+        body['name'] = name
 
-    response = requests.post(url=web_hook_url, headers=headers, json=body)
+    response = send('post', url=web_hook_url, headers=headers, json=body)
 
-    return _response_helper(response)
+    status = _response_helper(response)
+    if status.success:
+        with _rooms_lock:
+            cached = _room_webhooks.peek(room_id)
+            if cached is not None:
+                _room_webhooks.put(room_id, (cached[0], cached[1] + [dict(body, id=response.json().get('id'))]))
+
+    return status
+
+
+def list_all_rooms(page_size=1000):
+    """
+    get every hipchat room by paging through _get_all_rooms() until hipchat stops returning a 'next' link
+
+    :param page_size: number of rooms to request per page (hipchat allows at most 1000)
+    :return: an EntitiesResp containing a Status and a list of every room. The room directory used by
+    resolve_room_id() is replaced with the rooms
+    """
+    rooms = []
+    start_index = 0
+    while True:
+        page = _get_all_rooms(max_results=page_size, start_index=start_index)
+        if not page.status.success:
+            return EntitiesResp(Status(False, page.status.content))
+
+        items = page.entities.get('items', [])
+        rooms.extend(items)
+        if len(items) < page_size or 'next' not in page.entities.get('links', {}):
+            break
+        start_index += len(items)
+
+    room_ids = {room['name'].lower(): room['id'] for room in rooms if 'name' in room}
+    _room_directory.put('rooms', (time.time(), room_ids), cost=len(rooms) // page_size + 1)
 
+    return EntitiesResp(Status(True, 'successfully retrieved {} rooms'.format(len(rooms))), rooms)
 
-def _get_all_rooms(max_results=1000):
+
+def load_room_directory():
+    """
+    load the name to id mapping of every hipchat room into memory. Concurrent loads share one listing, and a failed
+    load still counts as fresh so that hipchat isn't listed again on every call while it fails
+
+    :return: a Status describing how many rooms were loaded
+    """
+    rooms_resp = _room_loads.do('rooms', list_all_rooms)
+    if not rooms_resp.status.success:
+        _room_directory.put('rooms', (time.time(), _room_ids()))
+
+    return Status(rooms_resp.status.success, rooms_resp.status.content)
+
+
+def room_directory_is_fresh(ttl=ROOM_DIRECTORY_TTL_SECONDS):
+    """
+    :param ttl: max age in seconds of the room directory
+    :return: True if the room directory was loaded less than ttl seconds ago
+    """
+    loaded_at, _ = _room_directory.peek('rooms', (None, None))
+    return loaded_at is not None and time.time() - loaded_at < ttl
+
+
+def _room_ids():
+    return _room_directory.get('rooms', (None, {}))[1]
+
+
+def resolve_room_id(room_id_or_name):
+    """
+    resolve a room name to its stable room id from the room directory, so that requests go by id (and keep working
+    after a room is renamed). Room ids don't change, so a stale directory is only reloaded when a name isn't in it
+
+    :param room_id_or_name: id or name of hipchat room
+    :return: the room id, or room_id_or_name if the room isn't in the directory (hipchat then resolves the name)
+    """
+    if isinstance(room_id_or_name, int) or str(room_id_or_name).isdigit():
+        return room_id_or_name
+
+    room_id = _room_ids().get(room_id_or_name.lower())
+    if room_id is None and not room_directory_is_fresh():
+        load_room_directory()
+        room_id = _room_ids().get(room_id_or_name.lower())
+
+    return room_id if room_id is not None else room_id_or_name
+
+
+def get_room_webhooks(room_id_or_name, ttl=ROOM_DIRECTORY_TTL_SECONDS):
+    """
+    get every webhook of a hipchat room, from memory if they were listed less than ttl seconds ago. Webhooks created
+    or deleted through create_web_hook() and _del_room_webhook() are kept up to date in memory
+
+    :param room_id_or_name: id or name of hipchat room
+    :param ttl: max age in seconds of the cached webhooks
+    :return: an EntitiesResp containing a Status and a list of the room's webhooks
     """
-    get all hipchat rooms
+    room_id = resolve_room_id(room_id_or_name)
+    cached = _room_webhooks.get(room_id)
+    if cached is not None and time.time() - cached[0] < ttl:
+        return EntitiesResp(Status(True, 'successfully retreived entities'), list(cached[1]))
+
+    webhooks_resp = _get_all_room_webhooks(room_id)
+    if not webhooks_resp.status.success:
+        return EntitiesResp(Status(False, webhooks_resp.status.content))
+
+    webhooks = webhooks_resp.entities.get('items', [])
+    _room_webhooks.put(room_id, (time.time(), list(webhooks)))
+
+    return EntitiesResp(webhooks_resp.status, webhooks)
+
+
+def clear_room_directory():
+    """
+    drop the room directory and every cached webhook
+
+    :return: None
+    """
+    _room_directory.clear()
+    _room_webhooks.clear()
+
+
+def _get_all_rooms(max_results=1000, start_index=0):
+    """
+    get a page of hipchat rooms
 
     :param max_results: max number of rooms to return
+    :param start_index: index of the first room to return, used for pagination
     :return: response from the http get request
     """
-    params = {'max-results': max_results}
+    params = {'max-results': max_results, 'start-index': start_index}
     rooms_url = api_host + '/room'
 
-    response = requests.get(url=rooms_url, headers=headers, params=params)
+    response = send('get', url=rooms_url, headers=headers, params=params)
 
     return _get_entities_helper(response)
 
@@ -104,7 +274,7 @@ def _get_all_room_webhooks(rood_id_or_name, max_results=1000):
     params = {'max-results': max_results}
     get_all_webhooks_url = api_host + '/room/{0}/webhook'.format(rood_id_or_name)
 
-    response = requests.get(url=get_all_webhooks_url, headers=headers, params=params)
+    response = send('get', url=get_all_webhooks_url, headers=headers, params=params)
 
     return _get_entities_helper(response)
 
@@ -117,11 +287,20 @@ def _del_room_webhook(room_id_or_name, webhook_id):
     :param webhook_id: id of webhook you want to remove
     :return: response from the http delete request
     """
-    delete_url = api_host + '/room/{0}/webhook/{1}'.format(room_id_or_name, webhook_id)
+    room_id = resolve_room_id(room_id_or_name)
+    delete_url = api_host + '/room/{0}/webhook/{1}'.format(room_id, webhook_id)
 
-    response = requests.delete(url=delete_url, headers=headers)
+    response = send('delete', url=delete_url, headers=headers)
 
-    return _response_helper(response)
+    status = _response_helper(response)
+    if status.success:
+        with _rooms_lock:
+            cached = _room_webhooks.peek(room_id)
+            if cached is not None:
+                _room_webhooks.put(room_id, (cached[0], [webhook for webhook in cached[1]
+                                                         if webhook.get('id') != webhook_id]))
+
+    return status
 
 
 def _response_helper(response):
@@ -0,0 +1,149 @@
+import argparse
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pprint import pformat
+
+import requests
+
+from src.hipchat.hipchat import get_capabilities_descriptor, list_all_rooms, get_room_webhooks, \
+    create_web_hook, _del_room_webhook
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+
+def get_desired_webhook(send_url):
+    """
+    build the webhook that DZbot should have in every room from the capability descriptor
+
+    :param send_url: the URL that the webhook should post to (the deployed DZbot url)
+    :return: a dictionary containing the desired webhook's url, pattern, event and name
+    """
+    cd = get_capabilities_descriptor(send_url)
+    webhook = json.loads(cd.entity)['capabilities']['webhook'][0]
+
+    return {'url': webhook['url'], 'pattern': webhook['pattern'], 'event': webhook['event'], 'name': webhook['name']}
+
+
+def plan_room_webhooks(webhooks, desired):
+    """
+    compare a room's existing webhooks with the desired DZbot webhook
+
+    A webhook is considered to be managed by DZbot if it has the same name or pattern as the desired webhook. The
+    first managed webhook that exactly matches the desired one is kept, every other managed webhook is deleted, and the
+    desired webhook is created if no exact match exists. Webhooks that aren't managed by DZbot are left alone
+
+    :param webhooks: list of the room's existing webhooks
+    :param desired: the desired webhook from get_desired_webhook()
+    :return: a list of ('create', desired webhook) and ('delete', webhook id) actions
+    """
+    actions = []
+    keep_found = False
+    for webhook in webhooks:
+        if webhook.get('name') != desired['name'] and webhook.get('pattern') != desired['pattern']:
+            continue
+
+        is_match = all(webhook.get(field) == desired[field] for field in ('url', 'pattern', 'event'))
+        if is_match and not keep_found:
+            keep_found = True
+        else:
+            actions.append(('delete', webhook['id']))
+
+    if not keep_found:
+        actions.append(('create', desired))
+
+    return actions
+
+
+def reconcile_room(room, desired, dry_run=False):
+    """
+    reconcile a single room's webhooks with the desired DZbot webhook
+
+    :param room: the room dictionary returned by hipchat (must contain an 'id' and 'name')
+    :param desired: the desired webhook from get_desired_webhook()
+    :param dry_run: if True, only report the actions that would have been taken
+    :return: a dictionary describing the room, the planned actions and any errors
+    """
+    result = {'room': room['name'], 'actions': [], 'errors': []}
+    try:
+        _reconcile_room(room, desired, dry_run, result)
+    except requests.RequestException as e:
+        # i.e. a timeout or an open circuit after hipchat rate limited us, which must not abort the other rooms
+        result['errors'].append('could not reach hipchat: {}'.format(e))
+
+    return result
+
+
+def _reconcile_room(room, desired, dry_run, result):
+    webhooks_resp = get_room_webhooks(room['id'])
+    if not webhooks_resp.status.success:
+        result['errors'].append(webhooks_resp.status.content)
+        return
+
+    for action, target in plan_room_webhooks(webhooks_resp.entities, desired):
+        if action == 'create':
+            result['actions'].append('create webhook {}'.format(target['name']))
+            status = None if dry_run else \
+                create_web_hook(room['id'], target['pattern'], target['url'], target['event'], target['name'])
+        else:
+            result['actions'].append('delete webhook {}'.format(target))
+            status = None if dry_run else _del_room_webhook(room['id'], target)
+
+        if status is not None and not status.success:
+            result['errors'].append(status.content)
+
+
+def reconcile_all_rooms(send_url, dry_run=False, max_workers=10, room_names=None):
+    """
+    reconcile the DZbot webhook across every hipchat room, running up to max_workers rooms concurrently
+
+    :param send_url: the URL that the webhook should post to (the deployed DZbot url)
+    :param dry_run: if True, only report the actions that would have been taken
+    :param max_workers: max number of rooms that are reconciled at the same time
+    :param room_names: optional collection of room names to restrict the reconciliation to
+    :return: an EntitiesResp containing a Status and a list of per room results for each room that needed changes
+    """
+    rooms_resp = list_all_rooms()
+    if not rooms_resp.status.success:
+        return EntitiesResp(Status(False, rooms_resp.status.content))
+
+    rooms = rooms_resp.entities
+    if room_names:
+        rooms = [room for room in rooms if room['name'] in room_names]
+
+    desired = get_desired_webhook(send_url)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda room: reconcile_room(room, desired, dry_run), rooms))
+
+    changed = [result for result in results if result['actions'] or result['errors']]
+    failed = [result for result in changed if result['errors']]
+    status = Status(not failed, '{0}reconciled {1} rooms, {2} changed, {3} failed'.
+                    format('(dry run) ' if dry_run else '', len(rooms), len(changed), len(failed)))
+
+    return EntitiesResp(status, changed)
+
+
+def main(argv=None):
+    """
+    command line entry point, i.e. python -m src.hipchat.webhook_reconciler --url https://.../production --dry-run
+
+    :param argv: optional list of command line arguments
+    :return: exit code, 0 if every room was reconciled successfully
+    """
+    parser = argparse.ArgumentParser(description='install/repair the DZbot webhook in every hipchat room')
+    parser.add_argument('--url', required=True, help='the deployed DZbot url that the webhook should post to')
+    parser.add_argument('--dry-run', action='store_true', help='only print the actions that would be taken')
+    parser.add_argument('--workers', type=int, default=10, help='max number of rooms reconciled concurrently')
+    parser.add_argument('--room', action='append', help='only reconcile this room (can be repeated)')
+    args = parser.parse_args(argv)
+
+    resp = reconcile_all_rooms(args.url, dry_run=args.dry_run, max_workers=args.workers, room_names=args.room)
+    print(resp.status.content)
+    if resp.entities:
+        print(pformat(resp.entities, width=120))
+
+    return 0 if resp.status.success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
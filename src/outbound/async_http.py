@@ -0,0 +1,111 @@
+import asyncio
+import functools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from src.outbound import cassette, circuit_breaker, context, deadline, http
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+MAX_BLOCKING_CALLS = 20
+POOL_SIZE = 100
+
+_executor = ThreadPoolExecutor(max_workers=MAX_BLOCKING_CALLS)
+_sessions = {}
+
+
+async def send(method, url, **kwargs):
+    """
+    send an outbound http request from a coroutine, the asyncio counterpart of http.send(). The request waits on the
+    event loop instead of holding a thread, goes through the same circuit breakers and listeners, and every request of
+    the loop reuses the pooled connections of one aiohttp session. Coroutines don't carry the request context of
+    threads, so the request times out after timeout seconds (10 by default) rather than a command's deadline
+
+    :param method: http method ('get', 'post', 'put', 'delete')
+    :param url: the url of the request
+    :param kwargs: headers, params, json and timeout, like http.send()
+    :return: a requests Response, so that responses are handled the same way as the ones of http.send()
+    :raises CircuitOpen: without sending the request, while the url's upstream and endpoint family are failing
+    """
+    if cassette.is_replaying() or cassette.is_recording():
+        return await run_blocking(http.send, method, url, **kwargs)
+
+    session = _session()
+    breaker = circuit_breaker.for_url(url)
+    breaker.allow()
+    timeout = kwargs.pop('timeout', deadline.DEFAULT_TIMEOUT_SECONDS)
+    start = time.perf_counter()
+    response = None
+    try:
+        async with session.request(method.upper(), url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                   **kwargs) as client_response:
+            response = _to_response(client_response, await client_response.read())
+        return response
+    except asyncio.TimeoutError as e:
+        raise requests.Timeout('{} {} timed out after {}s'.format(method.upper(), url, timeout)) from e
+    except aiohttp.ClientError as e:
+        raise requests.ConnectionError('{} {} failed: {}'.format(method.upper(), url, e)) from e
+    finally:
+        elapsed = time.perf_counter() - start
+        breaker.record(circuit_breaker.is_healthy(response, elapsed))
+        http.notify_listeners(method, url, elapsed, response)
+
+
+def _session():
+    if aiohttp is None:
+        raise RuntimeError('aiohttp is required to send requests from coroutines')
+
+    loop = asyncio.get_event_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=POOL_SIZE), json_serialize=json.dumps)
+
+    return session
+
+
+async def close_session():
+    """
+    close the aiohttp session of the running event loop, i.e. when the asyncio server shuts down
+
+    :return: None
+    """
+    session = _sessions.pop(asyncio.get_event_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+def _to_response(client_response, content):
+    response = requests.Response()
+    response.status_code = client_response.status
+    response.reason = client_response.reason
+    response.headers = CaseInsensitiveDict(client_response.headers)
+    response.url = str(client_response.url)
+    response.encoding = client_response.charset
+    response._content = content
+
+    return response
+
+
+async def run_blocking(fn, *args, executor=None, **kwargs):
+    """
+    await a blocking function (i.e. a pager duty or hipchat client function, or a whole command) without blocking the
+    event loop. Unless an executor is given, at most MAX_BLOCKING_CALLS run at once and the others wait for a free
+    thread without holding one. The request context (deadline, trace) of the caller follows the call into its thread
+
+    :param fn: the blocking function
+    :param args: the arguments of fn
+    :param executor: optional executor to run fn in, i.e. one sized for the calls that may be in flight at once
+    :param kwargs: the keyword arguments of fn
+    :return: the result of fn
+    """
+    loop = asyncio.get_event_loop()
+
+    return await loop.run_in_executor(executor or _executor, functools.partial(context.wrap(fn), *args, **kwargs))
@@ -0,0 +1,216 @@
+import atexit
+import collections
+import gzip
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+RECORD = 'record'
+REPLAY = 'replay'
+
+_lock = threading.Lock()
+_state = {
+    'mode': None,
+    'path': None,
+    'keep_delays': True,
+    'interactions': {},
+    'file': None,
+}
+
+
+class CassetteMiss(requests.ConnectionError):
+    """
+    raised in replay mode when the cassette has no recorded response for a request
+    """
+
+
+def start(mode, path, keep_delays=True):
+    """
+    start recording outbound requests to a cassette, or replaying them from one
+
+    :param mode: RECORD or REPLAY
+    :param path: path of the gzipped json lines cassette file. A recording session keeps it open and appends to it
+    until stop(), so that the session is a single gzip member
+    :param keep_delays: in replay mode, sleep for each response's recorded latency before returning it
+    :return: the number of interactions loaded from the cassette (always 0 when recording)
+    """
+    if mode not in (RECORD, REPLAY):
+        raise ValueError('cassette mode must be \'{}\' or \'{}\''.format(RECORD, REPLAY))
+
+    stop()
+    interactions = load(path) if mode == REPLAY else {}
+    cassette_file = None
+    if mode == RECORD:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        cassette_file = gzip.open(path, 'at', encoding='utf-8')
+    with _lock:
+        _state.update({'mode': mode, 'path': path, 'keep_delays': keep_delays, 'interactions': interactions,
+                       'file': cassette_file})
+
+    return sum(len(recorded) for recorded in interactions.values())
+
+
+def start_from_env():
+    """
+    start the cassette mode configured by the DZBOT_CASSETTE_MODE ('record' or 'replay'), DZBOT_CASSETTE_PATH and
+    DZBOT_CASSETTE_DELAYS ('keep' or 'strip') env vars, if any
+
+    :return: the configured mode, or None if no cassette mode is configured
+    """
+    mode = os.environ.get('DZBOT_CASSETTE_MODE')
+    if not mode:
+        return None
+
+    path = os.environ.get('DZBOT_CASSETTE_PATH', 'cassettes/dzbot.jsonl.gz')
+    start(mode, path, keep_delays=os.environ.get('DZBOT_CASSETTE_DELAYS', 'keep') != 'strip')
+
+    return mode
+
+
+def stop():
+    """
+    stop recording or replaying, closing the cassette file of a recording session
+
+    :return: None
+    """
+    with _lock:
+        if _state['file'] is not None:
+            _state['file'].close()
+        _state.update({'mode': None, 'path': None, 'interactions': {}, 'file': None})
+
+
+atexit.register(stop)
+
+
+def is_replaying():
+    return _state['mode'] == REPLAY
+
+
+def is_recording():
+    return _state['mode'] == RECORD
+
+
+def request_key(method, url, params=None, body=None):
+    """
+    the key that identifies identical requests. Headers (and so credentials) are never part of the key
+
+    :param method: http method
+    :param url: the url of the request
+    :param params: query parameters of the request
+    :param body: json body of the request
+    :return: a string key
+    """
+    return json.dumps([method.lower(), url, params or {}, body], sort_keys=True, default=str)
+
+
+def save(method, url, kwargs, response, latency):
+    """
+    append a request/response pair to the cassette. The body of a streamed response (stream=True) isn't read here:
+    the pair is appended once the caller has read the body, with the part of it that the caller read
+
+    :param method: http method
+    :param url: the url of the request
+    :param kwargs: the keyword arguments the request was sent with
+    :param response: the requests Response
+    :param latency: seconds the request took (until its headers arrived for a streamed response)
+    :return: the saved interaction, or None for a streamed response
+    """
+    interaction = {
+        'key': request_key(method, url, kwargs.get('params'), kwargs.get('json')),
+        'status_code': response.status_code,
+        'content_type': response.headers.get('content-type'),
+        'content': None,
+        'latency': round(latency, 4),
+    }
+    if kwargs.get('stream'):
+        _record_stream(response, interaction)
+        return None
+
+    interaction['content'] = response.content.decode('utf-8', errors='replace')
+    _write(interaction)
+
+    return interaction
+
+
+def _record_stream(response, interaction):
+    iter_content = response.iter_content
+
+    def recording_iter_content(*args, **kwargs):
+        chunks = []
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                chunks.append(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+                yield chunk
+        finally:
+            _write(dict(interaction, content=b''.join(chunks).decode('utf-8', errors='replace')))
+
+    # response.content, .text and .json() read the body through iter_content() as well
+    response.iter_content = recording_iter_content
+
+
+def _write(interaction):
+    with _lock:
+        if _state['file'] is None:
+            return
+        _state['file'].write(json.dumps(interaction) + '\n')
+        _state['file'].flush()
+
+
+def load(path):
+    """
+    load a cassette file
+
+    :param path: path of the gzipped json lines cassette file
+    :return: a dictionary of request key to a deque of the interactions recorded for it, in recorded order. The last
+    session of a cassette whose recording process was killed before stop() is loaded up to its last flushed line
+    """
+    interactions = collections.defaultdict(collections.deque)
+    with gzip.open(path, 'rt', encoding='utf-8') as cassette_file:
+        try:
+            for line in cassette_file:
+                if line.strip() and line.endswith('\n'):
+                    interaction = json.loads(line)
+                    interactions[interaction['key']].append(interaction)
+        except EOFError:
+            pass
+
+    return interactions
+
+
+def play(method, url, kwargs):
+    """
+    serve a recorded response. Requests that were recorded more than once are answered with each recorded response in
+    turn, starting over once they run out, so a cassette can be replayed any number of times
+
+    :param method: http method
+    :param url: the url of the request
+    :param kwargs: the keyword arguments the request was sent with
+    :return: a requests Response built from the recorded interaction
+    """
+    key = request_key(method, url, kwargs.get('params'), kwargs.get('json'))
+    with _lock:
+        recorded = _state['interactions'].get(key)
+        if not recorded:
+            raise CassetteMiss('no recorded response for {} {}'.format(method.upper(), url))
+        interaction = recorded[0]
+        recorded.rotate(-1)
+        keep_delays = _state['keep_delays']
+
+    if keep_delays:
+        time.sleep(interaction['latency'])
+
+    response = requests.Response()
+    response.status_code = interaction['status_code']
+    response._content = interaction['content'].encode('utf-8')
+    response._content_consumed = True
+    response.headers = CaseInsensitiveDict({'content-type': interaction['content_type'] or 'application/json'})
+    response.encoding = 'utf-8'
+    response.url = url
+
+    return response
@@ -0,0 +1,152 @@
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half open'
+
+FAILURE_THRESHOLD = int(os.environ.get('DZBOT_BREAKER_FAILURES', 5))
+RESET_SECONDS = float(os.environ.get('DZBOT_BREAKER_RESET_SECONDS', 30))
+SLOW_CALL_SECONDS = float(os.environ.get('DZBOT_BREAKER_SLOW_SECONDS', 5))
+FAILURE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_VERSION_SEGMENT = re.compile(r'^v\d+$')
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+class CircuitOpen(requests.ConnectionError):
+    """
+    raised instead of sending a request while the circuit breaker of its upstream and endpoint family is open
+    """
+    def __init__(self, upstream, family, retry_after):
+        super().__init__('{} is unavailable ({} calls are failing), retry in {}s'.format(upstream, family, retry_after))
+        self.upstream = upstream
+        self.family = family
+        self.retry_after = retry_after
+
+
+class CircuitBreaker():
+    """
+    stops calling an upstream endpoint family after failure_threshold failed or slow calls in a row. While open, calls
+    fail fast with CircuitOpen. After reset_seconds a single half open probe is let through: if it succeeds the breaker
+    closes, otherwise it stays open for another reset_seconds
+    """
+    def __init__(self, upstream, family, failure_threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS):
+        self.upstream = upstream
+        self.family = family
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        raise CircuitOpen unless a call may be made now. Once the reset time has passed, the first caller becomes the
+        half open probe, and every other caller keeps failing fast until the probe is recorded
+
+        :return: None
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return
+
+            retry_after = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == OPEN and retry_after <= 0:
+                self.state = HALF_OPEN
+                return
+
+            raise CircuitOpen(self.upstream, self.family, max(int(retry_after + 1), 1))
+
+    def record(self, healthy):
+        """
+        record the outcome of an allowed call
+
+        :param healthy: False if the call failed or was too slow
+        :return: the state of the breaker after the call
+        """
+        with self._lock:
+            if healthy:
+                self.state = CLOSED
+                self.failures = 0
+            else:
+                self.failures += 1
+                if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                    self.state = OPEN
+                    self.opened_at = time.monotonic()
+
+            return self.state
+
+    def release(self):
+        """
+        give back an allowed call whose outcome says nothing about the upstream (i.e. it timed out because the caller's
+        own deadline was running out). A half open probe is handed back so that the next caller probes instead
+
+        :return: the state of the breaker
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.state = OPEN
+
+            return self.state
+
+
+def endpoint_family(url):
+    """
+    :param url: url of a request, i.e. https://api.pagerduty.com/users/PXXXX/contact_methods
+    :return: a tuple of (host, path after any api version with every id replaced by '*'), i.e. ('api.pagerduty.com',
+    'users/*/contact_methods'). Ids are every other path segment, so each endpoint of a resource is its own family
+    (i.e. HipChat's 'room/*/notification' and 'room/*/webhook')
+    """
+    parts = urlsplit(url)
+    segments = [segment for segment in parts.path.split('/') if segment and not _VERSION_SEGMENT.match(segment)]
+
+    return parts.netloc, '/'.join('*' if i % 2 else segment for i, segment in enumerate(segments))
+
+
+def for_url(url):
+    """
+    :param url: url of a request
+    :return: the CircuitBreaker shared by every request to the url's upstream and endpoint family
+    """
+    key = endpoint_family(url)
+    with _lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(*key)
+
+        return _breakers[key]
+
+
+def is_healthy(response, elapsed):
+    """
+    :param response: the requests Response, or None if the request raised an exception
+    :param elapsed: seconds the request took
+    :return: False if the call should count as a failure of its upstream
+    """
+    return response is not None and response.status_code not in FAILURE_STATUS_CODES and elapsed < SLOW_CALL_SECONDS
+
+
+def states():
+    """
+    :return: a dictionary of 'host/family' to the state of its breaker
+    """
+    with _lock:
+        return {'{}/{}'.format(*key): breaker.state for key, breaker in _breakers.items()}
+
+
+def reset():
+    """
+    forget every breaker, closing all circuits
+
+    :return: None
+    """
+    with _lock:
+        _breakers.clear()
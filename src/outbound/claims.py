@@ -0,0 +1,93 @@
+import json
+import os
+import time
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# dynamodb table (partition key 'key' of type string, ttl attribute 'expires_at') shared by every container, used to
+# deduplicate webhook deliveries and incidents across lambda containers. Without it each container deduplicates alone
+TABLE_NAME = os.environ.get('DZBOT_DEDUP_TABLE')
+
+
+class ClaimTable():
+    """
+    claims keys in a dynamodb table with conditional writes, so that exactly one container (or thread) wins each key
+    until its window expires, and every other claim of the key sees the winner's value and how many claims lost
+    """
+    def __init__(self, table_name=TABLE_NAME, client=None):
+        if client is None and boto3 is None:
+            raise RuntimeError('boto3 is required to use the dynamodb table {}'.format(table_name))
+
+        self.table_name = table_name
+        self._client = client if client is not None else boto3.client('dynamodb')
+
+    def claim(self, key, window_seconds, value):
+        """
+        :param key: the key to claim
+        :param window_seconds: how long the claim lasts
+        :param value: json serializable value stored with the claim
+        :return: a tuple of (True if the key was claimed, else a dictionary of the winning claim's 'value', its 'age'
+        in seconds and the number of 'duplicates' claims that lost, including this one)
+        """
+        while True:
+            now = time.time()
+            try:
+                self._client.put_item(
+                    TableName=self.table_name,
+                    Item={'key': {'S': key}, 'value': {'S': json.dumps(value)}, 'claimed_at': {'N': repr(now)},
+                          'expires_at': {'N': str(int(now + window_seconds))}, 'duplicates': {'N': '0'}},
+                    ConditionExpression='attribute_not_exists(#key) OR attribute_not_exists(expires_at) OR '
+                                        'expires_at <= :now',
+                    ExpressionAttributeNames={'#key': 'key'},
+                    ExpressionAttributeValues={':now': {'N': str(int(now))}})
+                return True, None
+            except self._client.exceptions.ConditionalCheckFailedException:
+                pass
+
+            # the winning claim may be released or expire before the update, in which case the update must not
+            # create an item without a value (which no claim could ever win again), and the key is claimed again
+            try:
+                item = self._client.update_item(
+                    TableName=self.table_name, Key={'key': {'S': key}}, UpdateExpression='ADD duplicates :one',
+                    ConditionExpression='attribute_exists(#key) AND expires_at > :now',
+                    ExpressionAttributeNames={'#key': 'key'},
+                    ExpressionAttributeValues={':one': {'N': '1'}, ':now': {'N': str(int(now))}},
+                    ReturnValues='ALL_NEW')['Attributes']
+            except self._client.exceptions.ConditionalCheckFailedException:
+                continue
+
+            return False, {'value': json.loads(item['value']['S']), 'age': now - float(item['claimed_at']['N']),
+                           'duplicates': int(item['duplicates']['N'])}
+
+    def set_value(self, key, value):
+        """
+        replace the value stored with a claim
+
+        :param key: the claimed key
+        :param value: json serializable value
+        :return: False if the claim was released or expired in the meantime (and nothing is stored), else True
+        """
+        try:
+            self._client.update_item(
+                TableName=self.table_name, Key={'key': {'S': key}}, UpdateExpression='SET #value = :value',
+                ConditionExpression='attribute_exists(#key)',
+                ExpressionAttributeNames={'#key': 'key', '#value': 'value'},
+                ExpressionAttributeValues={':value': {'S': json.dumps(value)}})
+        except self._client.exceptions.ConditionalCheckFailedException:
+            return False
+
+        return True
+
+    def release(self, key):
+        """
+        drop a claim, so that the next claim of the key wins
+
+        :param key: the claimed key
+        :return: True if the key was claimed
+        """
+        response = self._client.delete_item(TableName=self.table_name, Key={'key': {'S': key}}, ReturnValues='ALL_OLD')
+
+        return 'Attributes' in response
@@ -0,0 +1,53 @@
+import contextlib
+import threading
+
+_local = threading.local()
+
+
+def _values():
+    if not hasattr(_local, 'values'):
+        _local.values = {}
+
+    return _local.values
+
+
+def get(name, default=None):
+    """
+    get a value of the current request context (i.e. the command's deadline)
+
+    :param name: name of the value
+    :param default: returned if the value isn't set
+    :return: the value
+    """
+    return _values().get(name, default)
+
+
+@contextlib.contextmanager
+def scope(**values):
+    """
+    set values of the current request context for the duration of a with block, restoring the previous values after
+
+    :param values: the values to set
+    """
+    previous = dict(_values())
+    _values().update(values)
+    try:
+        yield
+    finally:
+        _local.values = previous
+
+
+def wrap(fn):
+    """
+    capture the current request context so that it follows fn into another thread (i.e. executor.submit(wrap(fn)))
+
+    :param fn: the function that will run in another thread
+    :return: a function that runs fn with the captured request context
+    """
+    captured = dict(_values())
+
+    def run_with_context(*args, **kwargs):
+        with scope(**captured):
+            return fn(*args, **kwargs)
+
+    return run_with_context
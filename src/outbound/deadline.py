@@ -0,0 +1,68 @@
+import os
+import time
+
+import requests
+
+from src.outbound import context
+
+DEFAULT_TIMEOUT_SECONDS = 10
+COMMAND_BUDGET_SECONDS = float(os.environ.get('DZBOT_COMMAND_BUDGET_SECONDS', 25))
+
+
+class DeadlineExceeded(requests.Timeout):
+    """
+    raised when the current command's deadline has passed, so that no more outbound calls are made for it
+    """
+
+
+def start(seconds=COMMAND_BUDGET_SECONDS):
+    """
+    give every outbound call made inside the with block (and in threads started with context.wrap()) a shared deadline
+
+    :param seconds: the time budget of the block
+    :return: a context manager
+    """
+    return context.scope(deadline=time.monotonic() + seconds, budget=seconds)
+
+
+def remaining():
+    """
+    :return: the seconds left before the current deadline, or None if there is no deadline
+    """
+    current_deadline = context.get('deadline')
+    if current_deadline is None:
+        return None
+
+    return current_deadline - time.monotonic()
+
+
+def budget():
+    """
+    :return: the time budget in seconds of the current deadline, or None if there is no deadline
+    """
+    return context.get('budget')
+
+
+def check():
+    """
+    raise DeadlineExceeded if the current deadline has passed
+
+    :return: the seconds left before the current deadline, or None if there is no deadline
+    """
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded('the {}s deadline has passed'.format(budget()))
+
+    return left
+
+
+def timeout(default=DEFAULT_TIMEOUT_SECONDS):
+    """
+    get the timeout of the next outbound call: the remaining time budget, capped at default
+
+    :param default: the timeout used when there is no deadline, or when more time than this is left
+    :return: the timeout in seconds
+    """
+    left = check()
+
+    return default if left is None else min(left, default)
@@ -0,0 +1,143 @@
+import collections
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.outbound import context
+
+logger = logging.getLogger()
+
+HEDGE_PERCENTILE = float(os.environ.get('DZBOT_HEDGE_PERCENTILE', 95))
+HEDGE_BUDGET_RATIO = float(os.environ.get('DZBOT_HEDGE_BUDGET_RATIO', 0.05))
+MIN_SAMPLES = 20
+WINDOW_SIZE = 200
+MAX_BUDGET = 10
+MAX_WORKERS = 20
+
+
+class Hedger():
+    """
+    sends a duplicate of a slow idempotent request once it has been in flight for longer than the given percentile of
+    recent latencies of its endpoint, and returns whichever response arrives first. Each request earns budget_ratio
+    hedges (up to max_budget saved), so hedges add at most budget_ratio extra load
+    """
+    def __init__(self, percentile=HEDGE_PERCENTILE, budget_ratio=HEDGE_BUDGET_RATIO, min_samples=MIN_SAMPLES,
+                 window_size=WINDOW_SIZE, max_budget=MAX_BUDGET, max_workers=MAX_WORKERS):
+        self.percentile = percentile
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.window_size = window_size
+        self.max_budget = max_budget
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._budget = 0.0
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.over_budget = 0
+
+    def threshold(self, endpoint):
+        """
+        :param endpoint: name of the endpoint
+        :return: seconds a request to endpoint may take before it is hedged, or None until enough latencies were seen
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(endpoint, ()))
+
+        if len(latencies) < self.min_samples:
+            return None
+
+        rank = max(int(math.ceil(self.percentile / 100 * len(latencies))), 1)
+        return latencies[rank - 1]
+
+    def record(self, endpoint, latency):
+        with self._lock:
+            latencies = self._latencies.setdefault(endpoint, collections.deque(maxlen=self.window_size))
+            latencies.append(latency)
+
+    def _take_budget(self):
+        with self._lock:
+            if self._budget < 1:
+                self.over_budget += 1
+                return False
+
+            self._budget -= 1
+            self.hedged += 1
+            return True
+
+    def _can_hedge(self):
+        with self._lock:
+            return self._budget >= 1
+
+    def _timed(self, endpoint, fn, started=None, start_times=None):
+        start = time.perf_counter()
+        if started is not None:
+            start_times.append(start)
+            started.set()
+        result = fn()
+        self.record(endpoint, time.perf_counter() - start)
+        return result
+
+    def call(self, endpoint, fn):
+        """
+        call fn, hedging it with a second call if it is slower than the endpoint's latency threshold. Requests that
+        can't be hedged (too few latencies seen or no budget left) run on the caller's thread, the others run in the
+        pool and are hedged once they have been running, not queued, for longer than the threshold. A request that the
+        pool can't start within the threshold (every worker is busy) runs on the caller's thread without a hedge
+
+        :param endpoint: name of the endpoint, latencies are tracked separately for each endpoint
+        :param fn: an idempotent function without arguments (i.e. a GET request), it may be called twice
+        :return: the result of the first call of fn that finishes without raising
+        """
+        with self._lock:
+            self.requests += 1
+            self._budget = min(self._budget + self.budget_ratio, self.max_budget)
+
+        delay = self.threshold(endpoint)
+        if delay is None or not self._can_hedge():
+            start = time.perf_counter()
+            result = self._timed(endpoint, fn)
+            if delay is not None and time.perf_counter() - start > delay:
+                with self._lock:
+                    self.over_budget += 1
+            return result
+
+        started, start_times = threading.Event(), []
+        primary = self._executor.submit(context.wrap(self._timed), endpoint, fn, started, start_times)
+        if not started.wait(timeout=delay) and primary.cancel():
+            return self._timed(endpoint, fn)
+        started.wait()
+        remaining = max(start_times[0] + delay - time.perf_counter(), 0)
+        if wait([primary], timeout=remaining).done or not self._take_budget():
+            return primary.result()
+
+        logger.debug('hedging {} request after {:.3f}s'.format(endpoint, delay))
+        hedge = self._executor.submit(context.wrap(self._timed), endpoint, fn)
+        done, pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = hedge if hedge in done and (primary not in done or primary.exception()) else primary
+        if first.exception() and pending:
+            first = pending.pop()
+            first.exception()
+
+        if first is hedge and not hedge.exception():
+            with self._lock:
+                self.hedge_wins += 1
+
+        return first.result()
+
+    def stats(self):
+        """
+        :return: a dictionary of the hedging metrics, including the share of requests that were hedged
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'over_budget': self.over_budget,
+                'hedge_rate': round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            }
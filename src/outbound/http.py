@@ -0,0 +1,137 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.outbound import cassette, circuit_breaker, deadline, tracing
+
+POOL_SIZE = 20
+
+session = requests.Session()
+session.mount('https://', HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+session.mount('http://', HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE))
+
+_listeners_lock = threading.Lock()
+_listeners = []
+
+cassette.start_from_env()
+
+
+def send(method, url, **kwargs):
+    """
+    send an outbound http request. Every pager duty and hipchat call goes through here so that cross-cutting concerns
+    (i.e. timing, timeouts, circuit breaking, cassette record/replay) only have to be implemented once, and so that
+    every call reuses the pooled connections of one session
+
+    :param method: http method ('get', 'post', 'put', 'delete')
+    :param url: the url of the request
+    :param kwargs: any other keyword arguments accepted by requests (headers, params, json etc.). Unless a timeout is
+    given, the request times out after the remaining time budget of the current deadline (at most 10 seconds)
+    :return: the requests Response
+    :raises CircuitOpen: without sending the request, while the url's upstream and endpoint family are failing
+    """
+    with tracing.span('http', method=method.upper(), url=url) as http_span:
+        response = _send(method, url, **kwargs)
+        if http_span is not None:
+            http_span.set(status_code=response.status_code)
+        return response
+
+
+def _send(method, url, **kwargs):
+    deadline_bound = False
+    if 'timeout' not in kwargs:
+        kwargs['timeout'] = deadline.timeout()
+        deadline_bound = kwargs['timeout'] < deadline.DEFAULT_TIMEOUT_SECONDS
+    breaker = circuit_breaker.for_url(url)
+    breaker.allow()
+    start = time.perf_counter()
+    response = None
+    timed_out_by_deadline = False
+    try:
+        if cassette.is_replaying():
+            response = cassette.play(method, url, kwargs)
+            return response
+
+        response = getattr(session, method)(url=url, **kwargs)
+        if cassette.is_recording():
+            cassette.save(method, url, kwargs, response, time.perf_counter() - start)
+        return response
+    except requests.Timeout as e:
+        left = deadline.remaining()
+        timed_out_by_deadline = deadline_bound or isinstance(e, deadline.DeadlineExceeded) or \
+            (left is not None and left <= 0)
+        if left is not None and left <= 0 and not isinstance(e, deadline.DeadlineExceeded):
+            raise deadline.DeadlineExceeded('the {}s deadline passed during {} {}'.
+                                            format(deadline.budget(), method.upper(), url)) from e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        # a timeout shortened by the caller's own deadline doesn't mean the upstream is failing
+        if timed_out_by_deadline:
+            breaker.release()
+        else:
+            breaker.record(circuit_breaker.is_healthy(response, elapsed))
+        notify_listeners(method, url, elapsed, response)
+
+
+def open_connection(url):
+    """
+    open (or reuse) a pooled connection to the host of url with a HEAD request, so that the next real request doesn't
+    pay for the dns lookup and tls handshake
+
+    :param url: any url on the host
+    :return: True if the host could be reached, regardless of the response's status code
+    """
+    try:
+        session.head(url, timeout=5)
+    except requests.RequestException:
+        return False
+
+    return True
+
+
+def add_listener(listener):
+    """
+    register a function that is called after every outbound request with (method, url, elapsed seconds, response).
+    The response is None if the request raised an exception
+
+    :param listener: the function to call
+    :return: the listener, so that it can be passed to remove_listener()
+    """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+    return listener
+
+
+def remove_listener(listener):
+    """
+    unregister a function registered with add_listener()
+
+    :param listener: the function to remove
+    :return: True if the listener was registered
+    """
+    with _listeners_lock:
+        if listener not in _listeners:
+            return False
+        _listeners.remove(listener)
+
+    return True
+
+
+def notify_listeners(method, url, elapsed, response):
+    """
+    call every listener registered with add_listener() after an outbound request
+
+    :param method: http method of the request
+    :param url: the url of the request
+    :param elapsed: seconds the request took
+    :param response: the requests Response, or None if the request raised an exception
+    :return: None
+    """
+    with _listeners_lock:
+        listeners = list(_listeners)
+
+    for listener in listeners:
+        listener(method, url, elapsed, response)
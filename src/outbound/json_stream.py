@@ -0,0 +1,124 @@
+import codecs
+import json
+
+WHITESPACE = ' \t\n\r'
+
+
+class _Reader():
+    """
+    a small pull parser over a stream of text chunks. Only the text that hasn't been consumed yet is buffered, so
+    memory is bounded by the largest single value that is decoded (plus one chunk)
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        if self.exhausted:
+            return False
+
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.exhausted = True
+            self.buf += self.text_decoder.decode(b'', final=True)
+            return False
+
+        self.buf += self.text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return None
+
+    def expect(self, chars):
+        char = self.peek()
+        if char is None or char not in chars:
+            raise ValueError('expected one of {!r} at offset {} but found {!r}'.format(chars, self.pos, char))
+
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+
+            # a number at the very end of the buffer may continue in the next chunk
+            if end == len(self.buf) and self.fill():
+                continue
+
+            self.pos = end
+            return value
+
+
+def iter_array_items(chunks, array_key):
+    """
+    incrementally decode a json object like {"users": [{...}, {...}], "limit": 100} and yield each element of the
+    array under array_key one at a time, without ever building the whole document
+
+    :param chunks: iterable of bytes or str chunks, i.e. response.iter_content(chunk_size=8192)
+    :param array_key: the top level key of the array to yield the elements of
+    :return: a generator of the decoded array elements
+    """
+    reader = _Reader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key == array_key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                return
+            while True:
+                yield reader.value()
+                if reader.expect(',]') == ']':
+                    return
+
+        reader.value()
+        if reader.expect(',}') == '}':
+            return
+
+
+def pick(entity, fields):
+    """
+    keep only the requested fields of an entity
+
+    :param entity: the decoded entity dictionary
+    :param fields: list of field names, nested fields are separated by dots (i.e. ['name', 'user.summary'])
+    :return: a dictionary with the same nesting as entity that only contains the requested fields
+    """
+    result = {}
+    for field in fields:
+        parts = field.split('.')
+        source = entity
+        for part in parts:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+        else:
+            target = result
+            for part in parts[:-1]:
+                target = target.setdefault(part, {})
+            target[parts[-1]] = source
+
+    return result
@@ -0,0 +1,245 @@
+import collections
+import heapq
+import itertools
+import os
+import sys
+import threading
+
+BUDGET_BYTES = int(float(os.environ.get('DZBOT_CACHE_BUDGET_MB', 64)) * 1024 * 1024)
+
+
+def estimate_size(value):
+    """
+    estimate how many bytes a value takes in memory, including everything it refers to: the keys and values of
+    dictionaries, the items of lists, tuples and sets, and the attributes of objects (i.e. an EntitiesResp and its
+    Status). Objects referred to more than once are counted once
+
+    :param value: the value to measure
+    :return: the estimated size in bytes
+    """
+    seen = set()
+    pending = [value]
+    size = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+            pending.extend(obj)
+        elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+            pending.append(vars(obj))
+
+    return size
+
+
+class _Entry():
+    __slots__ = ('value', 'size', 'cost', 'sequence')
+
+    def __init__(self, value, size, cost):
+        self.value = value
+        self.size = size
+        self.cost = cost
+        self.sequence = None
+
+
+class MemoryBudget():
+    """
+    a memory budget shared by several MemoryCaches. Whenever the caches together hold more than limit_bytes, entries are
+    evicted by greedy dual size: an entry's priority is the budget's clock plus the cost of loading it again per byte
+    it takes, a hit raises it back to that, and the clock advances to the priority of each evicted entry. Big entries
+    that are cheap to load again go first, and entries that aren't used age out like in an LRU
+    """
+    def __init__(self, limit_bytes=BUDGET_BYTES):
+        self.limit_bytes = limit_bytes
+        self.used_bytes = 0
+        self.clock = 0.0
+        self.lock = threading.RLock()
+        self.caches = []
+        self._heap = []
+        self._sequence = itertools.count()
+
+    def touch(self, cache, key, entry):
+        """
+        (re)queue an entry for eviction at its current priority, must be called with the lock held
+
+        :param cache: the MemoryCache of the entry
+        :param key: the key of the entry
+        :param entry: the entry
+        :return: None
+        """
+        entry.sequence = next(self._sequence)
+        heapq.heappush(self._heap, (self.clock + entry.cost / max(entry.size, 1), entry.sequence, cache, key))
+
+        if len(self._heap) > 2 * sum(len(cache) for cache in self.caches) + 64:
+            self._heap = [queued for queued in self._heap if self._is_queued(queued)]
+            heapq.heapify(self._heap)
+
+    def evict(self):
+        """
+        evict the entries with the lowest priority until the caches fit in the budget, must be called with the lock held
+
+        :return: the number of entries evicted
+        """
+        evicted = 0
+        while self.used_bytes > self.limit_bytes and self._heap:
+            queued = heapq.heappop(self._heap)
+            if not self._is_queued(queued):
+                continue
+
+            priority, _, cache, key = queued
+            self.clock = priority
+            cache.remove(key)
+            cache.evictions += 1
+            evicted += 1
+
+        return evicted
+
+    def _is_queued(self, queued):
+        _, sequence, cache, key = queued
+        entry = cache.entries.get(key)
+
+        return entry is not None and entry.sequence == sequence
+
+    def stats(self):
+        """
+        :return: dictionary of the budget, the bytes used and the stats of each cache by name
+        """
+        with self.lock:
+            return {
+                'limit_bytes': self.limit_bytes,
+                'used_bytes': self.used_bytes,
+                'caches': {cache.name: cache.stats() for cache in self.caches},
+            }
+
+
+budget = MemoryBudget()
+
+
+class MemoryCache():
+    """
+    a thread safe cache whose entries are sized with estimate_size() and count against a MemoryBudget shared with
+    other caches, so that a container holds as much as fits in its memory rather than a fixed number of entries.
+    Values must not be modified after they are cached, put a new value instead
+    """
+    def __init__(self, name, memory_budget=None):
+        self.name = name
+        self.budget = memory_budget if memory_budget is not None else budget
+        self.entries = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+        with self.budget.lock:
+            self.budget.caches.append(self)
+
+    def get(self, key, default=None):
+        """
+        :param key: the key of the value
+        :param default: returned when the key isn't cached
+        :return: the cached value, counted as a hit, or default, counted as a miss
+        """
+        with self.budget.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.budget.touch(self, key, entry)
+            return entry.value
+
+    def peek(self, key, default=None):
+        """
+        :param key: the key of the value
+        :param default: returned when the key isn't cached
+        :return: the cached value or default, without counting a hit or miss or making the entry recently used
+        """
+        entry = self.entries.get(key)
+
+        return entry.value if entry is not None else default
+
+    def put(self, key, value, cost=1.0, size=None):
+        """
+        cache a value, evicting entries of any cache sharing the budget if they no longer fit
+
+        :param key: the key of the value
+        :param value: the value
+        :param cost: how expensive the value is to load again, i.e. the number of upstream requests
+        :param size: size of the value in bytes, estimated with estimate_size() by default
+        :return: True if the value is cached, False if it is bigger than the whole budget or was evicted right away
+        """
+        entry = _Entry(value, estimate_size(value) if size is None else size, cost)
+        with self.budget.lock:
+            self.remove(key)
+            if entry.size > self.budget.limit_bytes:
+                self.rejections += 1
+                return False
+
+            self.entries[key] = entry
+            self.bytes += entry.size
+            self.budget.used_bytes += entry.size
+            self.budget.touch(self, key, entry)
+            self.budget.evict()
+
+            return key in self.entries
+
+    def remove(self, key):
+        """
+        :param key: the key of the value
+        :return: the value that was cached, or None
+        """
+        with self.budget.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+
+            self.bytes -= entry.size
+            self.budget.used_bytes -= entry.size
+            return entry.value
+
+    def keys(self):
+        """
+        :return: list of the cached keys
+        """
+        with self.budget.lock:
+            return list(self.entries)
+
+    def clear(self):
+        """
+        drop every entry and reset the stats
+
+        :return: None
+        """
+        with self.budget.lock:
+            for key in list(self.entries):
+                self.remove(key)
+            self.hits = self.misses = self.evictions = self.rejections = 0
+
+    def stats(self):
+        """
+        :return: dictionary of the number of entries, their bytes, hits, misses, hit rate, evictions and rejections
+        """
+        with self.budget.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'rejections': self.rejections,
+            }
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
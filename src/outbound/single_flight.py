@@ -0,0 +1,63 @@
+import threading
+
+from src.outbound import deadline
+
+
+class _Call():
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    """
+    deduplicates identical concurrent calls: while a call for a key is in flight, every other caller with the same key
+    waits for it and receives the same result (or exception) instead of making its own call. Results are shared
+    between callers, so they must be treated as read-only. A waiting caller gives up when its own deadline passes, and
+    makes the call itself if the call it waited for ran out of the deadline of the caller that made it
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        call fn(*args, **kwargs) unless a call for the same key is already in flight, in which case wait for it
+
+        :param key: hashable key identifying identical calls
+        :param fn: the function to call
+        :return: the result of fn, shared with every caller that waited on the same key
+        :raises DeadlineExceeded: if the current deadline passes while waiting for the call in flight
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+
+        if not is_leader:
+            remaining = deadline.remaining()
+            if not call.done.wait(timeout=max(remaining, 0) if remaining is not None else None):
+                raise deadline.DeadlineExceeded('the {}s deadline passed while waiting for an identical call'.
+                                                format(deadline.budget()))
+            if isinstance(call.error, deadline.DeadlineExceeded):
+                return self.do(key, fn, *args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
@@ -0,0 +1,164 @@
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+
+from src.outbound import context
+from src.outbound.memory_cache import MemoryCache
+
+logger = logging.getLogger()
+
+MAX_TRACES = 500
+
+_lock = threading.Lock()
+# at most MAX_TRACES, oldest first, and fewer when the cache memory budget needs the room
+_recent = MemoryCache('recent traces')
+
+
+class Span():
+    """
+    a timed step of a traced request, with attributes and child spans (which may be added from other threads)
+    """
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.start = time.perf_counter()
+        self.duration = None
+        self.children = []
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self, trace_start):
+        with _lock:
+            children = list(self.children)
+
+        return {
+            'name': self.name,
+            'start_ms': round((self.start - trace_start) * 1000, 1),
+            'duration_ms': round(self.duration * 1000, 1) if self.duration is not None else None,
+            'attributes': self.attributes,
+            'children': [child.to_dict(trace_start) for child in children],
+        }
+
+
+def current():
+    """
+    :return: the innermost open Span of the current request, or None if the request isn't traced
+    """
+    return context.get('span')
+
+
+@contextlib.contextmanager
+def _open(span):
+    try:
+        with context.scope(span=span):
+            yield span
+    except Exception as e:
+        span.set(error='{}: {}'.format(type(e).__name__, e))
+        raise
+    finally:
+        span.duration = time.perf_counter() - span.start
+
+
+@contextlib.contextmanager
+def trace(request_id, name, **attributes):
+    """
+    trace a request: every span() opened inside the with block (and in threads started with context.wrap()) is
+    recorded in a tree under a root span. When the block exits, the tree is logged as one json record and kept in
+    memory for get_trace(request_id). A trace whose root span is annotated with duplicate=True (i.e. a duplicate
+    webhook delivery) is logged but doesn't replace an earlier trace of the same request_id
+
+    :param request_id: id the trace can be retrieved by
+    :param name: name of the root span
+    :param attributes: attributes of the root span
+    :return: a context manager yielding the root Span
+    """
+    root = Span(name, attributes)
+    try:
+        with _open(root):
+            yield root
+    finally:
+        record = {'request_id': request_id, 'trace': root.to_dict(root.start)}
+        with _lock:
+            if not (root.attributes.get('duplicate') and request_id in _recent):
+                _recent.put(request_id, record)
+            for oldest in _recent.keys()[:-MAX_TRACES]:
+                _recent.remove(oldest)
+        logger.info(json.dumps(record, default=str))
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """
+    time a step of the current traced request as a child of the innermost open span. Does nothing (and yields None)
+    if the request isn't traced
+
+    :param name: name of the span
+    :param attributes: attributes of the span
+    :return: a context manager yielding the Span
+    """
+    with _child_span(name, attributes) as child:
+        yield child
+
+
+@contextlib.contextmanager
+def _child_span(name, attributes):
+    parent = current()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(name, attributes)
+    with _lock:
+        parent.children.append(child)
+    with _open(child):
+        yield child
+
+
+def annotate(**attributes):
+    """
+    set attributes on the innermost open span of the current request (i.e. cache='hit'), if it is traced
+
+    :param attributes: the attributes to set
+    :return: None
+    """
+    parent = current()
+    if parent is not None:
+        parent.set(**attributes)
+
+
+def traced(name, *arg_names):
+    """
+    decorator that records every call of the function as a span of the current traced request
+
+    :param name: name of the span
+    :param arg_names: names of the function's arguments that are recorded as attributes of the span
+    :return: the decorator
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if current() is None:
+                return fn(*args, **kwargs)
+
+            arguments = signature.bind(*args, **kwargs).arguments
+            with _child_span(name, {arg: arguments[arg] for arg in arg_names if arg in arguments}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_trace(request_id):
+    """
+    :param request_id: id of a traced request
+    :return: the trace record of the request, or None if it isn't (or no longer) kept in memory
+    """
+    return _recent.get(request_id)
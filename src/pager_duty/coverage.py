@@ -0,0 +1,156 @@
+import collections
+from datetime import datetime, timedelta, timezone
+
+from src.pager_duty.oncall_index import build_indexes, fetch_oncall_entries, indexed_escalation_policies
+from src.pager_duty.pd import get_all_entities_pages
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+CoverageIssue = collections.namedtuple('CoverageIssue', ['start', 'end', 'problem'])
+
+PRIMARY_SECONDARY = (1, 2)
+FORECAST_HOURS = 24
+MAX_FORECAST_HOURS = 7 * 24
+
+MONITORED_EPS = {
+    'Amp',
+    'Data Engineering',
+    'DataScience',
+    'Ingestion',
+    'Operations',
+    'OpsDirect',
+    'ops-delayed',
+    'Radioedit',
+    'Radioedit-delayed',
+    'Web Escalation',
+    'Test'
+}
+
+
+def find_coverage_issues(entries, since, until, levels=PRIMARY_SECONDARY):
+    """
+    sweep the oncall entries of one escalation policy from since to until, keeping count of who is oncall at each
+    level, and report every interval during which a level has nobody oncall or one user is oncall for more than one of
+    the levels. Adjacent intervals with the same problem are merged
+
+    :param entries: list of OncallEntry of the escalation policy
+    :param since: aware datetime for the start of the window
+    :param until: aware datetime for the end of the window
+    :param levels: the escalation levels that must each have a different oncall user
+    :return: list of CoverageIssue ordered by start time
+    """
+    events = collections.defaultdict(list)
+    for entry in entries:
+        start, end = max(entry.start, since), min(entry.end, until)
+        if start < end and entry.escalation_level in levels:
+            events[start].append((1, entry))
+            events[end].append((-1, entry))
+
+    boundaries = sorted(set(events) | {since, until})
+    oncall = collections.Counter()
+    open_issues = {}
+    issues = []
+    for boundary in boundaries[:-1]:
+        for change, entry in events[boundary]:
+            oncall[(entry.escalation_level, entry.user)] += change
+
+        problems = _coverage_problems(oncall, levels)
+        for problem in [problem for problem in open_issues if problem not in problems]:
+            issues.append(CoverageIssue(open_issues.pop(problem), boundary, problem))
+        for problem in problems:
+            open_issues.setdefault(problem, boundary)
+
+    issues.extend(CoverageIssue(start, until, problem) for problem, start in open_issues.items())
+
+    return sorted(issues)
+
+
+def _coverage_problems(oncall, levels):
+    users_by_level = collections.defaultdict(set)
+    for (level, user), count in oncall.items():
+        if count > 0:
+            users_by_level[level].add(user)
+
+    problems = {'oncall level {} is uncovered'.format(level) for level in levels if not users_by_level[level]}
+    levels_by_user = collections.defaultdict(list)
+    for level in levels:
+        for user in users_by_level[level]:
+            levels_by_user[user].append(level)
+    problems.update('{0} is oncall for both level {1}'.format(user, ' & '.join(str(level) for level in user_levels))
+                    for user, user_levels in levels_by_user.items() if len(user_levels) > 1)
+
+    return problems
+
+
+def forecast_coverage(hours=FORECAST_HOURS, ep_name=None):
+    """
+    forecast the primary & secondary coverage of every escalation policy (or one) from now until hours from now. The
+    rendered oncalls come from the local oncall index when it covers the window, else from one paged /oncalls listing
+    of every escalation policy at once
+
+    :param hours: how many hours ahead of now to check
+    :param ep_name: optional name of the only escalation policy to check
+    :return: an EntitiesResp containing a Status and an OrderedDict of escalation policy name -> list of CoverageIssue,
+    with only the escalation policies that have issues
+    """
+    since = datetime.now(timezone.utc).replace(microsecond=0)
+    until = since + timedelta(hours=hours)
+
+    indexed = indexed_escalation_policies(since, until)
+    if indexed:
+        as_of, ep_indexes = indexed
+    else:
+        oncalls_resp = fetch_oncall_entries(since, until)
+        if not oncalls_resp.status.success:
+            return EntitiesResp(Status(False, oncalls_resp.status.content))
+        as_of, (ep_indexes, _) = since, build_indexes(oncalls_resp.entities, since, until)
+
+    all_eps_resp = get_all_entities_pages('escalation_policies')
+    if not all_eps_resp.status.success:
+        return EntitiesResp(Status(False, all_eps_resp.status.content))
+
+    ep_names = [ep['name'] for ep in all_eps_resp.entities if ep_name is None or ep['name'].lower() == ep_name.lower()]
+    if not ep_names:
+        return EntitiesResp(Status(False, 'could not find escalation policy: \'{}\''.format(ep_name)))
+
+    issues = collections.OrderedDict()
+    for name in sorted(ep_names, key=str.lower):
+        ep_index = ep_indexes.get(name.lower())
+        ep_issues = find_coverage_issues(ep_index.entries if ep_index else [], since, until)
+        if ep_issues:
+            issues[name] = ep_issues
+
+    return EntitiesResp(Status(True, 'forecast from {0} to {1}, oncalls as of {2}'.
+                               format(since.isoformat(), until.isoformat(), as_of.isoformat())), issues)
+
+
+def coverage_to_string(issues):
+    """
+    convert forecast coverage issues into a string, one line per issue
+
+    :param issues: dictionary of escalation policy name -> list of CoverageIssue
+    :return: i.e. 'Operations: oncall level 2 is uncovered (2018-03-01T09:00:00+00:00 - 2018-03-01T17:00:00+00:00)'
+    """
+    return '\n'.join('{0}: {1} ({2} - {3})'.format(ep_name, issue.problem, issue.start.isoformat(),
+                                                   issue.end.isoformat())
+                     for ep_name, ep_issues in issues.items() for issue in ep_issues)
+
+
+def monitor_primary_secondary(hours=FORECAST_HOURS):
+    """
+    monitor whether each monitored team/escalation policy will have a different primary and secondary oncall in pager
+    duty for the next hours, from a single coverage forecast
+
+    :param hours: how many hours ahead of now to check
+    :return: Status object, its content lists the coverage issues of the monitored escalation policies
+    """
+    forecast = forecast_coverage(hours)
+    if not forecast.status.success:
+        return Status(False, forecast.status.content)
+
+    monitored = collections.OrderedDict((name, issues) for name, issues in forecast.entities.items()
+                                        if name in MONITORED_EPS)
+    if not monitored:
+        return Status(True, 'Monitored successfully')
+
+    return Status(True, 'Monitored successfully, coverage issues:\n{}'.format(coverage_to_string(monitored)))
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+from src.outbound.memory_cache import MemoryCache
+from src.pager_duty import snapshot
+
+DIRECTORY_TTL_SECONDS = 15 * 60
+PAGE_SIZE = 100
+SNAPSHOT_PATH = os.environ.get('DZBOT_DIRECTORY_SNAPSHOT')
+
+_lock = threading.Lock()
+_entities = MemoryCache('pager duty directory')
+_snapshot = []
+
+
+def replace(entity_type, entities):
+    """
+    replace every cached entity of a type with a freshly loaded list of entities
+
+    :param entity_type: type of the entities ('users', 'escalation_policies', 'services', 'schedules')
+    :param entities: list of entity dictionaries from pager duty, each with a 'name'
+    :return: the number of entities cached, 0 if they don't fit in the cache memory budget
+    """
+    by_name = {entity['name'].lower(): entity for entity in entities}
+    if not _entities.put(entity_type, (time.time(), by_name), cost=len(by_name) // PAGE_SIZE + 1):
+        return 0
+
+    return len(by_name)
+
+
+def is_fresh(entity_type, ttl=DIRECTORY_TTL_SECONDS):
+    """
+    :param entity_type: type of the entities
+    :param ttl: max age in seconds of the cached entities
+    :return: True if the entity type was loaded less than ttl seconds ago
+    """
+    if SNAPSHOT_PATH:
+        current = current_snapshot()
+        return current is not None and _is_recent(current.loaded_at(entity_type), ttl)
+
+    return _is_recent(_entities.peek(entity_type, (None, None))[0], ttl)
+
+
+def lookup(entity_type, name, ttl=DIRECTORY_TTL_SECONDS):
+    """
+    case insensitive lookup of a cached entity by name
+
+    :param entity_type: type of the entity
+    :param name: name of the entity
+    :param ttl: max age in seconds of the cached entities
+    :return: the entity dictionary, or None if it isn't cached or the cache is stale
+    """
+    if SNAPSHOT_PATH:
+        current = current_snapshot()
+        if current is None or not _is_recent(current.loaded_at(entity_type), ttl):
+            return None
+        return current.lookup(entity_type, name)
+
+    loaded_at, by_name = _entities.get(entity_type, (None, None))
+    if not _is_recent(loaded_at, ttl):
+        return None
+
+    return by_name.get(name.lower())
+
+
+def publish(entities_by_type):
+    """
+    replace the shared directory snapshot that every worker on the host reads (see snapshot.write())
+
+    :param entities_by_type: dictionary of entity type to a list of entity dictionaries, each with a 'name'
+    :return: the number of entities published
+    """
+    count = snapshot.write(SNAPSHOT_PATH, entities_by_type)
+    current_snapshot()
+
+    return count
+
+
+def current_snapshot():
+    """
+    get the shared directory snapshot, mapping it again when a new version has been published since it was last mapped.
+    A replaced version stays mapped until no lookup uses it, so a lookup never sees a partially written snapshot
+
+    :return: the Snapshot, or None if none has been published
+    """
+    version = snapshot.file_version(SNAPSHOT_PATH)
+    with _lock:
+        if _snapshot and _snapshot[0].version == version:
+            return _snapshot[0]
+        if version is None:
+            return None
+
+        try:
+            current = snapshot.Snapshot(SNAPSHOT_PATH)
+        except (FileNotFoundError, ValueError):
+            return _snapshot[0] if _snapshot else None
+
+        _snapshot[:] = [current]
+
+        return current
+
+
+def _is_recent(loaded_at, ttl):
+    return loaded_at is not None and time.time() - loaded_at < ttl
+
+
+def clear():
+    """
+    drop every cached entity
+
+    :return: None
+    """
+    _entities.clear()
+    with _lock:
+        del _snapshot[:]
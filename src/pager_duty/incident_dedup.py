@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+import time
+
+from src.outbound import claims
+
+WINDOW_SECONDS = float(os.environ.get('DZBOT_INCIDENT_DEDUP_SECONDS', 5 * 60))
+# incidents remembered at once within the window, the oldest ones are forgotten first beyond it
+MAX_INCIDENTS = 10000
+
+
+def normalize_title(title):
+    """
+    :param title: incident title, i.e. 'Checkout is DOWN!!'
+    :return: the title in lower case without punctuation or repeated whitespace, i.e. 'checkout is down'
+    """
+    return ' '.join(re.sub(r'[^\w\s]', ' ', title.lower()).split())
+
+
+def incident_key(entity_type, entity_name, service_name, title):
+    """
+    :param entity_type: the type of the notified entity ('users' or 'escalation_policies')
+    :param entity_name: name of the notified user or escalation policy
+    :param service_name: name of the impacted service
+    :param title: title of the incident
+    :return: a key that is the same for every request to open the same incident
+    """
+    return service_name.lower(), entity_type, entity_name.lower(), normalize_title(title)
+
+
+class IncidentDeduplicator():
+    """
+    remembers the incidents sent within the window, so that several people notifying the same target about the same
+    service and title during an outage open one pager duty incident instead of one each. At most max_incidents are
+    remembered, so the oldest ones are forgotten early when there are more within the window
+    """
+    def __init__(self, window_seconds=WINDOW_SECONDS, max_incidents=MAX_INCIDENTS):
+        self.window_seconds = window_seconds
+        self.max_incidents = max_incidents
+        self._lock = threading.Lock()
+        self._incidents = {}
+
+    def begin(self, key, sender_name):
+        """
+        record a request to send an incident
+
+        :param key: the key of the incident, from incident_key()
+        :param sender_name: name of the person sending the incident
+        :return: a tuple of (True if the incident should be sent, else a copy of the record of the incident that is
+        already being or was sent: its 'sender', 'incident' (None while in flight), 'age' in seconds and number of
+        'suppressed' duplicates including this one)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            record = self._incidents.get(key)
+            if record is None:
+                for oldest in list(self._incidents)[:len(self._incidents) - self.max_incidents + 1]:
+                    del self._incidents[oldest]
+                self._incidents[key] = {'sender': sender_name, 'incident': None, 'suppressed': 0, 'sent_at': now}
+                return True, None
+
+            record['suppressed'] += 1
+            return False, dict(record, age=int(now - record['sent_at']))
+
+    def finish(self, key, incident):
+        """
+        record the incident that pager duty opened
+
+        :param key: the key of the incident
+        :param incident: the incident returned by pager duty
+        :return: None
+        """
+        with self._lock:
+            if key in self._incidents:
+                self._incidents[key]['incident'] = _summary(incident)
+
+    def discard(self, key):
+        """
+        forget an incident that couldn't be sent, so that the next request sends it again
+
+        :param key: the key of the incident
+        :return: True if the incident was known
+        """
+        with self._lock:
+            return self._incidents.pop(key, None) is not None
+
+    def _prune(self, now):
+        expired = [key for key, record in self._incidents.items() if now - record['sent_at'] >= self.window_seconds]
+        for key in expired:
+            del self._incidents[key]
+
+
+class SharedIncidentDeduplicator():
+    """
+    an IncidentDeduplicator kept in a ClaimTable shared by every container, so that people notifying the same target
+    at the same time open one incident even when lambda runs their notifies on different containers
+    """
+    def __init__(self, table, window_seconds=WINDOW_SECONDS):
+        self.table = table
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._senders = {}
+
+    def begin(self, key, sender_name):
+        """
+        record a request to send an incident
+
+        :param key: the key of the incident, from incident_key()
+        :param sender_name: name of the person sending the incident
+        :return: a tuple of (True if the incident should be sent, else a copy of the record of the incident that is
+        already being or was sent: its 'sender', 'incident' (None while in flight), 'age' in seconds and number of
+        'suppressed' duplicates including this one)
+        """
+        is_first, claim = self.table.claim(_table_key(key), self.window_seconds,
+                                           {'sender': sender_name, 'incident': None})
+        if is_first:
+            with self._lock:
+                self._senders[key] = sender_name
+                for in_flight in list(self._senders)[:len(self._senders) - MAX_INCIDENTS]:
+                    del self._senders[in_flight]
+            return True, None
+
+        return False, dict(claim['value'], age=int(claim['age']), suppressed=claim['duplicates'])
+
+    def finish(self, key, incident):
+        """
+        record the incident that pager duty opened
+
+        :param key: the key of the incident
+        :param incident: the incident returned by pager duty
+        :return: None
+        """
+        with self._lock:
+            sender_name = self._senders.pop(key, None)
+
+        self.table.set_value(_table_key(key), {'sender': sender_name, 'incident': _summary(incident)})
+
+    def discard(self, key):
+        """
+        forget an incident that couldn't be sent, so that the next request sends it again
+
+        :param key: the key of the incident
+        :return: True if the incident was known
+        """
+        with self._lock:
+            self._senders.pop(key, None)
+
+        return self.table.release(_table_key(key))
+
+
+def _summary(incident):
+    return {field: incident.get(field) for field in ('id', 'incident_number', 'html_url')}
+
+
+def _table_key(key):
+    return 'incident|' + '|'.join(key)
+
+
+recent = SharedIncidentDeduplicator(claims.ClaimTable()) if claims.TABLE_NAME else IncidentDeduplicator()
+
+
+def duplicate_summary(record):
+    """
+    :param record: the record returned by IncidentDeduplicator.begin() for a duplicate request
+    :return: a message reporting the existing incident and how many duplicate requests were suppressed
+    """
+    incident = record['incident']
+    if incident is None:
+        existing = 'is already being sent by {}'.format(record['sender'])
+    else:
+        link = ' {}'.format(incident['html_url']) if incident.get('html_url') else ''
+        existing = 'was already sent by {0} {1}s ago (#{2}{3})'.format(
+            record['sender'], record['age'], incident.get('incident_number', incident.get('id')), link)
+
+    return 'not sending a duplicate incident: the same incident {0}, {1} duplicate request{2} suppressed'.format(
+        existing, record['suppressed'], '' if record['suppressed'] == 1 else 's')
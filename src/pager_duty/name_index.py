@@ -0,0 +1,152 @@
+import collections
+import threading
+
+# names kept per entity type, the oldest names are dropped beyond it
+MAX_NAMES = 20000
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+class TrigramIndex():
+    """
+    an inverted index from character trigrams to names, used to suggest the closest names to a misspelled one without
+    calling pager duty. Names can be added and removed one at a time, so the index is updated incrementally. Once it
+    holds max_names, adding a name drops the name that was added first
+    """
+    def __init__(self, max_names=MAX_NAMES):
+        self.max_names = max_names
+        self.names = {}
+        self.sizes = {}
+        self.postings = collections.defaultdict(set)
+
+    def add(self, name):
+        """
+        :param name: the name to index
+        :return: True if the name wasn't indexed yet
+        """
+        key = name.lower()
+        if key in self.names:
+            return False
+
+        while len(self.names) >= self.max_names:
+            self.remove(next(iter(self.names)))
+
+        self.names[key] = name
+        key_trigrams = trigrams(key)
+        self.sizes[key] = len(key_trigrams)
+        for trigram in key_trigrams:
+            self.postings[trigram].add(key)
+        return True
+
+    def remove(self, name):
+        """
+        :param name: the name to remove from the index
+        :return: True if the name was indexed
+        """
+        key = name.lower()
+        if self.names.pop(key, None) is None:
+            return False
+
+        del self.sizes[key]
+        for trigram in trigrams(key):
+            self.postings[trigram].discard(key)
+            if not self.postings[trigram]:
+                del self.postings[trigram]
+        return True
+
+    def update(self, names):
+        """
+        make the index contain exactly names, only adding and removing the names that changed
+
+        :param names: every name that should be indexed
+        :return: a tuple of (number of names added, number of names removed)
+        """
+        wanted = {name.lower(): name for name in names}
+        removed = [self.names[key] for key in self.names.keys() - wanted.keys()]
+        added = [wanted[key] for key in wanted.keys() - self.names.keys()]
+        for name in removed:
+            self.remove(name)
+        for name in added:
+            self.add(name)
+
+        return len(added), len(removed)
+
+    def suggest(self, query, limit=3, min_similarity=0.3):
+        """
+        rank the indexed names by their trigram (dice) similarity to query
+
+        :param query: the misspelled name
+        :param limit: max number of suggestions
+        :param min_similarity: min similarity between 0 and 1 for a name to be suggested
+        :return: list of the most similar names, most similar first
+        """
+        query_trigrams = trigrams(query.lower())
+        shared = collections.Counter()
+        for trigram in query_trigrams:
+            shared.update(self.postings.get(trigram, ()))
+
+        scored = []
+        for key, count in shared.items():
+            similarity = 2.0 * count / (len(query_trigrams) + self.sizes[key])
+            if similarity >= min_similarity:
+                scored.append((-similarity, key))
+
+        return [self.names[key] for _, key in sorted(scored)[:limit]]
+
+
+def trigrams(text):
+    """
+    :param text: lowercase text
+    :return: the set of character trigrams of text, padded so that short names and word starts still have trigrams
+    """
+    padded = '  {} '.format(' '.join(text.split()))
+
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def add_names(entity_type, names):
+    """
+    add names that were seen in a pager duty response to the index of their entity type
+
+    :param entity_type: type of the entities ('users', 'escalation_policies', 'services', 'schedules')
+    :param names: names of the entities
+    :return: the number of names that weren't indexed yet
+    """
+    with _lock:
+        index = _indexes.setdefault(entity_type, TrigramIndex())
+        return sum(1 for name in names if index.add(name))
+
+
+def update_names(entity_type, names):
+    """
+    incrementally update the index of an entity type to a complete list of names (i.e. after loading the directory)
+
+    :param entity_type: type of the entities
+    :param names: every name of the entity type
+    :return: a tuple of (number of names added, number of names removed)
+    """
+    with _lock:
+        return _indexes.setdefault(entity_type, TrigramIndex()).update(names)
+
+
+def suggest(entity_type, name, limit=3):
+    """
+    :param entity_type: type of the entity
+    :param name: the name that couldn't be found
+    :param limit: max number of suggestions
+    :return: list of the most similar known names of the entity type
+    """
+    with _lock:
+        index = _indexes.get(entity_type)
+        return index.suggest(name, limit) if index else []
+
+
+def clear():
+    """
+    drop every index
+
+    :return: None
+    """
+    with _lock:
+        _indexes.clear()
@@ -0,0 +1,255 @@
+import bisect
+import collections
+import re
+from datetime import datetime, timedelta, timezone
+
+from src.outbound.http import send
+from src.outbound.memory_cache import MemoryCache
+from src.pager_duty.pd import api_host, headers, get_entities_endpoints, _get_entities_resp_helper
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.entity_resp import EntityResp
+from src.value_objects.status import Status
+
+# the scheduled refresh reaches a single container, every other container rebuilds its index once it is this old
+INDEX_MAX_AGE_SECONDS = 30 * 60
+
+PAGE_SIZE = 100
+
+OncallEntry = collections.namedtuple('OncallEntry', ['start', 'end', 'escalation_level', 'user'])
+
+# the index counts against the cache memory budget, and is rebuilt on demand if it is evicted
+_index = MemoryCache('oncall index')
+_NO_INDEX = {'as_of': None, 'since': None, 'until': None, 'escalation_policies': {}, 'schedules': {}}
+
+
+class IntervalIndex():
+    """
+    a read-only index of (possibly overlapping) intervals that answers point-in-time and range queries with binary
+    search. The timeline is cut into elementary segments at every interval start/end, and each segment stores the
+    entries that cover it, so a point query is a single bisect
+    """
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda entry: (entry.start, entry.escalation_level or 0))
+        self.boundaries = sorted({entry.start for entry in self.entries} | {entry.end for entry in self.entries})
+
+        starts = collections.defaultdict(list)
+        ends = collections.defaultdict(list)
+        for i, entry in enumerate(self.entries):
+            starts[entry.start].append(i)
+            ends[entry.end].append(i)
+
+        active = set()
+        self.segments = []
+        for boundary in self.boundaries[:-1]:
+            active.difference_update(ends[boundary])
+            active.update(starts[boundary])
+            self.segments.append(tuple(sorted(active)))
+
+    def at(self, when):
+        """
+        :param when: an aware datetime
+        :return: list of OncallEntry that cover the given time
+        """
+        i = bisect.bisect_right(self.boundaries, when) - 1
+        if i < 0 or i >= len(self.segments):
+            return []
+
+        return [self.entries[j] for j in self.segments[i]]
+
+    def between(self, start, end):
+        """
+        :param start: an aware datetime
+        :param end: an aware datetime after start
+        :return: list of OncallEntry that overlap [start, end), ordered by their start time
+        """
+        first = max(bisect.bisect_right(self.boundaries, start) - 1, 0)
+        last = min(bisect.bisect_left(self.boundaries, end), len(self.segments))
+
+        found = set()
+        for segment in self.segments[first:last]:
+            found.update(segment)
+
+        return [self.entries[j] for j in sorted(found)]
+
+
+def parse_pd_time(value):
+    """
+    parse an ISO 8601 time (i.e. '2018-03-01T00:00:00-04:00' or '2018-03-01T04:00:00Z') into an aware datetime. Times
+    without an offset are treated as UTC
+
+    :param value: ISO 8601 string, or 'now'
+    :return: an aware datetime
+    """
+    if value == 'now':
+        return datetime.now(timezone.utc)
+
+    normalized = re.sub(r'Z$', '+0000', value.strip())
+    normalized = re.sub(r'([+-]\d{2}):(\d{2})$', r'\1\2', normalized)
+    for time_format in ('%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M%z', '%Y-%m-%dT%H:%M:%S',
+                        '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(normalized, time_format)
+        except ValueError:
+            continue
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+    raise ValueError('could not parse time \'{}\', please use ISO 8601 i.e. 2018-03-01T00:00:00-04:00'.format(value))
+
+
+def fetch_oncall_entries(since, until):
+    """
+    fetch every rendered oncall entry between since and until, paging through the /oncalls endpoint
+
+    :param since: aware datetime for the start of the window
+    :param until: aware datetime for the end of the window
+    :return: EntitiesResp object containing a Status and a list of raw oncall dictionaries
+    """
+    entity_url = api_host + get_entities_endpoints()['oncalls']
+    params = {'limit': 100, 'offset': 0, 'since': since.isoformat(), 'until': until.isoformat()}
+
+    oncalls = []
+    while True:
+        page = _get_entities_resp_helper('oncalls', send('get', url=entity_url, headers=headers, params=params))
+        if not page.status.success:
+            return EntitiesResp(Status(False, page.status.content))
+
+        oncalls.extend(page.entities['oncalls'])
+        if not page.entities.get('more'):
+            break
+        params['offset'] += len(page.entities['oncalls'])
+
+    return EntitiesResp(Status(True, 'successfully got {} oncall entries'.format(len(oncalls))), oncalls)
+
+
+def build_indexes(oncalls, since, until):
+    """
+    group raw oncall entries by escalation policy and schedule, and build an IntervalIndex for each one. A schedule
+    shift is listed once for every escalation policy and level that uses the schedule, so it is indexed only once
+
+    :param oncalls: list of raw oncall dictionaries from fetch_oncall_entries()
+    :param since: start of the fetched window, used for oncalls without a start (i.e. permanent assignments)
+    :param until: end of the fetched window, used for oncalls without an end
+    :return: a tuple of ({lowercase ep name: IntervalIndex}, {lowercase schedule name: IntervalIndex})
+    """
+    by_ep = collections.defaultdict(list)
+    by_schedule = collections.defaultdict(list)
+    seen_shifts = set()
+    for oncall in oncalls:
+        start = parse_pd_time(oncall['start']) if oncall.get('start') else since
+        end = parse_pd_time(oncall['end']) if oncall.get('end') else until
+        if end <= start:
+            continue
+
+        entry = OncallEntry(start, end, oncall.get('escalation_level'), oncall['user']['summary'])
+        by_ep[oncall['escalation_policy']['summary'].lower()].append(entry)
+        if oncall.get('schedule'):
+            schedule_name = oncall['schedule']['summary'].lower()
+            shift = entry._replace(escalation_level=None)
+            if (schedule_name, shift) not in seen_shifts:
+                seen_shifts.add((schedule_name, shift))
+                by_schedule[schedule_name].append(shift)
+
+    return ({name: IntervalIndex(entries) for name, entries in by_ep.items()},
+            {name: IntervalIndex(entries) for name, entries in by_schedule.items()})
+
+
+def refresh_oncall_index(window_days=7):
+    """
+    rebuild the oncall index from the rendered oncalls between now and window_days from now. This is meant to be
+    called periodically so that oncall queries never have to call pager duty
+
+    :param window_days: how many days ahead of now to index
+    :return: a Status describing whether the refresh was successful
+    """
+    since = datetime.now(timezone.utc).replace(microsecond=0)
+    until = since + timedelta(days=window_days)
+
+    oncalls_resp = fetch_oncall_entries(since, until)
+    if not oncalls_resp.status.success:
+        return Status(False, oncalls_resp.status.content)
+
+    eps, schedules = build_indexes(oncalls_resp.entities, since, until)
+    index = {'as_of': since, 'since': since, 'until': until, 'escalation_policies': eps, 'schedules': schedules}
+    if not _index.put('index', index, cost=len(oncalls_resp.entities) // PAGE_SIZE + 1):
+        return Status(False, 'the oncall index of {} oncall entries does not fit in the cache memory budget'.
+                      format(len(oncalls_resp.entities)))
+
+    return Status(True, 'indexed {} oncall entries between {} and {}'.format(len(oncalls_resp.entities), since, until))
+
+
+def is_fresh(max_age=INDEX_MAX_AGE_SECONDS):
+    """
+    :param max_age: max age in seconds of the oncall index
+    :return: True if the oncall index was refreshed less than max_age seconds ago
+    """
+    as_of = _index.peek('index', _NO_INDEX)['as_of']
+    return as_of is not None and (datetime.now(timezone.utc) - as_of).total_seconds() < max_age
+
+
+def indexed_escalation_policies(since, until, max_age=INDEX_MAX_AGE_SECONDS):
+    """
+    :param since: aware datetime for the start of the window
+    :param until: aware datetime for the end of the window
+    :param max_age: max age in seconds of the oncall index
+    :return: a tuple of (as of time, {lowercase ep name: IntervalIndex}) if the oncall index is fresh and covers the
+    whole window, else None
+    """
+    if not is_fresh(max_age):
+        return None
+
+    index = _index.get('index', _NO_INDEX)
+    if index['as_of'] is None or since < index['since'] or until > index['until']:
+        return None
+
+    return index['as_of'], index['escalation_policies']
+
+
+def who_is_oncall(entity_type, name, at, until=None):
+    """
+    answer who is oncall for an escalation policy or schedule at a point in time, or during a time range, using only
+    the local oncall index. The index is rebuilt on demand if this container never refreshed it or it is older than
+    INDEX_MAX_AGE_SECONDS, and a stale index is still used if the rebuild fails
+
+    :param entity_type: 'escalation_policies' or 'schedules'
+    :param name: name of the escalation policy or schedule
+    :param at: aware datetime for the point in time (or start of the range)
+    :param until: optional aware datetime for the end of the range
+    :return: an EntityResp containing a Status and a string describing who is oncall
+    """
+    if not is_fresh():
+        refresh_status = refresh_oncall_index()
+        if not refresh_status.success and _index.peek('index') is None:
+            return EntityResp(Status(False, refresh_status.content))
+
+    snapshot = _index.get('index')
+    if snapshot is None:
+        return EntityResp(Status(False, 'the oncall index was evicted from the cache, please retry'))
+
+    if at < snapshot['since'] or (until or at) > snapshot['until']:
+        return EntityResp(Status(False, 'the oncall index only covers {} to {}'.
+                                 format(snapshot['since'].isoformat(), snapshot['until'].isoformat())))
+
+    index = snapshot[entity_type].get(name.lower())
+    if index is None:
+        return EntityResp(Status(False, 'no oncalls indexed for {}'.format(name)))
+
+    entries = index.between(at, until) if until else index.at(at)
+    if not entries:
+        return EntityResp(Status(False, 'nobody is oncall for {} at {}'.format(name, at.isoformat())))
+
+    return EntityResp(Status(True, 'as of {}'.format(snapshot['as_of'].isoformat())), oncall_entries_to_string(entries))
+
+
+def oncall_entries_to_string(entries):
+    """
+    convert oncall entries into a string, one line per entry ordered by escalation level
+
+    :param entries: list of OncallEntry
+    :return: i.e. '1: Test User 1 (2018-03-01T09:00:00+00:00 - 2018-03-08T09:00:00+00:00)'
+    """
+    result = []
+    for entry in sorted(entries, key=lambda e: (e.escalation_level or 0, e.start)):
+        prefix = '{}: '.format(entry.escalation_level) if entry.escalation_level else ''
+        result.append('{0}{1} ({2} - {3})'.format(prefix, entry.user, entry.start.isoformat(), entry.end.isoformat()))
+
+    return '\n'.join(result)
@@ -1,8 +1,18 @@
 import collections
+import functools
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 
+from src.outbound import context, tracing
+from src.outbound.deadline import DeadlineExceeded
+from src.outbound.hedging import Hedger
+from src.outbound.http import send
+from src.outbound.json_stream import iter_array_items, pick
+from src.outbound.single_flight import SingleFlight
+from src.pager_duty import directory, incident_dedup, name_index, snapshot
 from src.value_objects.entities_resp import EntitiesResp
 from src.value_objects.entity_resp import EntityResp
 from src.value_objects.status import Status
@@ -19,6 +29,20 @@ headers = {
     'Accept': 'application/vnd.pagerduty+json;version=2',
 }
 
+in_flight_gets = SingleFlight()
+hedged_gets = Hedger()
+
+_snapshot_refresher = ThreadPoolExecutor(max_workers=1)
+_snapshot_refresh_lock = threading.Lock()
+_snapshot_refresh = []
+
+HEDGE_GETS = os.environ.get('DZBOT_HEDGE_GETS', 'off') == 'on'
+HEDGED_ENTITY_TYPES = ('users', 'oncalls', 'contact methods')
+
+DIRECTORY_ENTITY_TYPES = ('users', 'escalation_policies', 'services', 'schedules')
+STREAM_CHUNK_SIZE = 8192
+ERROR_BODY_LIMIT = 300
+
 
 def send_incident(entity_type, sender_name, entity_name, service_name, title, message):
     """
@@ -30,29 +54,59 @@ def send_incident(entity_type, sender_name, entity_name, service_name, title, me
     :param service_name: name of the impacted pager duty service
     :param title: title of incident
     :param message: body of message
-    :return: a Status obj that contains whether the incident was sent successfully or not
-    """
+    :return: a Status obj that contains whether the incident was sent successfully or not. If the same incident (same
+    service, target and normalized title) was sent within the dedup window, no incident is sent and the Status
+    reports the existing one instead
+    """
+    key = incident_dedup.incident_key(entity_type, entity_name, service_name, title)
+    is_first, existing = incident_dedup.recent.begin(key, sender_name)
+    if not is_first:
+        return Status(True, incident_dedup.duplicate_summary(existing))
+
+    try:
+        status, incident = _send_incident(entity_type, sender_name, entity_name, service_name, title, message)
+    except Exception:
+        incident_dedup.recent.discard(key)
+        raise
+
+    if status.success:
+        incident_dedup.recent.finish(key, incident)
+    else:
+        incident_dedup.recent.discard(key)
+
+    return status
+
+
+def _send_incident(entity_type, sender_name, entity_name, service_name, title, message):
     email = get_user_login_email(sender_name)
     entity = search_entity(entity_name, entity_type)
     service = search_entity(service_name, 'services')
     search_results = send_and_override_helper(entity_type, entity, service)
 
     if not email.status.success:
-        return Status(False, email.status.content)
+        return Status(False, email.status.content), None
     if not search_results.success:
-        return Status(False, search_results.content)
+        return Status(False, search_results.content), None
 
     incident = get_incident_body(entity_type, entity, service, title, message)
 
-    headers['FROM'] = email.entity
     send_incident_url = api_host + '/incidents'
-    response = requests.post(url=send_incident_url, headers=headers, json=incident)
+    response = send('post', url=send_incident_url, headers=dict(headers, FROM=email.entity), json=incident)
 
     if response.ok:
-        return Status(True, 'successfully sent {0} incident to {1}'.format(entity_type, entity_name))
-    return Status(False, response.content)
+        return Status(True, 'successfully sent {0} incident to {1}'.format(entity_type, entity_name)), \
+            _created_incident(response)
+    return Status(False, response.content), None
 
 
+def _created_incident(response):
+    try:
+        return response.json().get('incident', {})
+    except ValueError:
+        return {}
+
+
+@tracing.traced('get_user_login_email', 'name')
 def get_user_login_email(name):
     """
     extract the user login email
@@ -60,6 +114,12 @@ def get_user_login_email(name):
     :param name: user name
     :return: email address of user
     """
+    cached_user = directory.lookup('users', name)
+    if cached_user and cached_user['name'] == name:
+        tracing.annotate(cache='directory hit')
+        return EntityResp(Status(True, 'found pagerduty login email for {}'.format(name)), cached_user['email'])
+    refresh_stale_snapshot('users')
+
     users = get_all_entities_resp('users', name)
     if not users.status.success:
         return EntityResp(Status(False, users.status.content))
@@ -155,7 +215,7 @@ def override_schedule(schedule_name, user_name, start, end):
     }
 
     override_schedule_url = api_host + '/schedules/{}/overrides'.format(schedule.entity['id'])
-    response = requests.post(override_schedule_url, headers=headers, json=override)
+    response = send('post', override_schedule_url, headers=headers, json=override)
 
     if response.ok:
         return Status(True, 'successfully created the override for {} between {} - {}'.
@@ -174,42 +234,6 @@ def send_and_override_helper(entity_type, entity, service_or_schedule):
     return Status(True, 'both the entity and service/schedule have been found')
 
 
-def monitor_primary_secondary():
-    """
-    monitor and notify each team/escalation policy whether it has a primary and secondary oncall set in pager duty
-
-    :return: Status object
-    """
-    monitored_eps = {
-        'Amp',
-        'Data Engineering',
-        'DataScience',
-        'Ingestion',
-        'Operations',
-        'OpsDirect',
-        'ops-delayed',
-        'Radioedit',
-        'Radioedit-delayed',
-        'Web Escalation',
-        'Test'
-    }
-
-    eps_without_primary_secondary = ensure_oncalls()
-
-    if not eps_without_primary_secondary.status.success:
-        return Status(False, eps_without_primary_secondary.status.content)
-
-    for ep in eps_without_primary_secondary.entities:
-        ep_name = ep.split(':')[0]
-        if ep_name in monitored_eps:
-            send_response = Status(True, 'No-Op')
-
-            if not send_response.success:
-                return Status(False, send_response.content)
-
-    return Status(True, 'Monitored successfully')
-
-
 def ensure_oncalls():
     """
     ensure that each escalation policy has an oncall level 1 and oncall level 2 user. It also checks if the oncall
@@ -225,8 +249,17 @@ def ensure_oncalls():
         return EntitiesResp(Status(False, all_eps_resp.status.content))
 
     result = []
-    for ep_name in all_eps_resp.entities:
-        ep_response = list_oncalls_by_ep(ep_name)
+    for checked, ep_name in enumerate(all_eps_resp.entities):
+        try:
+            ep_response = list_oncalls_by_ep(ep_name)
+        except DeadlineExceeded:
+            result.append('ran out of time, only checked {} of {} escalation policies'.
+                          format(checked, len(all_eps_resp.entities)))
+            return EntitiesResp(Status(True, 'partially ensured all primary & secondary'), result)
+        except requests.Timeout:
+            result.append('{}: could not be checked, pager duty took too long to answer'.format(ep_name))
+            continue
+
         if not ep_response.status.success:
             return EntitiesResp(Status(False, ep_response.status.content))
 
@@ -236,10 +269,26 @@ def ensure_oncalls():
             result.append('{}: oncall level 1 does not exist'.format(ep_name))
         elif 2 not in existing_escalation_levels:
             result.append('{}: oncall level 2 does not exist'.format(ep_name))
+        else:
+            level_users = [{oncall['user']['summary'] for oncall in ep_oncalls
+                            if oncall['escalation_level'] == level and oncall.get('user')} for level in (1, 2)]
+            for user in sorted(level_users[0] & level_users[1]):
+                result.append('{0}: {1} is oncall for both level 1 & 2'.format(ep_name, user))
 
     return EntitiesResp(Status(True, 'successfully ensured all primary & secondary'), result)
 
 
+def shared_lookups():
+    """
+    share the entities found by search_entity() between every command run inside the with block (and in threads
+    started with context.wrap()), i.e. between the pipelined commands of one /dzbot message
+
+    :return: a context manager
+    """
+    return context.scope(lookups={})
+
+
+@tracing.traced('search_entity', 'name', 'entity_type')
 def search_entity(name, entity_type):
     """
     search for a specific entity in pager duty
@@ -248,17 +297,43 @@ def search_entity(name, entity_type):
     :param entity_type: type of entity ('users', 'escalation_policies', 'services', 'oncalls', 'schedules')
     :return: an EntityResp containing a Status and the searched entity if found, else None
     """
+    lookups = context.get('lookups')
+    key = (entity_type, name.lower())
+    if lookups is not None and key in lookups:
+        tracing.annotate(cache='request hit')
+        return lookups[key]
+
+    entity_resp = _search_entity(name, entity_type)
+    if lookups is not None and entity_resp.status.success:
+        lookups[key] = entity_resp
+
+    return entity_resp
+
+
+def _search_entity(name, entity_type):
+    cached_entity = directory.lookup(entity_type, name)
+    tracing.annotate(cache='directory hit' if cached_entity else 'miss')
+    if cached_entity:
+        return EntityResp(Status(True, 'successfully found {}: {}'.format(entity_type, name)), cached_entity)
+    refresh_stale_snapshot(entity_type)
+
     entities_response = get_all_entities_resp(entity_type, name)
 
     if not entities_response.status.success:
         return EntityResp(Status(False, entities_response.status.content))
 
     entities = entities_response.entities[entity_type]
+    name_index.add_names(entity_type, [entity['name'] for entity in entities])
     for entity in entities:
         if entity['name'].lower() == name.lower():
             return EntityResp(Status(True, 'successfully found {}: {}'.format(entity_type, name)), entity)
 
-    return EntityResp(Status(False, 'could not find entity name: \'{0}\' of type \'{1}\''.format(name, entity_type)))
+    not_found = 'could not find entity name: \'{0}\' of type \'{1}\''.format(name, entity_type)
+    suggestions = name_index.suggest(entity_type, name)
+    if suggestions:
+        not_found += ', did you mean: {}?'.format(', '.join('\'{}\''.format(s) for s in suggestions))
+
+    return EntityResp(Status(False, not_found))
 
 
 def list_all_entities(entity_type):
@@ -267,17 +342,30 @@ def list_all_entities(entity_type):
 
     :param entity_type: type of entity you want to list ('users', 'escalation_policies', 'services',
      'oncalls', 'schedules')
-    :return: EntitiesResp object containing a Status and a list of entity names
+    :return: EntitiesResp object containing a Status and a list of entity names. Concurrent listings of the same type
+    share one streamed request and its names, which must be treated as read-only
     """
-    entities_response = get_all_entities_resp(entity_type)
+    try:
+        return in_flight_gets.do(('list_all_entities', entity_type), _list_all_entities, entity_type)
+    except ValueError as e:
+        return EntitiesResp(Status(False, 'error: {0}\ncould not decode all {1}'.format(e, entity_type)))
+    except requests.RequestException as e:
+        return EntitiesResp(Status(False, 'error: {0}\ncould not retrieve all {1}'.format(e, entity_type)))
+
+
+def _list_all_entities(entity_type):
+    name_field = 'user.summary' if entity_type == 'oncalls' else 'name'
+    entities_response = stream_entities(entity_type, [name_field])
     if not entities_response.status.success:
-        return EntitiesResp(Status(False, entities_response.entities))
+        return EntitiesResp(Status(False, entities_response.status.content))
 
-    entities = entities_response.entities[entity_type]
     if entity_type == 'oncalls':
-        return EntitiesResp(entities_response.status, {entity['user']['summary'] for entity in entities})
-    else:
-        return EntitiesResp(entities_response.status, [entity['name'] for entity in entities])
+        return EntitiesResp(entities_response.status,
+                            {entity['user']['summary'] for entity in entities_response.entities})
+
+    names = [entity['name'] for entity in entities_response.entities]
+    name_index.add_names(entity_type, names)
+    return EntitiesResp(entities_response.status, names)
 
 
 def list_specific_entity(entity_type, name):
@@ -324,11 +412,16 @@ def list_ep_by_level(ep_name):
         esc_level = oncall['escalation_level']
         user_name = oncall['user']['summary']
 
-        cm_response = list_contact_methods(user_name)
-        if not cm_response.status:
-            return EntityResp(Status(False, cm_response.status.content))
-
-        user_info = user_name + ', ' + contact_methods_to_string(cm_response.entities)
+        try:
+            cm_response = list_contact_methods(user_name)
+        except DeadlineExceeded:
+            user_info = user_name + ', contact info unavailable (ran out of time)'
+        except requests.Timeout:
+            user_info = user_name + ', contact info unavailable (pager duty took too long to answer)'
+        else:
+            if not cm_response.status:
+                return EntityResp(Status(False, cm_response.status.content))
+            user_info = user_name + ', ' + contact_methods_to_string(cm_response.entities)
         if esc_level not in ep:
             ep[esc_level] = [user_info]
         else:
@@ -350,8 +443,7 @@ def list_oncalls_by_ep(ep_name):
         return EntitiesResp(Status(False, '{} is not a valid escalation policy'.format(ep_name)))
 
     entity_url = api_host + get_entities_endpoints()['oncalls']
-    response = requests.get(url=entity_url, headers=headers, params={'escalation_policy_ids[]': [ep.entity['id']]})
-    return _get_entities_resp_helper('oncalls', response)
+    return _get_entities('oncalls', entity_url, {'escalation_policy_ids[]': [ep.entity['id']]})
 
 
 def list_contact_methods(name):
@@ -375,6 +467,7 @@ def list_contact_methods(name):
     return EntitiesResp(Status(True, 'successfully got {}\'s contact methods'.format(name)), clean_contact_method(cms))
 
 
+@tracing.traced('get_user_contact_methods', 'user_id')
 def get_user_contact_methods(user_id):
     """
     get all contact_methods of a pager duty user
@@ -386,11 +479,11 @@ def get_user_contact_methods(user_id):
         return EntitiesResp(Status(False, 'must specify a user_id in order to get user\'s contact methods'))
 
     contact_methods_url = api_host + '/users/{}/contact_methods'.format(user_id)
-    response = requests.get(url=contact_methods_url, headers=headers, params={'limit': 100})
 
-    return _get_entities_resp_helper('contact methods', response)
+    return _get_entities('contact methods', contact_methods_url, {'limit': 100})
 
 
+@tracing.traced('get_all_entities_resp', 'entity_type', 'name')
 def get_all_entities_resp(entity_type, name=None):
     """
     retrieve a list of all entities by type
@@ -405,8 +498,172 @@ def get_all_entities_resp(entity_type, name=None):
         return EntitiesResp(Status(False, 'incorrect \'type\' parameter: {}'.format(entity_type)))
 
     entity_url = api_host + entities_endpoints[entity_type]
-    response = requests.get(url=entity_url, headers=headers, params={'limit': 100, 'query': name})
-    return _get_entities_resp_helper(entity_type, response)
+    return _get_entities(entity_type, entity_url, {'limit': 100, 'query': name})
+
+
+def get_all_entities_pages(entity_type):
+    """
+    retrieve every entity of a type by paging through its endpoint until pager duty reports there are no more
+
+    :param entity_type: entity type (users, escalation_policies, services, schedules)
+    :return: EntitiesResp object containing a Status and a list of every entity
+    """
+    entities_endpoints = get_entities_endpoints()
+    if entity_type not in entities_endpoints:
+        return EntitiesResp(Status(False, 'incorrect \'type\' parameter: {}'.format(entity_type)))
+
+    entity_url = api_host + entities_endpoints[entity_type]
+    entities = []
+    while True:
+        page = _get_entities(entity_type, entity_url, {'limit': 100, 'offset': len(entities)})
+        if not page.status.success:
+            return EntitiesResp(Status(False, page.status.content))
+
+        entities.extend(page.entities[entity_type])
+        if not page.entities.get('more') or not page.entities[entity_type]:
+            break
+
+    return EntitiesResp(Status(True, 'successfully got all {} {}'.format(len(entities), entity_type)), entities)
+
+
+def load_directory(entity_types=DIRECTORY_ENTITY_TYPES):
+    """
+    load every user, escalation policy, service and schedule into the in memory directory, so that search_entity()
+    can find them without calling pager duty until the directory goes stale
+
+    :param entity_types: the entity types to load
+    :return: a Status describing how many entities of each type were loaded
+    """
+    if directory.SNAPSHOT_PATH:
+        return _load_directory_snapshot(entity_types)
+
+    loaded = []
+    for entity_type in entity_types:
+        entities_resp = get_all_entities_pages(entity_type)
+        if not entities_resp.status.success:
+            return Status(False, entities_resp.status.content)
+
+        loaded.append('{} {}'.format(directory.replace(entity_type, entities_resp.entities), entity_type))
+        name_index.update_names(entity_type, [entity['name'] for entity in entities_resp.entities])
+
+    return Status(True, 'loaded {}'.format(', '.join(loaded)))
+
+
+def _load_directory_snapshot(entity_types):
+    """
+    load the directory into the snapshot shared by every worker on the host. One worker at a time refreshes it from
+    pager duty, the others map the snapshot that is already published
+
+    :param entity_types: the entity types to load
+    :return: a Status describing how many entities were published, or that another worker's snapshot is used
+    """
+    with snapshot.refresh_lock(directory.SNAPSHOT_PATH) as is_refresher:
+        if not is_refresher or all(directory.is_fresh(entity_type) for entity_type in entity_types):
+            current = directory.current_snapshot()
+            for entity_type in entity_types if current else ():
+                name_index.update_names(entity_type, current.names(entity_type))
+            return Status(True, 'using the directory snapshot {} by another worker'.format(
+                'published' if is_refresher else 'being refreshed'))
+
+        entities_by_type = {}
+        for entity_type in entity_types:
+            entities_resp = get_all_entities_pages(entity_type)
+            if not entities_resp.status.success:
+                return Status(False, entities_resp.status.content)
+            entities_by_type[entity_type] = entities_resp.entities
+            name_index.update_names(entity_type, [entity['name'] for entity in entities_resp.entities])
+
+        return Status(True, 'published {} entities to the directory snapshot'.format(
+            directory.publish(entities_by_type)))
+
+
+def refresh_stale_snapshot(entity_type):
+    """
+    start refreshing the shared directory snapshot in the background when a lookup finds its entity type stale, so
+    that the snapshot doesn't depend on warm up running. Only one refresh runs per worker, and only the worker holding
+    the snapshot's refresh lock calls pager duty, the others just map the snapshot it publishes
+
+    :param entity_type: the entity type the lookup was for
+    :return: the Future of the refresh's Status, or None if there is no snapshot to refresh, the entity type is fresh
+    or a refresh is already running
+    """
+    if not directory.SNAPSHOT_PATH or entity_type not in DIRECTORY_ENTITY_TYPES or directory.is_fresh(entity_type):
+        return None
+
+    with _snapshot_refresh_lock:
+        if _snapshot_refresh and not _snapshot_refresh[0].done():
+            return None
+
+        _snapshot_refresh[:] = [_snapshot_refresher.submit(load_directory)]
+        return _snapshot_refresh[0]
+
+
+def stream_entities(entity_type, fields, name=None):
+    """
+    retrieve a list of entities by type, decoding them one at a time from the response stream and keeping only the
+    requested fields, so that memory is bounded by a single entity instead of a whole page
+
+    :param entity_type: entity type (users, escalation_policies, services, schedules, oncalls)
+    :param fields: list of fields to keep from each entity, nested fields are separated by dots (i.e. 'user.summary')
+    :param name: name of specific entity (this does not work for oncall entities)
+    :return: EntitiesResp object containing a Status and a generator of the trimmed entities, which must be consumed
+    before the next request for the connection to be reused
+    """
+    entities_endpoints = get_entities_endpoints()
+    if entity_type not in entities_endpoints:
+        return EntitiesResp(Status(False, 'incorrect \'type\' parameter: {}'.format(entity_type)))
+
+    entity_url = api_host + entities_endpoints[entity_type]
+    response = _send_get(entity_type, entity_url, {'limit': 100, 'query': name}, stream=True)
+    if not response.ok:
+        return EntitiesResp(Status(False, 'could not retrieve all {0}: {1}'.format(entity_type, response.text)))
+
+    return EntitiesResp(Status(True, 'successfully got all {}'.format(entity_type)),
+                        _iter_response_entities(response, entity_type, fields))
+
+
+def _iter_response_entities(response, entity_type, fields):
+    try:
+        for entity in iter_array_items(response.iter_content(chunk_size=STREAM_CHUNK_SIZE), entity_type):
+            yield pick(entity, fields)
+    finally:
+        response.close()
+
+
+def _get_entities(entity_type, entity_url, params):
+    """
+    helper method that GETs a list of entities. Identical GETs that are already in flight (i.e. the same search_entity
+    call from concurrent commands) share a single http request (or hedged pair of requests) and its decoded
+    EntitiesResp
+
+    :param entity_type: the type of entities (e.g. users/escalation_policies/oncalls/contact_methods etc.)
+    :param entity_url: the url of the entities endpoint
+    :param params: query parameters of the GET request
+    :return: EntitiesResp object containing a Status and a list of entities
+    """
+    key = (entity_url, tuple(sorted((param, str(value)) for param, value in params.items())))
+
+    return in_flight_gets.do(key, lambda: _get_entities_resp_helper(
+        entity_type, _send_get(entity_type, entity_url, params)))
+
+
+def _send_get(entity_type, entity_url, params, stream=False):
+    """
+    send a GET request, hedging it when hedged GETs are turned on (DZBOT_HEDGE_GETS=on) for the entity type
+
+    :param entity_type: the type of entities, latencies are tracked separately for each type
+    :param entity_url: the url of the entities endpoint
+    :param params: query parameters of the GET request
+    :param stream: True to return as soon as the headers arrive and stream the body (a hedged stream is hedged until
+    its headers arrive)
+    :return: the requests Response
+    """
+    stream_kwargs = {'stream': True} if stream else {}
+    get = functools.partial(send, 'get', url=entity_url, headers=headers, params=params, **stream_kwargs)
+    if HEDGE_GETS and entity_type in HEDGED_ENTITY_TYPES:
+        return hedged_gets.call(entity_type, get)
+
+    return get()
 
 
 def _get_entities_resp_helper(entity_type, entities_response):
@@ -416,16 +673,19 @@ def _get_entities_resp_helper(entity_type, entities_response):
     :param entity_type: the type of entities (e.g. users/escalation_policies/oncalls/contact_methods etc.)
     :param entities_response: the response from request.get for users/escalation_policies/oncalls/services/
     contact_methods etc.
-    :return: EntitiesResp object containing a Status and a list of entities
+    :return: EntitiesResp object containing a Status and a list of entities. Error bodies (i.e. html from a load
+    balancer during an outage) are never decoded as json, only quoted in the Status
     """
     if entities_response.ok:
         try:
             return EntitiesResp(Status(True, 'successfully got all {}'.format(entity_type)), entities_response.json())
         except Exception as e:
             return EntitiesResp(Status(False, 'error: {0}\ncould not retrieve all {1}\nresponse: {2}'.
-                                       format(e, entity_type, entities_response.ktext)))
+                                       format(e, entity_type, entities_response.text[:ERROR_BODY_LIMIT])))
 
-    return EntitiesResp(Status(False, 'could not retrieve all {}'.format(entity_type)), entities_response.json())
+    return EntitiesResp(Status(False, 'could not retrieve all {0} ({1}): {2}'.
+                               format(entity_type, entities_response.status_code,
+                                      entities_response.text[:ERROR_BODY_LIMIT])))
 
 
 def clean_contact_method(contact_methods):
@@ -0,0 +1,132 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from src.outbound import context
+from src.outbound.memory_cache import MemoryCache
+from src.pager_duty.pd import get_all_entities_pages, get_user_contact_methods, clean_contact_method, \
+    contact_methods_to_string, ordered_dict_to_string, sort_ep
+from src.value_objects.entity_resp import EntityResp
+from src.value_objects.status import Status
+
+ROSTER_MAX_AGE_SECONDS = 15 * 60
+CONTACTS_MAX_AGE_SECONDS = 6 * 60 * 60
+MAX_WORKERS = 8
+PAGE_SIZE = 100
+
+_refresh_lock = threading.Lock()
+# the roster counts against the cache memory budget, and is rebuilt on demand if it is evicted
+_roster = MemoryCache('oncall roster')
+_NO_ROSTER = {'as_of': None, 'refreshed_at': None, 'policies': {}}
+_contacts = MemoryCache('roster contact methods')
+
+
+def refresh_roster():
+    """
+    rebuild the materialized roster of every escalation policy -> escalation level -> oncall user -> contact methods
+    from a single paged /oncalls listing. Contact methods are cached per user, so only users that just came oncall (or
+    whose contact methods are older than CONTACTS_MAX_AGE_SECONDS) are looked up again
+
+    :return: a Status describing whether the refresh was successful
+    """
+    with _refresh_lock:
+        return _rebuild_roster()
+
+
+def _rebuild_roster():
+    oncalls_resp = get_all_entities_pages('oncalls')
+    if not oncalls_resp.status.success:
+        return Status(False, oncalls_resp.status.content)
+
+    users = {oncall['user']['id']: oncall['user']['summary'] for oncall in oncalls_resp.entities}
+    now = time.time()
+    contacts = {}
+    for user_id in users:
+        cached_at, contact_methods = _contacts.get(user_id, (None, None))
+        if cached_at is not None and now - cached_at <= CONTACTS_MAX_AGE_SECONDS:
+            contacts[user_id] = contact_methods
+    stale_user_ids = [user_id for user_id in users if user_id not in contacts]
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        cm_responses = executor.map(context.wrap(get_user_contact_methods), stale_user_ids)
+        for user_id, cm_response in zip(stale_user_ids, cm_responses):
+            if not cm_response.status.success:
+                return Status(False, cm_response.status.content)
+            contacts[user_id] = clean_contact_method(cm_response.entities['contact_methods'])
+            _contacts.put(user_id, (now, contacts[user_id]))
+
+    for user_id in set(_contacts.keys()) - set(users):
+        _contacts.remove(user_id)
+
+    policies = {}
+    for oncall in oncalls_resp.entities:
+        ep_name = oncall['escalation_policy']['summary']
+        levels = policies.setdefault(ep_name.lower(), {'name': ep_name, 'levels': collections.defaultdict(list)})
+        user_id = oncall['user']['id']
+        user_info = users[user_id] + ', ' + contact_methods_to_string(contacts[user_id])
+        if user_info not in levels['levels'][oncall['escalation_level']]:
+            levels['levels'][oncall['escalation_level']].append(user_info)
+
+    for policy in policies.values():
+        policy['levels'] = sort_ep(policy['levels'])
+
+    roster = {'as_of': datetime.now(timezone.utc).replace(microsecond=0), 'refreshed_at': now, 'policies': policies}
+    if not _roster.put('roster', roster, cost=len(oncalls_resp.entities) // PAGE_SIZE + 1 + len(stale_user_ids)):
+        return Status(False, 'the roster of {} escalation policies does not fit in the cache memory budget'.
+                      format(len(policies)))
+
+    return Status(True, 'roster refreshed with {} escalation policies, {} contact lookups'.
+                  format(len(policies), len(stale_user_ids)))
+
+
+def is_fresh(max_age=ROSTER_MAX_AGE_SECONDS):
+    """
+    :param max_age: max age in seconds of the roster
+    :return: True if the roster was refreshed less than max_age seconds ago
+    """
+    refreshed_at = _roster.peek('roster', _NO_ROSTER)['refreshed_at']
+    return refreshed_at is not None and time.time() - refreshed_at < max_age
+
+
+def get_ep_levels(ep_name, max_age=ROSTER_MAX_AGE_SECONDS):
+    """
+    look up an escalation policy's oncall users by level in the roster
+
+    :param ep_name: name of the escalation policy
+    :param max_age: max age in seconds of the roster
+    :return: an EntityResp containing a Status with the roster's 'as of' time and the ordered dictionary of the ep's
+    levels (the same format as list_ep_by_level()), or None if the roster is stale or doesn't contain the ep
+    """
+    if not is_fresh(max_age):
+        return None
+
+    roster = _roster.get('roster', _NO_ROSTER)
+    policy = roster['policies'].get(ep_name.lower())
+    if policy is None:
+        return None
+
+    return EntityResp(Status(True, 'as of {}'.format(roster['as_of'].isoformat())), policy['levels'])
+
+
+def get_roster():
+    """
+    get the whole roster as a string, refreshing it first if this container doesn't have a fresh roster yet
+
+    :return: an EntityResp containing a Status with the roster's 'as of' time and the roster string
+    """
+    if not is_fresh():
+        refresh_status = refresh_roster()
+        if not refresh_status.success:
+            return EntityResp(Status(False, refresh_status.content))
+
+    roster = _roster.get('roster')
+    if roster is None:
+        return EntityResp(Status(False, 'the roster was evicted from the cache, please retry'))
+
+    policies = sorted(roster['policies'].values(), key=lambda policy: policy['name'].lower())
+    as_of = roster['as_of']
+
+    result = ['{}\n{}'.format(policy['name'], ordered_dict_to_string(policy['levels'])) for policy in policies]
+    return EntityResp(Status(True, 'as of {}'.format(as_of.isoformat())), '\n\n'.join(result))
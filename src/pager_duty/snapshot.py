@@ -0,0 +1,174 @@
+import contextlib
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+MAGIC = b'DZSNAP01'
+
+_COUNT = struct.Struct('<I')
+_TYPE = struct.Struct('<24sdII')
+_ENTRY = struct.Struct('<IIII')
+
+
+def write(path, entities_by_type, loaded_at=None):
+    """
+    publish a read only snapshot of the directory that every worker on the host can memory map. The snapshot is
+    written to a temporary file and renamed over path, so readers see either the old or the new version, never a mix.
+
+    Layout (little endian): MAGIC, the number of entity types, one (type, loaded at, count, index offset) entry per
+    type, then per type an index of (key offset, key length, name length, record length) entries sorted by key (the
+    utf-8 lower case name), then for every entity its key, its name and its json record, one after the other
+
+    :param path: path of the snapshot file
+    :param entities_by_type: dictionary of entity type to a list of entity dictionaries, each with a 'name'
+    :param loaded_at: time the entities were loaded from pager duty, now by default
+    :return: the number of entities written
+    """
+    loaded_at = time.time() if loaded_at is None else loaded_at
+    by_type = [(entity_type, {entity['name'].lower().encode('utf-8'): entity for entity in entities})
+               for entity_type, entities in sorted(entities_by_type.items())]
+
+    header_size = len(MAGIC) + _COUNT.size + _TYPE.size * len(by_type)
+    data_offset = header_size + sum(_ENTRY.size * len(by_name) for _, by_name in by_type)
+
+    types, indexes, data = [], [], []
+    index_offset = header_size
+    for entity_type, by_name in by_type:
+        types.append(_TYPE.pack(entity_type.encode('utf-8'), loaded_at, len(by_name), index_offset))
+        index_offset += _ENTRY.size * len(by_name)
+        for key in sorted(by_name):
+            name = by_name[key]['name'].encode('utf-8')
+            record = json.dumps(by_name[key], separators=(',', ':')).encode('utf-8')
+            indexes.append(_ENTRY.pack(data_offset, len(key), len(name), len(record)))
+            data.extend((key, name, record))
+            data_offset += len(key) + len(name) + len(record)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.dzsnap')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b''.join([MAGIC, _COUNT.pack(len(by_type))] + types + indexes + data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+    return sum(len(by_name) for _, by_name in by_type)
+
+
+class Snapshot():
+    """
+    a memory mapped directory snapshot. The pages are shared by every process mapping the same file, lookups binary
+    search the index in place and only decode the record that matches
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._buf[:len(MAGIC)] != MAGIC:
+            self._buf.close()
+            raise ValueError('{} is not a directory snapshot'.format(path))
+
+        self._types = {}
+        offset = len(MAGIC) + _COUNT.size
+        for _ in range(_COUNT.unpack_from(self._buf, len(MAGIC))[0]):
+            entity_type, loaded_at, count, index_offset = _TYPE.unpack_from(self._buf, offset)
+            self._types[entity_type.rstrip(b'\0').decode('utf-8')] = (loaded_at, count, index_offset)
+            offset += _TYPE.size
+
+    def loaded_at(self, entity_type):
+        """
+        :param entity_type: type of the entities
+        :return: the time the entity type was loaded, or None if it isn't in the snapshot
+        """
+        return self._types[entity_type][0] if entity_type in self._types else None
+
+    def lookup(self, entity_type, name):
+        """
+        case insensitive lookup of an entity by name
+
+        :param entity_type: type of the entity
+        :param name: name of the entity
+        :return: the entity dictionary, or None if it isn't in the snapshot
+        """
+        if entity_type not in self._types:
+            return None
+
+        _, count, index_offset = self._types[entity_type]
+        key = name.lower().encode('utf-8')
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, name_length, record_length = \
+                _ENTRY.unpack_from(self._buf, index_offset + middle * _ENTRY.size)
+            candidate = self._buf[key_offset:key_offset + key_length]
+            if candidate == key:
+                record_offset = key_offset + key_length + name_length
+                return json.loads(self._buf[record_offset:record_offset + record_length].decode('utf-8'))
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return None
+
+    def names(self, entity_type):
+        """
+        :param entity_type: type of the entities
+        :return: the names of every entity of the type, in case insensitive order
+        """
+        if entity_type not in self._types:
+            return []
+
+        _, count, index_offset = self._types[entity_type]
+        names = []
+        for i in range(count):
+            key_offset, key_length, name_length, _ = _ENTRY.unpack_from(self._buf, index_offset + i * _ENTRY.size)
+            name_offset = key_offset + key_length
+            names.append(self._buf[name_offset:name_offset + name_length].decode('utf-8'))
+
+        return names
+
+    def close(self):
+        self._buf.close()
+
+
+def file_version(path):
+    """
+    :param path: path of the snapshot file
+    :return: a value that changes every time a new snapshot is published at path, or None if there is none
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+@contextlib.contextmanager
+def refresh_lock(path):
+    """
+    try to become the one process on the host that refreshes the snapshot at path, without waiting
+
+    :param path: path of the snapshot file
+    :return: a context manager giving True if this process holds the lock until the block exits
+    """
+    with open(path + '.lock', 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -10,8 +10,11 @@ class EntitiesResp(Jsonable):
         self.status = status
         self.entities = entities
 
-    def to_json(self):
+    def to_dict(self):
         if not self.entities:
-            return self.dump_json({'status': self.status.to_dict()})
+            return {'status': self.status.to_dict()}
+
+        return {'entities': self.entities, 'status': self.status.to_dict()}
 
-        return self.dump_json({'entities': self.entities, 'status': self.status.to_dict()})
+    def to_json(self):
+        return self.dump_json(self.to_dict())
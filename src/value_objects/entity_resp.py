@@ -10,8 +10,11 @@ class EntityResp(Jsonable):
         self.status = status
         self.entity = entity
 
-    def to_json(self):
+    def to_dict(self):
         if not self.entity:
-            return self.dump_json({'status': self.status.to_dict()})
+            return {'status': self.status.to_dict()}
+
+        return {'entity': self.entity, 'status': self.status.to_dict()}
 
-        return self.dump_json({'entity': self.entity, 'status': self.status.to_dict()})
+    def to_json(self):
+        return self.dump_json(self.to_dict())
@@ -0,0 +1,56 @@
+import json
+from unittest.mock import patch
+
+from src.dzbot import admission
+from src.dzbot.app import app
+
+
+def test_admission_controller_global_cap():
+    controller = admission.AdmissionController(max_in_flight=3, reserved=1, room_max_in_flight=5)
+
+    assert controller.admit('room 1') == (True, None)
+    assert controller.admit('room 2') == (True, None)
+    assert controller.admit('room 3') == (False, 'too many commands are running')
+    assert controller.admit('room 3', high_priority=True) == (True, None)
+    assert controller.admit('room 4', high_priority=True) == (False, 'too many commands are running')
+
+    assert controller.release('room 1') == 2
+    assert controller.admit('room 1') == (False, 'too many commands are running')
+    assert controller.release('room 2') == 1
+    assert controller.admit('room 1') == (True, None)
+    assert controller.rejected == 3
+
+
+def test_admission_controller_room_limits():
+    controller = admission.AdmissionController(room_max_in_flight=1, room_rate_per_minute=2)
+
+    assert controller.admit('room 1') == (True, None)
+    assert controller.admit('room 1') == (False, 'too many commands are running in this room')
+    assert controller.admit('room 2') == (True, None)
+
+    controller.release('room 1')
+    assert controller.admit('room 1') == (True, None)
+    controller.release('room 1')
+    assert controller.admit('room 1') == (False, 'this room is sending commands too quickly')
+
+
+def test_is_high_priority():
+    assert admission.is_high_priority('/dzbot notify --entity users --name test')
+    assert not admission.is_high_priority('/dzbot list --entity users')
+    assert not admission.is_high_priority('/dzbot')
+    assert admission.is_high_priority('/dzbot list --entity eps --name Ops && override --schedule Ops --user test')
+
+
+@patch('src.dzbot.app.send_room_notification')
+@patch('src.dzbot.app.create_outbound_msg')
+def test_app_dzbot_busy(mock_create_outbound_msg, mock_send_room_notification):
+    mock_create_outbound_msg.return_value = 'test reply'
+    inbound_request = {'item': {'room': {'name': 'test room'}, 'message': {'message': '/dzbot list --entity users'}}}
+    client = app.test_client()
+
+    with patch('src.dzbot.app.admission.controller', admission.AdmissionController(max_in_flight=1, reserved=1)):
+        client.post('/', data=json.dumps(inbound_request), content_type='application/json')
+
+    assert not mock_create_outbound_msg.called
+    mock_send_room_notification.assert_called_once_with(
+        'test room', 'DZbot is busy (too many commands are running), please retry shortly', 'yellow')
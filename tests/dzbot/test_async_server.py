@@ -0,0 +1,142 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from src.dzbot import idempotency
+from src.dzbot.async_server import AsyncServer
+from src.outbound.circuit_breaker import CircuitOpen
+from src.value_objects.status import Status
+
+pytest.importorskip('aiohttp')
+
+
+async def _exchange(port, *requests):
+    """
+    send raw http/1.1 requests one after the other on a single connection
+
+    :return: the list of (status line, body) of the responses
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    responses = []
+    try:
+        for request in requests:
+            writer.write(request.encode('latin-1'))
+            status_line = (await reader.readline()).decode('latin-1').strip()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1')
+                if line in ('\r\n', ''):
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            responses.append((status_line, body.decode('utf-8')))
+    finally:
+        writer.close()
+
+    return responses
+
+
+def _post(body, chunked=False):
+    if chunked:
+        chunks = ''.join('{:x}\r\n{}\r\n'.format(len(body[i:i + 10]), body[i:i + 10]) for i in range(0, len(body), 10))
+        return 'POST / HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n{}0\r\n\r\n'.format(chunks)
+
+    return 'POST / HTTP/1.1\r\nHost: test\r\nContent-Length: {}\r\n\r\n{}'.format(len(body), body)
+
+
+def test_async_server():
+    loop = asyncio.new_event_loop()
+    release = []
+    handled = []
+
+    async def handler(inbound_request):
+        handled.append(inbound_request['message']['message'])
+        if len(handled) <= 2:
+            await release[0].wait()
+        return 'test outcome'
+
+    server_app = AsyncServer(max_pending=2, handler=handler)
+    payload = json.dumps({'item': {'message': {'message': '/dzbot roster'}}})
+
+    async def run():
+        runner, port = await server_app.start(port=0)
+        try:
+            release.append(asyncio.Event())
+            first = loop.create_task(_exchange(port, _post(payload)))
+            second = loop.create_task(_exchange(port, _post(payload, chunked=True)))
+            while server_app.pending < 2:
+                await asyncio.sleep(0.01)
+            busy = await _exchange(port, _post(payload))
+            release[0].set()
+            kept_alive = await _exchange(port, _post('not json'), _post(payload, chunked=True),
+                                         'GET /healthz HTTP/1.1\r\nHost: test\r\n\r\n')
+            return busy, kept_alive, await first, await second
+        finally:
+            await runner.cleanup()
+
+    try:
+        busy, kept_alive, first, second = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    assert busy[0][0] == 'HTTP/1.1 503 Service Unavailable'
+    assert first == [('HTTP/1.1 200 OK', 'test outcome')]
+    assert second == [('HTTP/1.1 200 OK', 'test outcome')]
+    assert kept_alive == [('HTTP/1.1 400 Bad Request', 'expected a hipchat webhook payload'),
+                          ('HTTP/1.1 200 OK', 'test outcome'), ('HTTP/1.1 200 OK', 'ok')]
+    assert handled == ['/dzbot roster'] * 3
+
+
+@patch('src.dzbot.async_server.send_room_notification_async')
+@patch('src.dzbot.async_server.create_traced_msg')
+@patch('src.dzbot.async_server.admit_command')
+def test_handle_delivery(mock_admit_command, mock_create_traced_msg, mock_send_room_notification_async):
+    idempotency.cache.discard((7, 'test id'))
+    mock_admit_command.side_effect = [None, 'DZbot is busy (too many commands are running), please retry shortly']
+    mock_create_traced_msg.return_value = 'command outcome'
+    replies = []
+    status = Status(True, 'request was successful')
+
+    async def send_room_notification_async(room, message, color):
+        replies.append((room, message, color))
+        return status
+
+    mock_send_room_notification_async.side_effect = send_room_notification_async
+    server_app = AsyncServer()
+    loop = asyncio.new_event_loop()
+
+    def delivery(message_id):
+        return {'room': {'id': 7, 'name': 'test room'}, 'message': {'id': message_id, 'message': '/dzbot roster'}}
+
+    try:
+        first = loop.run_until_complete(server_app.handle_delivery(delivery('test id')))
+        duplicate = loop.run_until_complete(server_app.handle_delivery(delivery('test id')))
+        busy = loop.run_until_complete(server_app.handle_delivery(delivery('other id')))
+    finally:
+        loop.close()
+
+    assert first == duplicate == busy == str(status)
+    assert replies == [(7, 'command outcome', 'purple'),
+                       (7, 'DZbot is busy (too many commands are running), please retry shortly', 'yellow')]
+    assert mock_create_traced_msg.call_count == 1
+    assert mock_admit_command.call_count == 2
+    assert idempotency.cache.discard((7, 'test id'))
+    assert not idempotency.cache.discard((7, 'other id'))
+
+
+@patch('src.dzbot.async_server.send_room_notification_async')
+def test_reply_circuit_open(mock_send_room_notification_async):
+    async def send_room_notification_async(room, message, color):
+        raise CircuitOpen('api.hipchat.com', 'room/*/notification', 30)
+
+    mock_send_room_notification_async.side_effect = send_room_notification_async
+    loop = asyncio.new_event_loop()
+    try:
+        outcome = loop.run_until_complete(AsyncServer().reply({'room': {'name': 'test room'}}, 'message', 'purple'))
+    finally:
+        loop.close()
+
+    assert isinstance(outcome, str)
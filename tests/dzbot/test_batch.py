@@ -0,0 +1,89 @@
+import json
+from unittest.mock import patch
+
+from src.dzbot import batch
+from src.dzbot.app import app
+from src.outbound import tracing
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.entity_resp import EntityResp
+from src.value_objects.status import Status
+
+
+def test_validate_query():
+    assert batch.validate_query({'type': 'coverage'}) is None
+    assert batch.validate_query({'type': 'oncalls', 'name': 'Operations'}) is None
+    assert batch.validate_query({'type': 'oncalls'}) == 'oncalls queries require a name'
+    assert batch.validate_query({'type': 'incidents'}).startswith('query type must be one of')
+
+
+@patch('src.dzbot.batch.list_ep_by_level')
+@patch('src.dzbot.batch.list_contact_methods')
+def test_run_batch(mock_list_contact_methods, mock_list_ep_by_level):
+    mock_list_contact_methods.return_value = EntitiesResp(Status(True, 'good'), {'phone': ['1112223333']})
+    mock_list_ep_by_level.return_value = EntityResp(Status(True, 'good'), {1: ['test user 1']})
+    queries = [{'type': 'contact_methods', 'name': 'Test User'}, {'type': 'oncalls', 'name': 'Operations'},
+               {'type': 'contact_methods', 'name': 'test  user'}, {'type': 'oncalls'}]
+
+    batch_resp = batch.run_batch(queries)
+
+    assert batch_resp.status.content == 'resolved 2 distinct queries out of 4'
+    assert mock_list_contact_methods.call_count == 1
+    assert [result['result'].get('entities') or result['result'].get('entity') for result in batch_resp.entities] == \
+        [{'phone': ['1112223333']}, {1: ['test user 1']}, {'phone': ['1112223333']}, None]
+    assert not batch_resp.entities[3]['result']['status']['success']
+
+
+@patch('src.dzbot.app.API_TOKEN', 'test token')
+@patch('src.dzbot.batch.ensure_oncalls')
+def test_api_batch(mock_ensure_oncalls):
+    mock_ensure_oncalls.return_value = EntitiesResp(Status(True, 'good'), ['Test: oncall level 2 does not exist'])
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer test token'}
+
+    response = client.post('/api/batch', data=json.dumps({'queries': [{'type': 'coverage'}]}),
+                           content_type='application/json', headers=headers)
+    assert response.status_code == 200
+    assert json.loads(response.data)['entities'][0]['result']['entities'] == ['Test: oncall level 2 does not exist']
+
+    response = client.post('/api/batch', data=json.dumps({'queries': []}), content_type='application/json',
+                           headers=headers)
+    assert response.status_code == 400
+
+    for body in ([{'type': 'coverage'}], 'coverage', None):
+        response = client.post('/api/batch', data=json.dumps(body), content_type='application/json', headers=headers)
+        assert response.status_code == 400
+        assert json.loads(response.data)['status'] == \
+            {'success': False, 'content': 'expected a json object with a list of \'queries\''}
+
+
+@patch('src.dzbot.batch.ensure_oncalls')
+def test_api_batch_unauthorized(mock_ensure_oncalls):
+    client = app.test_client()
+    body = json.dumps({'queries': [{'type': 'coverage'}]})
+
+    with patch('src.dzbot.app.API_TOKEN', 'test token'):
+        assert client.post('/api/batch', data=body, content_type='application/json').status_code == 401
+        assert client.post('/api/batch', data=body, content_type='application/json',
+                           headers={'Authorization': 'Bearer wrong token'}).status_code == 401
+    with patch('src.dzbot.app.API_TOKEN', None):
+        assert client.post('/api/batch', data=body, content_type='application/json',
+                           headers={'Authorization': 'Bearer '}).status_code == 401
+
+    assert not mock_ensure_oncalls.called
+
+
+def test_get_trace_requires_api_token():
+    client = app.test_client()
+    with tracing.trace('test-trace-request', 'webhook'):
+        pass
+
+    with patch('src.dzbot.app.API_TOKEN', 'test token'):
+        assert client.get('/traces/test-trace-request').status_code == 401
+        assert client.get('/traces/test-trace-request',
+                          headers={'Authorization': 'Bearer wrong token'}).status_code == 401
+
+        response = client.get('/traces/test-trace-request', headers={'Authorization': 'Bearer test token'})
+        assert response.status_code == 200
+        assert json.loads(response.data)['request_id'] == 'test-trace-request'
+        assert client.get('/traces/unknown-request',
+                          headers={'Authorization': 'Bearer test token'}).status_code == 404
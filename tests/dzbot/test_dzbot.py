@@ -1,8 +1,14 @@
+import collections
 from pprint import pformat
 from unittest.mock import patch
 
+import requests
+
 from src.dzbot import utils
+from src.outbound import circuit_breaker
+from src.pager_duty import directory
 from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.entity_resp import EntityResp
 from src.value_objects.status import Status
 
 
@@ -17,6 +23,80 @@ def test_create_outbound_msg(mock_list_all_entities):
     assert utils.create_outbound_msg(mock_inbound_request) == pformat(['Test oncall 1', 'Test oncall 2'], width=100)
 
 
+@patch('src.dzbot.utils.ensure_oncalls')
+def test_run_command_out_of_time(mock_ensure_oncalls):
+    mock_ensure_oncalls.side_effect = utils.deadline.DeadlineExceeded('test deadline')
+
+    with utils.deadline.start(25):
+        assert utils.run_command({}, ['ensure-oncalls']) == \
+            'DZbot ran out of time (25s budget) before the command finished, please retry'
+
+
+@patch('src.outbound.http.session.get')
+def test_run_command_upstream_timeout(mock_get):
+    mock_get.side_effect = requests.ReadTimeout('test timeout')
+
+    directory.clear()
+    with utils.deadline.start(25):
+        assert utils.run_command({}, ['list', '--entity', 'eps', '--name', 'Operations']) == \
+            'DZbot gave up waiting on an upstream call before the command finished, please retry (test timeout)'
+        assert utils.run_command({}, ['ensure-oncalls']) == \
+            'error: test timeout\ncould not retrieve all escalation_policies'
+    circuit_breaker.reset()
+
+
+@patch('src.dzbot.utils.ensure_oncalls')
+def test_run_command_circuit_open(mock_ensure_oncalls):
+    mock_ensure_oncalls.side_effect = utils.CircuitOpen('api.pagerduty.com', 'oncalls', 12)
+
+    assert utils.run_command({}, ['ensure-oncalls']) == \
+        'DZbot can\'t finish this command right now: api.pagerduty.com is unavailable (oncalls calls are failing), ' \
+        'retry in 12s'
+
+
+def test_plan_stages():
+    commands = utils.split_commands('list --entity eps --name Ops && roster && notify --entity eps && && '
+                                    'override --schedule Ops && list --entity users && oncall-at --at now'.split())
+
+    assert commands[:2] == [['list', '--entity', 'eps', '--name', 'Ops'], ['roster']]
+    assert utils.plan_stages(commands) == [[0, 1], [2], [3], [4, 5]]
+
+
+@patch('src.dzbot.utils.ensure_oncalls')
+@patch('src.dzbot.utils.list_all_entities')
+def test_create_outbound_msg_pipeline(mock_list_all_entities, mock_ensure_oncalls):
+    mock_list_all_entities.return_value = EntitiesResp(Status(True, 'success'), ['Test oncall 1'])
+    mock_ensure_oncalls.return_value = EntitiesResp(Status(True, 'success'), [])
+    mock_inbound_request = {
+        'message': {
+            'message': '/dzbot list --entity oncalls && ensure-oncalls'
+        }
+    }
+
+    assert utils.create_outbound_msg(mock_inbound_request) == \
+        "[1/2] /dzbot list --entity oncalls\n['Test oncall 1']\n\n[2/2] /dzbot ensure-oncalls\n[]"
+
+
 def test_strip_dzbot():
     assert utils._strip_dzbot('/dzbot list oncall: test user') == 'list oncall: test user'
     assert utils._strip_dzbot('/dzbot open the pod bay doors, hal') == 'open the pod bay doors, hal'
+
+
+@patch('src.dzbot.utils.list_specific_entity')
+@patch('src.dzbot.utils.roster.get_ep_levels')
+def test_pd_list_entity_from_roster(mock_get_ep_levels, mock_list_specific_entity):
+    mock_get_ep_levels.return_value = EntityResp(Status(True, 'as of 2018-03-01T00:00:00+00:00'),
+                                                 collections.OrderedDict({1: ['test user 1']}))
+
+    assert utils.pd_list_entity(utils.parse_args(['list', '--entity', 'eps', '--name', 'Operations'])) == \
+        "1: ['test user 1']\n(as of 2018-03-01T00:00:00+00:00)"
+    assert not mock_list_specific_entity.called
+
+
+@patch('src.dzbot.utils.forecast_coverage')
+def test_pd_coverage(mock_forecast_coverage):
+    mock_forecast_coverage.return_value = EntitiesResp(Status(True, 'forecast'), {})
+
+    assert utils.pd_coverage(utils.parse_args(['coverage', '--hours', '48', '--ep', 'Web', 'Escalation'])) == \
+        'no coverage issues\n(forecast)'
+    assert mock_forecast_coverage.call_args[0] == (48, 'Web Escalation')
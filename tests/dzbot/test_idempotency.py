@@ -0,0 +1,92 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from src.dzbot import idempotency
+from src.dzbot.app import app
+from src.outbound.circuit_breaker import CircuitOpen
+
+
+def test_idempotency_cache():
+    cache = idempotency.IdempotencyCache()
+
+    assert cache.begin('key') == (True, None)
+    assert cache.begin('key') == (False, None)
+    assert cache.finish('key', 'outcome') == 'outcome'
+    assert cache.begin('key') == (False, 'outcome')
+    assert cache.duplicates == 2
+
+    assert cache.discard('key')
+    assert cache.begin('key') == (True, None)
+
+
+def test_idempotency_cache_window():
+    cache = idempotency.IdempotencyCache(window_seconds=0)
+
+    assert cache.begin('key') == (True, None)
+    assert cache.begin('key') == (True, None)
+
+
+def test_idempotency_cache_max_deliveries():
+    cache = idempotency.IdempotencyCache(max_deliveries=2)
+
+    assert cache.begin('key 1') == (True, None)
+    assert cache.begin('key 2') == (True, None)
+    assert cache.begin('key 2') == (False, None)
+    assert cache.begin('key 3') == (True, None)
+    assert cache.begin('key 1') == (True, None)
+    assert cache.begin('key 3') == (False, None)
+
+
+def test_delivery_key():
+    assert idempotency.delivery_key({'room': {'id': 1, 'name': 'room'}, 'message': {'id': 'abc'}}) == (1, 'abc')
+    assert idempotency.delivery_key({'room': {'name': 'room'}, 'message': {'id': 'abc'}}) == ('room', 'abc')
+    assert idempotency.delivery_key({'room': {'id': 1}, 'message': {'message': '/dzbot'}}) is None
+
+
+@patch('src.dzbot.app.send_room_notification')
+@patch('src.dzbot.app.create_outbound_msg')
+def test_app_dzbot_duplicate_delivery(mock_create_outbound_msg, mock_send_room_notification):
+    mock_create_outbound_msg.return_value = 'successfully sent users incident to test user'
+    mock_send_room_notification.return_value = 'sent'
+    inbound_request = {'item': {'room': {'id': 1, 'name': 'test room'},
+                                'message': {'id': 'abc', 'message': '/dzbot notify --entity users'}}}
+    client = app.test_client()
+
+    with patch('src.dzbot.app.idempotency.cache', idempotency.IdempotencyCache()):
+        responses = [client.post('/', data=json.dumps(inbound_request), content_type='application/json')
+                     for _ in range(2)]
+
+    assert [response.data for response in responses] == [b'sent', b'sent']
+    assert mock_create_outbound_msg.call_count == 1
+    mock_send_room_notification.assert_called_once_with(1, 'successfully sent users incident to test user', 'purple')
+
+
+@patch('src.dzbot.app.send_room_notification')
+@patch('src.dzbot.app.create_outbound_msg')
+def test_app_dzbot_reply_circuit_open(mock_create_outbound_msg, mock_send_room_notification):
+    mock_create_outbound_msg.return_value = 'successfully sent users incident to test user'
+    mock_send_room_notification.side_effect = CircuitOpen('api.hipchat.com', 'room/*/notification', 30)
+    inbound_request = {'item': {'room': {'id': 1, 'name': 'test room'},
+                                'message': {'id': 'abc', 'message': '/dzbot notify --entity users'}}}
+    client = app.test_client()
+
+    with patch('src.dzbot.app.idempotency.cache', idempotency.IdempotencyCache()):
+        responses = [client.post('/', data=json.dumps(inbound_request), content_type='application/json')
+                     for _ in range(2)]
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert responses[0].data == responses[1].data
+    assert mock_create_outbound_msg.call_count == 1
+
+
+def test_shared_idempotency_cache():
+    table = MagicMock()
+    table.claim.side_effect = [(True, None), (False, {'value': 'outcome', 'age': 1, 'duplicates': 1})]
+    cache = idempotency.SharedIdempotencyCache(table)
+
+    assert cache.begin(('room', 'abc')) == (True, None)
+    assert cache.finish(('room', 'abc'), 'outcome') == 'outcome'
+    assert cache.begin(('room', 'abc')) == (False, 'outcome')
+    assert cache.duplicates == 1
+    assert table.claim.call_args[0] == ('delivery|room|abc', idempotency.WINDOW_SECONDS, None)
+    assert table.set_value.call_args[0] == ('delivery|room|abc', 'outcome')
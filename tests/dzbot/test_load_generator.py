@@ -0,0 +1,79 @@
+import collections
+
+from src.dzbot import load_generator
+from src.dzbot.stand_in import StandInServer
+from src.hipchat import hipchat
+from src.outbound.http import send
+from src.pager_duty import pd
+
+
+def test_parse_mix():
+    assert load_generator.parse_mix(['ensure-oncalls', 'list --entity eps --name EP 1=3']) == \
+        collections.OrderedDict([('ensure-oncalls', 1), ('list --entity eps --name EP 1', 3)])
+
+
+def test_summarize():
+    results = [('ensure-oncalls', 'ok', 0.1), ('ensure-oncalls', 'error', 0.3), ('list --entity users', 'busy', 0.2)]
+    report = load_generator.summarize(results, 2)
+
+    assert [row['command'] for row in report] == ['ensure-oncalls', 'list --entity users', 'all']
+    assert report[0]['error_rate'] == 0.5
+    assert report[0]['p50_ms'] == 100.0
+    assert report[0]['p99_ms'] == 300.0
+    assert report[2] == {'command': 'all', 'requests': 3, 'throughput': 1.5, 'error_rate': 0.3333,
+                         'busy_rate': 0.3333, 'p50_ms': 200.0, 'p95_ms': 300.0, 'p99_ms': 300.0}
+
+
+def test_stand_in():
+    stand_in = StandInServer()
+    url = stand_in.start()
+    try:
+        users = send('get', url + '/users', params={'query': 'test user 1', 'limit': 5}).json()
+        assert [user['name'] for user in users['users']] == ['Test User 1', 'Test User 10', 'Test User 11',
+                                                             'Test User 12', 'Test User 13']
+        assert users['more']
+
+        oncalls = send('get', url + '/oncalls', params={'escalation_policy_ids[]': ['PE1']}).json()['oncalls']
+        assert [oncall['user']['summary'] for oncall in oncalls] == ['Test User 2', 'Test User 3']
+
+        assert send('post', url + '/v2/room/test/notification', json={'color': 'purple'}).status_code == 204
+        assert stand_in.notifications == {'test': {'color': 'purple'}}
+    finally:
+        stand_in.stop()
+
+
+def test_run_load():
+    hosts = pd.api_host, hipchat.api_host
+    stand_in = StandInServer()
+    load_generator.point_clients_at(stand_in.start())
+    try:
+        resp = load_generator.run_load(load_generator.app, stand_in, mix={'list --entity eps --name EP 1': 1},
+                                       rate=20, duration=0.2)
+    finally:
+        stand_in.stop()
+        load_generator.point_clients_at(hosts[0])
+        hipchat.api_host = hosts[1]
+
+    assert resp.status.success
+    assert resp.entities[-1]['requests'] == 4
+    assert resp.entities[-1]['error_rate'] == 0
+
+
+def test_run_load_notify():
+    hosts = pd.api_host, hipchat.api_host
+    stand_in = StandInServer()
+    load_generator.point_clients_at(stand_in.start())
+    command = 'notify --entity users --name Test User 1 --service Service 1 --title load test notify --message test'
+    try:
+        resp = load_generator.run_load(load_generator.app, stand_in, mix={command: 1}, rate=20, duration=0.2)
+    finally:
+        stand_in.stop()
+        load_generator.point_clients_at(hosts[0])
+        hipchat.api_host = hosts[1]
+
+    assert resp.entities[-1]['error_rate'] == 0
+    assert len(stand_in.incidents) == 1
+    assert stand_in.incidents[0]['service'] == {'id': 'PS1', 'type': 'service'}
+    replies = sorted(reply['message'] for reply in stand_in.notifications.values())
+    assert replies[-1] == 'successfully sent users incident to Test User 1'
+    assert all(reply.startswith('not sending a duplicate incident') for reply in replies[:-1])
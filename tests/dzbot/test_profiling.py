@@ -0,0 +1,50 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from src.dzbot import profiling
+from src.dzbot.utils import create_outbound_msg
+from src.outbound import context, http
+
+
+def test_profiling_requested(monkeypatch):
+    monkeypatch.delenv('DZBOT_PROFILE', raising=False)
+    assert profiling.profiling_requested(['list', '--profile']) == (profiling.REPLY, ['list'])
+    assert profiling.profiling_requested(['list']) == (None, ['list'])
+
+    monkeypatch.setenv('DZBOT_PROFILE', 'true')
+    assert profiling.profiling_requested(['list']) == (profiling.LOG, ['list'])
+    assert profiling.profiling_requested(['list', '--profile']) == (profiling.REPLY, ['list'])
+
+
+@patch('src.outbound.http.session.get')
+def test_profile_call(mock_get):
+    mock_get.return_value.status_code = 200
+
+    def command(url):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            executor.submit(context.wrap(http.send), 'get', url).result()
+            executor.submit(http.send, 'get', url).result()
+        unrelated = threading.Thread(target=http.send, args=('get', url))
+        unrelated.start()
+        unrelated.join()
+        http.send('get', url)
+        return 'done'
+
+    result, summary = profiling.profile_call(command, 'https://test.com')
+
+    assert result == 'done'
+    assert summary.startswith('profiled command: ')
+    assert '2 outbound calls' in summary
+
+
+@patch('src.dzbot.utils.run_command')
+def test_create_outbound_msg_profiled(mock_run_command, monkeypatch):
+    mock_run_command.return_value = 'command outcome'
+    inbound_request = {'message': {'message': '/dzbot roster --profile'}}
+
+    monkeypatch.delenv('DZBOT_PROFILE', raising=False)
+    assert create_outbound_msg(inbound_request).startswith('command outcome\n(profiled ')
+
+    monkeypatch.setenv('DZBOT_PROFILE', 'true')
+    assert create_outbound_msg({'message': {'message': '/dzbot roster'}}) == 'command outcome'
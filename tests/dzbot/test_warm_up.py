@@ -0,0 +1,53 @@
+from unittest.mock import patch
+
+import requests
+
+from src.dzbot import warm_up
+from src.outbound.circuit_breaker import CircuitOpen
+from src.value_objects.status import Status
+
+
+@patch('src.dzbot.warm_up.directory.is_fresh')
+@patch('src.dzbot.warm_up.hipchat.room_directory_is_fresh')
+@patch('src.dzbot.warm_up.hipchat.load_room_directory')
+@patch('src.dzbot.warm_up.pd.load_directory')
+@patch('src.dzbot.warm_up.open_connection')
+@patch('src.dzbot.warm_up.check_stdout_stderr')
+def test_warm_up(mock_check_stdout_stderr, mock_open_connection, mock_load_directory, mock_load_room_directory,
+                 mock_room_directory_is_fresh, mock_is_fresh):
+    mock_open_connection.return_value = True
+    mock_load_directory.return_value = Status(True, 'good')
+    mock_load_room_directory.return_value = Status(True, 'good')
+    mock_room_directory_is_fresh.return_value = False
+    mock_is_fresh.return_value = False
+
+    result = warm_up.warm_up()
+
+    assert result.status.success
+    assert set(result.entity) == {'cli parser', 'cli child process', 'pager duty connection', 'hipchat connection',
+                                  'capability descriptor', 'hipchat room directory', 'pager duty directory', 'total'}
+
+    mock_load_directory.return_value = Status(False, 'pager duty is down')
+    assert not warm_up.warm_up().status.success
+
+
+@patch('src.dzbot.warm_up.directory.is_fresh')
+@patch('src.dzbot.warm_up.hipchat.room_directory_is_fresh')
+@patch('src.dzbot.warm_up.hipchat.load_room_directory')
+@patch('src.dzbot.warm_up.pd.load_directory')
+@patch('src.dzbot.warm_up.open_connection')
+@patch('src.dzbot.warm_up.check_stdout_stderr')
+def test_warm_up_errors_and_fresh_directories(mock_check_stdout_stderr, mock_open_connection, mock_load_directory,
+                                              mock_load_room_directory, mock_room_directory_is_fresh, mock_is_fresh):
+    mock_open_connection.side_effect = [requests.Timeout('pager duty timed out'), True]
+    mock_room_directory_is_fresh.return_value = False
+    mock_load_room_directory.side_effect = CircuitOpen('api.hipchat.com', 'rooms', 30)
+    mock_is_fresh.return_value = True
+
+    result = warm_up.warm_up()
+
+    assert result.status.content == \
+        'warm up finished with errors: pager duty connection: pager duty timed out; ' \
+        'hipchat room directory: api.hipchat.com is unavailable (rooms calls are failing), retry in 30s'
+    assert 'pager duty directory' in result.entity
+    assert not mock_load_directory.called
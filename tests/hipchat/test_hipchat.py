@@ -1,6 +1,8 @@
 from unittest.mock import patch
 
 from src.hipchat import hipchat
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
 
 
 def test_get_capabilities_descriptor():
@@ -9,7 +11,7 @@ def test_get_capabilities_descriptor():
     assert result.status.success
 
 
-@patch('src.hipchat.hipchat.requests.get')
+@patch('src.hipchat.hipchat.send')
 def test_get_all_rooms(mock_get):
     mock_get.return_value.ok = True
     response = hipchat._get_all_rooms()
@@ -17,7 +19,7 @@ def test_get_all_rooms(mock_get):
     assert response.status.success
 
 
-@patch('src.hipchat.hipchat.requests.post')
+@patch('src.hipchat.hipchat.send')
 def test_create_web_hook(mock_post):
     mock_post.return_value.ok = True
     response = hipchat.create_web_hook(123456, 'test pattern', 'https://testsendurl.com', 'room_message')
@@ -25,7 +27,7 @@ def test_create_web_hook(mock_post):
     assert response.success
 
 
-@patch('src.hipchat.hipchat.requests.post')
+@patch('src.hipchat.hipchat.send')
 def test_send_room_notification(mock_post):
     mock_post.return_value.ok = True
     response = hipchat.send_room_notification(123456, 'test msg', 'blue')
@@ -33,9 +35,62 @@ def test_send_room_notification(mock_post):
     assert response.success
 
 
-@patch('src.hipchat.hipchat.requests.delete')
+@patch('src.hipchat.hipchat.send')
 def test_del_room_webhook(mock_post):
     mock_post.return_value.ok = True
     response = hipchat._del_room_webhook(123456, 654321)
 
     assert response.success
+
+
+@patch('src.hipchat.hipchat._get_all_rooms')
+def test_list_all_rooms(mock_get_all_rooms):
+    first_page = EntitiesResp(Status(True, 'good'), {'items': [{'id': 1}, {'id': 2}], 'links': {'next': 'next url'}})
+    last_page = EntitiesResp(Status(True, 'good'), {'items': [{'id': 3}], 'links': {}})
+    mock_get_all_rooms.side_effect = [first_page, last_page]
+
+    response = hipchat.list_all_rooms(page_size=2)
+
+    assert response.entities == [{'id': 1}, {'id': 2}, {'id': 3}]
+    assert mock_get_all_rooms.call_args[1]['start_index'] == 2
+
+
+def test_load_capabilities_descriptor():
+    hipchat.get_capabilities_descriptor('test webhook url')
+
+    assert hipchat.load_capabilities_descriptor()['capabilities']['webhook'][0]['url'] == ''
+
+
+@patch('src.hipchat.hipchat.send')
+@patch('src.hipchat.hipchat._get_all_rooms')
+def test_resolve_room_id(mock_get_all_rooms, mock_send):
+    hipchat.clear_room_directory()
+    mock_get_all_rooms.return_value = EntitiesResp(Status(True, 'good'), {'items': [{'id': 7, 'name': 'Ops Room'}],
+                                                                          'links': {}})
+    mock_send.return_value.ok = True
+
+    assert hipchat.create_web_hook('ops room', 'test pattern', 'https://testsendurl.com', 'room_message').success
+    assert mock_send.call_args[1]['url'].endswith('/room/7/webhook')
+    assert hipchat.send_room_notification('ops room', 'test msg', 'blue').success
+    assert mock_send.call_args[1]['url'].endswith('/room/ops room/notification')
+    assert hipchat.resolve_room_id('new room') == 'new room'
+    assert hipchat.resolve_room_id(123456) == 123456
+    assert mock_get_all_rooms.call_count == 1
+    hipchat.clear_room_directory()
+
+
+@patch('src.hipchat.hipchat.send')
+@patch('src.hipchat.hipchat._get_all_room_webhooks')
+def test_get_room_webhooks(mock_get_all_room_webhooks, mock_send):
+    hipchat.clear_room_directory()
+    mock_get_all_room_webhooks.return_value = EntitiesResp(Status(True, 'good'), {'items': [{'id': 1, 'name': 'old'}]})
+    mock_send.return_value.ok = True
+    mock_send.return_value.json.return_value = {'id': 2}
+
+    assert hipchat.get_room_webhooks(7).entities == [{'id': 1, 'name': 'old'}]
+    assert hipchat.create_web_hook(7, 'test pattern', 'https://testsendurl.com', 'room_message', 'DZbot').success
+    assert hipchat._del_room_webhook(7, 1).success
+    assert hipchat.get_room_webhooks(7).entities == [{'id': 2, 'name': 'DZbot', 'pattern': 'test pattern',
+                                                      'url': 'https://testsendurl.com', 'event': 'room_message'}]
+    assert mock_get_all_room_webhooks.call_count == 1
+    hipchat.clear_room_directory()
@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+from src.hipchat import webhook_reconciler
+from src.outbound.circuit_breaker import CircuitOpen
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+DESIRED = {'url': 'https://dzbot.com', 'pattern': '^/[dD][zZ][bB][oO][tT]', 'event': 'room_message', 'name': 'DZbot'}
+
+
+def test_get_desired_webhook():
+    assert webhook_reconciler.get_desired_webhook('https://dzbot.com') == DESIRED
+
+
+def test_plan_room_webhooks():
+    stale = dict(DESIRED, id=1, url='https://old-dzbot.com')
+    current = dict(DESIRED, id=2)
+    duplicate = dict(DESIRED, id=3)
+    unrelated = {'id': 4, 'name': 'other', 'pattern': '^/other', 'url': 'https://other.com', 'event': 'room_message'}
+
+    assert webhook_reconciler.plan_room_webhooks([], DESIRED) == [('create', DESIRED)]
+    assert webhook_reconciler.plan_room_webhooks([current, unrelated], DESIRED) == []
+    assert webhook_reconciler.plan_room_webhooks([stale, current, duplicate], DESIRED) == [('delete', 1), ('delete', 3)]
+
+
+@patch('src.hipchat.webhook_reconciler.create_web_hook')
+@patch('src.hipchat.webhook_reconciler.get_room_webhooks')
+def test_reconcile_room_dry_run(mock_get_room_webhooks, mock_create_web_hook):
+    mock_get_room_webhooks.return_value = EntitiesResp(Status(True, 'good'), [])
+
+    result = webhook_reconciler.reconcile_room({'id': 1, 'name': 'test room'}, DESIRED, dry_run=True)
+
+    assert result == {'room': 'test room', 'actions': ['create webhook DZbot'], 'errors': []}
+    assert not mock_create_web_hook.called
+
+
+@patch('src.hipchat.webhook_reconciler._del_room_webhook')
+@patch('src.hipchat.webhook_reconciler.create_web_hook')
+@patch('src.hipchat.webhook_reconciler.get_room_webhooks')
+@patch('src.hipchat.webhook_reconciler.list_all_rooms')
+def test_reconcile_all_rooms(mock_list_all_rooms, mock_get_room_webhooks, mock_create_web_hook,
+                             mock_del_room_webhook):
+    mock_list_all_rooms.return_value = EntitiesResp(Status(True, 'good'), [{'id': 1, 'name': 'room 1'},
+                                                                           {'id': 2, 'name': 'room 2'}])
+    mock_get_room_webhooks.side_effect = lambda room_id: EntitiesResp(
+        Status(True, 'good'), [] if room_id == 1 else [dict(DESIRED, id=5)])
+    mock_create_web_hook.return_value = Status(True, 'good')
+
+    response = webhook_reconciler.reconcile_all_rooms('https://dzbot.com', max_workers=2)
+
+    assert response.status.success
+    assert response.entities == [{'room': 'room 1', 'actions': ['create webhook DZbot'], 'errors': []}]
+    mock_create_web_hook.assert_called_once_with(1, DESIRED['pattern'], DESIRED['url'], DESIRED['event'], 'DZbot')
+    assert not mock_del_room_webhook.called
+
+
+@patch('src.hipchat.webhook_reconciler.create_web_hook')
+@patch('src.hipchat.webhook_reconciler.get_room_webhooks')
+@patch('src.hipchat.webhook_reconciler.list_all_rooms')
+def test_reconcile_all_rooms_request_error(mock_list_all_rooms, mock_get_room_webhooks, mock_create_web_hook):
+    mock_list_all_rooms.return_value = EntitiesResp(Status(True, 'good'), [{'id': 1, 'name': 'room 1'},
+                                                                           {'id': 2, 'name': 'room 2'}])
+    mock_get_room_webhooks.return_value = EntitiesResp(Status(True, 'good'), [])
+
+    def create_web_hook(room_id, *args):
+        if room_id == 1:
+            raise CircuitOpen('hipchat', 'room webhooks', 30)
+        return Status(True, 'good')
+
+    mock_create_web_hook.side_effect = create_web_hook
+
+    response = webhook_reconciler.reconcile_all_rooms('https://dzbot.com', max_workers=1)
+
+    assert not response.status.success
+    assert response.status.content == 'reconciled 2 rooms, 2 changed, 1 failed'
+    assert response.entities == [
+        {'room': 'room 1', 'actions': ['create webhook DZbot'],
+         'errors': ['could not reach hipchat: hipchat is unavailable (room webhooks calls are failing), retry in 30s']},
+        {'room': 'room 2', 'actions': ['create webhook DZbot'], 'errors': []},
+    ]
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from src.dzbot.stand_in import StandInServer
+from src.outbound import async_http, circuit_breaker, deadline, http
+
+
+def test_run_blocking():
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def blocking_call(value):
+        return value, deadline.budget(), threading.get_ident()
+
+    async def run():
+        with deadline.start(5):
+            return (await async_http.run_blocking(blocking_call, 'test value'),
+                    await async_http.run_blocking(blocking_call, value='test value', executor=executor))
+
+    try:
+        (value, budget, thread_id), (_, _, executor_thread_id) = loop.run_until_complete(run())
+    finally:
+        loop.close()
+        executor.shutdown()
+
+    assert (value, budget) == ('test value', 5)
+    assert thread_id != threading.get_ident()
+    assert executor_thread_id not in (thread_id, threading.get_ident())
+
+
+def test_send():
+    pytest.importorskip('aiohttp')
+    stand_in = StandInServer()
+    url = stand_in.start()
+    calls = []
+    listener = http.add_listener(lambda method, url, elapsed, response: calls.append((method, response.status_code)))
+    loop = asyncio.new_event_loop()
+
+    async def run():
+        try:
+            return (await async_http.send('post', url + '/v2/room/test/notification', json={'color': 'purple'}),
+                    await async_http.send('get', url + '/users', params={'query': 'test user 1', 'limit': 1}))
+        finally:
+            await async_http.close_session()
+
+    try:
+        notification, users = loop.run_until_complete(run())
+    finally:
+        http.remove_listener(listener)
+        loop.close()
+        stand_in.stop()
+
+    assert notification.status_code == 204 and notification.ok
+    assert stand_in.notifications == {'test': {'color': 'purple'}}
+    assert [user['name'] for user in users.json()['users']] == ['Test User 1']
+    assert calls == [('post', 204), ('get', 200)]
+
+
+def test_send_connection_error():
+    pytest.importorskip('aiohttp')
+    stand_in = StandInServer()
+    url = stand_in.url
+    stand_in.server_close()
+    loop = asyncio.new_event_loop()
+
+    async def run():
+        try:
+            await async_http.send('get', url + '/users', timeout=1)
+        finally:
+            await async_http.close_session()
+
+    try:
+        with pytest.raises(requests.ConnectionError):
+            loop.run_until_complete(run())
+    finally:
+        loop.close()
+        circuit_breaker.reset()
@@ -0,0 +1,89 @@
+import io
+import zlib
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from src.outbound import cassette, http
+
+
+def _response(status_code, content):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers['content-type'] = 'application/json'
+    return response
+
+
+def test_request_key():
+    assert cassette.request_key('GET', 'https://test.com', {'b': 1, 'a': 2}) == \
+        cassette.request_key('get', 'https://test.com', {'a': 2, 'b': 1})
+    assert cassette.request_key('get', 'https://test.com', {'query': 'a'}) != \
+        cassette.request_key('get', 'https://test.com', {'query': 'b'})
+
+
+@patch('src.outbound.http.session.get')
+def test_record_and_replay(mock_get, tmpdir):
+    path = str(tmpdir.join('cassettes', 'test.jsonl.gz'))
+    mock_get.side_effect = [_response(200, b'{"users": [1]}'), _response(200, b'{"users": [2]}'),
+                            _response(404, b'{"error": "not found"}')]
+
+    cassette.start(cassette.RECORD, path)
+    http.send('get', 'https://test.com/users', params={'limit': 100}, headers={'Authorization': 'secret'})
+    http.send('get', 'https://test.com/users', params={'limit': 100})
+    http.send('get', 'https://test.com/users/1')
+    cassette.stop()
+
+    assert cassette.start(cassette.REPLAY, path, keep_delays=False) == 3
+    try:
+        assert http.send('get', 'https://test.com/users', params={'limit': 100}).json() == {'users': [1]}
+        assert http.send('get', 'https://test.com/users', params={'limit': 100}).json() == {'users': [2]}
+        assert http.send('get', 'https://test.com/users', params={'limit': 100}).json() == {'users': [1]}
+
+        not_found = http.send('get', 'https://test.com/users/1')
+        assert not not_found.ok and not_found.json() == {'error': 'not found'}
+
+        with pytest.raises(cassette.CassetteMiss):
+            http.send('get', 'https://test.com/services')
+    finally:
+        cassette.stop()
+
+    assert mock_get.call_count == 3
+
+
+@patch('src.outbound.http.session.get')
+def test_record_single_gzip_member(mock_get, tmpdir):
+    path = str(tmpdir.join('test.jsonl.gz'))
+    mock_get.side_effect = lambda url, **kwargs: _response(200, b'{"users": []}')
+
+    cassette.start(cassette.RECORD, path)
+    for i in range(3):
+        http.send('get', 'https://test.com/users/{}'.format(i))
+    cassette.stop()
+
+    with open(path, 'rb') as cassette_file:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        lines = decompressor.decompress(cassette_file.read()).splitlines()
+    assert len(lines) == 3
+    assert decompressor.eof and decompressor.unused_data == b''
+
+
+@patch('src.outbound.http.session.get')
+def test_record_streamed_response(mock_get, tmpdir):
+    path = str(tmpdir.join('test.jsonl.gz'))
+    streamed = _response(200, False)
+    streamed.raw = io.BytesIO(b'{"users": [1, 2]}')
+    mock_get.return_value = streamed
+
+    cassette.start(cassette.RECORD, path)
+    response = http.send('get', 'https://test.com/users', stream=True)
+    assert not response._content_consumed
+    assert b''.join(response.iter_content(chunk_size=4)) == b'{"users": [1, 2]}'
+    cassette.stop()
+
+    cassette.start(cassette.REPLAY, path, keep_delays=False)
+    try:
+        assert http.send('get', 'https://test.com/users', stream=True).json() == {'users': [1, 2]}
+    finally:
+        cassette.stop()
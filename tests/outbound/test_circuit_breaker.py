@@ -0,0 +1,91 @@
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from src.outbound import circuit_breaker, deadline, http
+from src.outbound.circuit_breaker import CircuitBreaker, CircuitOpen
+
+
+def test_endpoint_family():
+    assert circuit_breaker.endpoint_family('https://api.pagerduty.com/users/P1/contact_methods') == \
+        ('api.pagerduty.com', 'users/*/contact_methods')
+    assert circuit_breaker.endpoint_family('https://api.pagerduty.com/users?query=test') == \
+        ('api.pagerduty.com', 'users')
+    assert circuit_breaker.endpoint_family('https://api.hipchat.com/v2/room/test/notification') == \
+        ('api.hipchat.com', 'room/*/notification')
+    assert circuit_breaker.endpoint_family('https://api.hipchat.com/v2/room/1/webhook/2') == \
+        ('api.hipchat.com', 'room/*/webhook/*')
+    assert circuit_breaker.endpoint_family('https://api.hipchat.com') == ('api.hipchat.com', '')
+
+
+def test_breaker_opens_and_recovers():
+    breaker = CircuitBreaker('api.pagerduty.com', 'users', failure_threshold=2, reset_seconds=30)
+    breaker.allow()
+    assert breaker.record(False) == circuit_breaker.CLOSED
+    assert breaker.record(False) == circuit_breaker.OPEN
+
+    with pytest.raises(CircuitOpen) as e:
+        breaker.allow()
+    assert str(e.value) == 'api.pagerduty.com is unavailable (users calls are failing), retry in 30s'
+
+    breaker.opened_at -= 30
+    breaker.allow()
+    assert breaker.state == circuit_breaker.HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    assert breaker.record(False) == circuit_breaker.OPEN
+
+    breaker.opened_at -= 30
+    breaker.allow()
+    assert breaker.record(True) == circuit_breaker.CLOSED
+    breaker.allow()
+
+
+@patch('src.outbound.http.session.get')
+def test_send_fails_fast_while_open(mock_get):
+    circuit_breaker.reset()
+    mock_get.return_value.status_code = 503
+    for _ in range(circuit_breaker.FAILURE_THRESHOLD):
+        http.send('get', 'https://test.com/oncalls')
+
+    with pytest.raises(CircuitOpen):
+        http.send('get', 'https://test.com/oncalls', params={'limit': 100})
+    assert mock_get.call_count == circuit_breaker.FAILURE_THRESHOLD
+
+    mock_get.side_effect = requests.ConnectionError('test error')
+    with pytest.raises(requests.ConnectionError):
+        http.send('get', 'https://test.com/users')
+    assert circuit_breaker.states() == {'test.com/oncalls': circuit_breaker.OPEN,
+                                        'test.com/users': circuit_breaker.CLOSED}
+
+    circuit_breaker.reset()
+
+
+@patch('src.outbound.http.session.get')
+def test_deadline_timeouts_leave_breaker_closed(mock_get):
+    circuit_breaker.reset()
+    mock_get.side_effect = requests.ReadTimeout('test timeout')
+    for _ in range(circuit_breaker.FAILURE_THRESHOLD + 1):
+        with deadline.start(0.2), pytest.raises(requests.Timeout):
+            http.send('get', 'https://test.com/users')
+
+    assert circuit_breaker.states() == {'test.com/users': circuit_breaker.CLOSED}
+
+    for _ in range(circuit_breaker.FAILURE_THRESHOLD):
+        with deadline.start(25), pytest.raises(requests.Timeout):
+            http.send('get', 'https://test.com/users')
+
+    assert circuit_breaker.states() == {'test.com/users': circuit_breaker.OPEN}
+    circuit_breaker.reset()
+
+
+def test_release_hands_back_half_open_probe():
+    breaker = CircuitBreaker('api.pagerduty.com', 'users', failure_threshold=1, reset_seconds=30)
+    breaker.record(False)
+    breaker.opened_at -= 30
+    breaker.allow()
+
+    assert breaker.release() == circuit_breaker.OPEN
+    breaker.allow()
+    assert breaker.state == circuit_breaker.HALF_OPEN
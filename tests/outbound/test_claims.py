@@ -0,0 +1,95 @@
+import copy
+import json
+import time
+from unittest.mock import patch
+
+from src.outbound.claims import ClaimTable
+
+
+class _ConditionalCheckFailedException(Exception):
+    pass
+
+
+class _FakeDynamoDB():
+    class exceptions():
+        ConditionalCheckFailedException = _ConditionalCheckFailedException
+
+    def __init__(self):
+        self.items = {}
+
+    def put_item(self, TableName, Item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues):
+        existing = self.items.get(Item['key']['S'])
+        if existing and 'expires_at' in existing and \
+                int(existing['expires_at']['N']) > int(ExpressionAttributeValues[':now']['N']):
+            raise _ConditionalCheckFailedException()
+        self.items[Item['key']['S']] = copy.deepcopy(Item)
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, ReturnValues=None,
+                    ExpressionAttributeNames=None, ConditionExpression=None):
+        # like dynamodb, an update without a condition creates the item if it doesn't exist
+        item = self.items.get(Key['key']['S'])
+        if ConditionExpression is not None:
+            exists = item is not None
+            if 'expires_at > :now' in ConditionExpression:
+                exists = exists and int(item['expires_at']['N']) > int(ExpressionAttributeValues[':now']['N'])
+            if not exists:
+                raise _ConditionalCheckFailedException()
+
+        item = self.items.setdefault(Key['key']['S'], {'key': Key['key']})
+        if UpdateExpression.startswith('ADD'):
+            item['duplicates'] = {'N': str(int(item.get('duplicates', {'N': '0'})['N']) + 1)}
+        else:
+            item['value'] = ExpressionAttributeValues[':value']
+        return {'Attributes': copy.deepcopy(item)}
+
+    def delete_item(self, TableName, Key, ReturnValues):
+        item = self.items.pop(Key['key']['S'], None)
+        return {'Attributes': item} if item else {}
+
+
+def test_claim_table():
+    table = ClaimTable('test table', client=_FakeDynamoDB())
+
+    assert table.claim('key', 60, {'sender': 'Sender 1'}) == (True, None)
+    is_first, claim = table.claim('key', 60, {'sender': 'Sender 2'})
+    assert not is_first
+    assert (claim['value'], claim['duplicates']) == ({'sender': 'Sender 1'}, 1)
+
+    assert table.set_value('key', 'outcome')
+    assert table.claim('key', 60, None)[1]['value'] == 'outcome'
+
+    assert table.release('key')
+    assert not table.release('key')
+    assert table.claim('key', 60, None) == (True, None)
+    assert table.release('key')
+    assert not table.set_value('key', 'outcome')
+    assert 'key' not in table._client.items
+
+
+def test_claim_table_window():
+    table = ClaimTable('test table', client=_FakeDynamoDB())
+    table.claim('key', 60, None)
+
+    with patch('src.outbound.claims.time.time', return_value=time.time() + 61):
+        assert table.claim('key', 60, None) == (True, None)
+
+
+def test_claim_table_release_race():
+    client = _FakeDynamoDB()
+    table = ClaimTable('test table', client=client)
+    table.claim('key', 60, {'sender': 'Sender 1'})
+    put_item = client.put_item
+
+    def put_item_then_release(**kwargs):
+        # the winning claim is released (i.e. its notify failed) after this put fails and before the update
+        try:
+            put_item(**kwargs)
+        except _ConditionalCheckFailedException:
+            table.release('key')
+            raise
+
+    with patch.object(client, 'put_item', side_effect=put_item_then_release, autospec=False) as mock_put_item:
+        assert table.claim('key', 60, {'sender': 'Sender 2'}) == (True, None)
+    assert mock_put_item.call_count == 2
+    assert json.loads(client.items['key']['value']['S']) == {'sender': 'Sender 2'}
+    assert table.claim('key', 60, None)[1]['value'] == {'sender': 'Sender 2'}
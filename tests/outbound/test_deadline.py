@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from src.outbound import context, deadline, http
+
+
+def test_timeout_without_deadline():
+    assert deadline.remaining() is None
+    assert deadline.timeout() == deadline.DEFAULT_TIMEOUT_SECONDS
+
+
+def test_timeout_within_deadline():
+    with deadline.start(2):
+        assert 0 < deadline.timeout() <= 2
+        assert deadline.budget() == 2
+        with deadline.start(60):
+            assert deadline.timeout() == deadline.DEFAULT_TIMEOUT_SECONDS
+        assert deadline.budget() == 2
+
+    assert deadline.remaining() is None
+
+
+def test_check_after_deadline():
+    with deadline.start(0):
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check()
+
+
+def test_wrap_carries_deadline_into_threads():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with deadline.start(5):
+            wrapped = executor.submit(context.wrap(deadline.budget)).result()
+            unwrapped = executor.submit(deadline.budget).result()
+
+    assert wrapped == 5
+    assert unwrapped is None
+
+
+@patch('src.outbound.http.session.get')
+def test_send_after_deadline(mock_get):
+    with deadline.start(0):
+        with pytest.raises(deadline.DeadlineExceeded):
+            http.send('get', 'https://test.com')
+
+    mock_get.assert_not_called()
+
+
+@patch('src.outbound.http.session.get')
+def test_send_timeout_at_deadline(mock_get):
+    mock_get.side_effect = requests.ReadTimeout('test timeout')
+    with deadline.start(60):
+        with pytest.raises(requests.ReadTimeout) as e:
+            http.send('get', 'https://test.com')
+    assert not isinstance(e.value, deadline.DeadlineExceeded)
+
+    with patch('src.outbound.deadline.remaining', return_value=-1):
+        with pytest.raises(deadline.DeadlineExceeded):
+            http.send('get', 'https://test.com', timeout=1)
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from src.outbound.hedging import Hedger
+
+
+def test_threshold():
+    hedger = Hedger(percentile=90, min_samples=10)
+    for latency in range(1, 10):
+        hedger.record('users', latency)
+    assert hedger.threshold('users') is None
+
+    hedger.record('users', 10)
+    assert hedger.threshold('users') == 9
+    assert hedger.threshold('oncalls') is None
+
+
+def test_call_hedges_slow_request():
+    hedger = Hedger(min_samples=1, budget_ratio=1)
+    hedger.record('users', 0.01)
+    release_primary = threading.Event()
+    calls = []
+
+    def get():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            release_primary.wait(5)
+            return 'primary'
+        return 'hedge'
+
+    assert hedger.call('users', get) == 'hedge'
+    release_primary.set()
+    assert hedger.stats() == {'requests': 1, 'hedged': 1, 'hedge_wins': 1, 'over_budget': 0, 'hedge_rate': 1.0}
+
+
+def test_call_over_budget():
+    hedger = Hedger(min_samples=1, budget_ratio=0.5)
+    hedger.record('users', 0)
+    release = threading.Event()
+
+    def get():
+        release.wait(0.05)
+        return 'response'
+
+    assert hedger.call('users', get) == 'response'
+    assert hedger.stats()['over_budget'] == 1
+    assert hedger.stats()['hedged'] == 0
+
+
+def test_call_without_hedge_runs_inline():
+    hedger = Hedger()
+
+    assert hedger.call('users', threading.current_thread) is threading.current_thread()
+    assert len(hedger._latencies['users']) == 1
+
+
+def test_call_threshold_excludes_queueing():
+    hedger = Hedger(min_samples=1, budget_ratio=1, max_workers=1)
+    hedger.record('users', 0.2)
+    release_worker = threading.Event()
+    hedger._executor.submit(release_worker.wait, 5)
+    threading.Timer(0.15, release_worker.set).start()
+
+    def get():
+        threading.Event().wait(0.1)
+        return threading.current_thread()
+
+    assert hedger.call('users', get) is not threading.current_thread()
+    assert hedger.stats()['hedged'] == 0
+    assert hedger._latencies['users'][-1] < 0.15
+
+
+def test_call_runs_inline_when_pool_is_busy():
+    hedger = Hedger(min_samples=1, budget_ratio=1, max_workers=1)
+    hedger.record('users', 0.05)
+    release_worker = threading.Event()
+    hedger._executor.submit(release_worker.wait, 5)
+
+    try:
+        assert hedger.call('users', threading.current_thread) is threading.current_thread()
+    finally:
+        release_worker.set()
+    assert hedger.stats()['hedged'] == 0
+
+
+def test_call_errors():
+    hedger = Hedger(min_samples=1, budget_ratio=1)
+    hedger.record('users', 0.01)
+    calls = []
+
+    def get():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            threading.Event().wait(0.05)
+            raise ConnectionError('test error')
+        return 'hedge'
+
+    assert hedger.call('users', get) == 'hedge'
+    calls.clear()
+    with pytest.raises(ConnectionError):
+        Hedger().call('users', get)
@@ -0,0 +1,28 @@
+from unittest.mock import patch
+
+import pytest
+
+from src.outbound import http
+
+
+@patch('src.outbound.http.session.get')
+def test_send(mock_get):
+    mock_get.return_value.ok = True
+
+    assert http.send('get', 'https://test.com', params={'limit': 100}).ok
+    mock_get.assert_called_once_with(url='https://test.com', params={'limit': 100}, timeout=10)
+
+
+@patch('src.outbound.http.session.post')
+def test_send_listeners(mock_post):
+    calls = []
+    listener = http.add_listener(lambda method, url, elapsed, response: calls.append((method, url, response)))
+    mock_post.side_effect = [mock_post.return_value, ConnectionError('test error')]
+
+    http.send('post', 'https://test.com')
+    with pytest.raises(ConnectionError):
+        http.send('post', 'https://test.com')
+
+    assert http.remove_listener(listener)
+    assert not http.remove_listener(listener)
+    assert calls == [('post', 'https://test.com', mock_post.return_value), ('post', 'https://test.com', None)]
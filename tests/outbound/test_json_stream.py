@@ -0,0 +1,37 @@
+import pytest
+
+from src.outbound import json_stream
+
+
+def _chunks(text, size):
+    data = text.encode('utf-8')
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_iter_array_items():
+    text = '{"limit": 100, "meta": {"users": [9]}, "users": [{"name": "Zoë"}, {"name": "B", "ids": [1, 2]}, 12345], ' \
+           '"more": false}'
+
+    for size in (1, 3, 7, len(text)):
+        assert list(json_stream.iter_array_items(_chunks(text, size), 'users')) == \
+            [{'name': 'Zoë'}, {'name': 'B', 'ids': [1, 2]}, 12345]
+
+
+def test_iter_array_items_empty():
+    assert list(json_stream.iter_array_items([b'{}'], 'users')) == []
+    assert list(json_stream.iter_array_items([b'{"users": []}'], 'users')) == []
+    assert list(json_stream.iter_array_items([b'{"limit": 1}'], 'users')) == []
+
+
+def test_iter_array_items_invalid():
+    with pytest.raises(ValueError):
+        list(json_stream.iter_array_items([b'{"users": [{"name": '], 'users'))
+    with pytest.raises(ValueError):
+        list(json_stream.iter_array_items([b'[1, 2]'], 'users'))
+
+
+def test_pick():
+    entity = {'name': 'test', 'id': 1, 'user': {'summary': 'test user', 'id': 2}}
+
+    assert json_stream.pick(entity, ['name']) == {'name': 'test'}
+    assert json_stream.pick(entity, ['user.summary', 'missing', 'name.missing']) == {'user': {'summary': 'test user'}}
@@ -0,0 +1,58 @@
+import sys
+
+from src.outbound.memory_cache import MemoryBudget, MemoryCache, estimate_size
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+
+def test_estimate_size():
+    users = [{'name': 'Test User {}'.format(i), 'id': 'PU{}'.format(i)} for i in range(100)]
+
+    assert estimate_size('') == sys.getsizeof('')
+    assert estimate_size(users) > estimate_size(users[:10]) > estimate_size([])
+    assert estimate_size(EntitiesResp(Status(True, 'good'), users)) > estimate_size(users)
+    assert estimate_size([users, users]) < 2 * estimate_size(users)
+
+
+def test_get_put_and_stats():
+    cache = MemoryCache('test', MemoryBudget(limit_bytes=10000))
+
+    assert cache.get('a') is None
+    assert cache.put('a', 'value a', size=100)
+    assert cache.get('a') == 'value a'
+    assert cache.peek('missing', 'default') == 'default'
+    assert not cache.put('b', 'value b', size=20000)
+
+    assert cache.stats() == {'entries': 1, 'bytes': 100, 'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'evictions': 0,
+                             'rejections': 1}
+    assert cache.remove('a') == 'value a'
+    assert cache.budget.used_bytes == 0
+
+
+def test_global_budget_evicts_least_recently_used():
+    budget = MemoryBudget(limit_bytes=300)
+    directory, contacts = MemoryCache('directory', budget), MemoryCache('contacts', budget)
+    directory.put('users', 'users', size=100)
+    contacts.put('user 1', 'user 1', size=100)
+    directory.put('services', 'services', size=100)
+    directory.get('users')
+
+    contacts.put('user 2', 'user 2', size=100)
+
+    assert directory.keys() == ['users', 'services']
+    assert contacts.keys() == ['user 2']
+    assert contacts.stats()['evictions'] == 1
+    assert budget.stats()['used_bytes'] == 300
+
+
+def test_global_budget_evicts_by_cost_per_byte():
+    budget = MemoryBudget(limit_bytes=1000)
+    cache = MemoryCache('test', budget)
+    cache.put('big & cheap', 'value', cost=1, size=500)
+    cache.put('small', 'value', cost=1, size=100)
+    cache.put('big & expensive', 'value', cost=20, size=400)
+
+    cache.put('new', 'value', cost=1, size=100)
+
+    assert sorted(cache.keys()) == ['big & expensive', 'new', 'small']
+    assert budget.used_bytes == 600
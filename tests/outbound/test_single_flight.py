@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.outbound import deadline
+from src.outbound.deadline import DeadlineExceeded
+from src.outbound.single_flight import SingleFlight
+
+
+def test_single_flight_shares_in_flight_call():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(single_flight.do, 'key', slow_call) for _ in range(4)]
+        while single_flight.shared < 3:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == ['result'] * 4
+    assert len(calls) == 1
+
+
+def test_single_flight_does_not_cache_finished_calls():
+    single_flight = SingleFlight()
+
+    assert single_flight.do('key', lambda: 1) == 1
+    assert single_flight.do('key', lambda: 2) == 2
+
+
+def test_single_flight_raises_error():
+    def failing_call():
+        raise ValueError('test error')
+
+    with pytest.raises(ValueError):
+        SingleFlight().do('key', failing_call)
+
+
+def test_single_flight_waits_at_most_the_deadline():
+    single_flight = SingleFlight()
+    release = threading.Event()
+
+    def slow_call():
+        release.wait(5)
+        return 'result'
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        leader = executor.submit(single_flight.do, 'key', slow_call)
+        while 'key' not in single_flight._calls:
+            time.sleep(0.001)
+        try:
+            with deadline.start(0.05), pytest.raises(DeadlineExceeded):
+                single_flight.do('key', slow_call)
+        finally:
+            release.set()
+        assert leader.result() == 'result'
+
+
+def test_single_flight_retries_after_leader_deadline():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(5)
+            raise DeadlineExceeded('the 1s deadline has passed')
+        return 'result'
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        leader = executor.submit(single_flight.do, 'key', call)
+        while 'key' not in single_flight._calls:
+            time.sleep(0.001)
+        threading.Timer(0.05, release.set).start()
+
+        assert single_flight.do('key', call) == 'result'
+        with pytest.raises(DeadlineExceeded):
+            leader.result()
+    assert len(calls) == 2
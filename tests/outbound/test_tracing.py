@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.outbound import context, tracing
+
+
+@tracing.traced('lookup', 'name')
+def lookup(name, entity_type='users'):
+    tracing.annotate(cache='miss')
+    return name
+
+
+def test_trace_tree():
+    with tracing.trace('test-request-1', 'webhook', room='test room'):
+        with tracing.span('parse_args'):
+            pass
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(context.wrap(lookup), 'Test User').result() == 'Test User'
+
+    record = tracing.get_trace('test-request-1')
+    root = record['trace']
+    assert root['name'] == 'webhook'
+    assert root['attributes'] == {'room': 'test room'}
+    assert [child['name'] for child in root['children']] == ['parse_args', 'lookup']
+    assert root['children'][1]['attributes'] == {'name': 'Test User', 'cache': 'miss'}
+    assert root['duration_ms'] >= root['children'][1]['duration_ms']
+
+
+def test_untraced_calls():
+    assert tracing.current() is None
+    assert lookup('Test User') == 'Test User'
+    with tracing.span('parse_args') as span:
+        assert span is None
+
+
+def test_trace_errors_and_duplicates():
+    with pytest.raises(ValueError):
+        with tracing.trace('test-request-2', 'webhook'):
+            with tracing.span('run_command'):
+                raise ValueError('test error')
+
+    with tracing.trace('test-request-2', 'webhook'):
+        tracing.annotate(duplicate=True)
+
+    root = tracing.get_trace('test-request-2')['trace']
+    assert root['attributes'] == {'error': 'ValueError: test error'}
+    assert root['children'][0]['attributes'] == {'error': 'ValueError: test error'}
+    assert tracing.get_trace('unknown request') is None
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from src.outbound.memory_cache import MemoryBudget, MemoryCache
+from src.pager_duty import coverage, oncall_index
+from src.pager_duty.coverage import CoverageIssue
+from src.pager_duty.oncall_index import OncallEntry
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+SINCE = datetime(2018, 3, 1, tzinfo=timezone.utc)
+UNTIL = SINCE + timedelta(days=1)
+
+
+def _hours(hours):
+    return SINCE + timedelta(hours=hours)
+
+
+def test_find_coverage_issues():
+    entries = [
+        OncallEntry(SINCE - timedelta(days=1), _hours(12), 1, 'user a'),
+        OncallEntry(_hours(12), UNTIL + timedelta(days=1), 1, 'user b'),
+        OncallEntry(SINCE, _hours(6), 2, 'user c'),
+        OncallEntry(_hours(8), _hours(20), 2, 'user b'),
+        OncallEntry(_hours(20), UNTIL, 2, 'user d'),
+        OncallEntry(SINCE, UNTIL, 3, 'user b'),
+    ]
+
+    assert coverage.find_coverage_issues(entries, SINCE, UNTIL) == [
+        CoverageIssue(_hours(6), _hours(8), 'oncall level 2 is uncovered'),
+        CoverageIssue(_hours(12), _hours(20), 'user b is oncall for both level 1 & 2'),
+    ]
+    assert coverage.find_coverage_issues([], SINCE, UNTIL) == [
+        CoverageIssue(SINCE, UNTIL, 'oncall level 1 is uncovered'),
+        CoverageIssue(SINCE, UNTIL, 'oncall level 2 is uncovered'),
+    ]
+
+
+def test_find_coverage_issues_merges_handoffs():
+    entries = [
+        OncallEntry(SINCE, _hours(12), 1, 'user a'),
+        OncallEntry(_hours(12), UNTIL, 1, 'user a'),
+        OncallEntry(SINCE, _hours(12), 2, 'user b'),
+    ]
+
+    assert coverage.find_coverage_issues(entries, SINCE, UNTIL) == [
+        CoverageIssue(_hours(12), UNTIL, 'oncall level 2 is uncovered'),
+    ]
+
+
+@patch('src.pager_duty.coverage.datetime')
+@patch('src.pager_duty.coverage.get_all_entities_pages')
+@patch('src.pager_duty.coverage.fetch_oncall_entries')
+def test_forecast_coverage(mock_fetch_oncall_entries, mock_get_all_entities_pages, mock_datetime):
+    mock_datetime.now.return_value = SINCE
+    mock_get_all_entities_pages.return_value = EntitiesResp(Status(True, 'good'), [
+        {'name': 'Web'}, {'name': 'Operations'}, {'name': 'Amp'}])
+    mock_fetch_oncall_entries.return_value = EntitiesResp(Status(True, 'good'), [
+        {'escalation_policy': {'summary': ep}, 'escalation_level': level, 'user': {'summary': user},
+         'start': None, 'end': None} for ep, level, user in
+        [('Operations', 1, 'user a'), ('Operations', 2, 'user b'), ('Web', 1, 'user c'), ('Web', 2, 'user c')]
+    ])
+
+    forecast = coverage.forecast_coverage()
+
+    assert mock_fetch_oncall_entries.call_args[0] == (SINCE, UNTIL)
+    assert forecast.entities == {
+        'Amp': [CoverageIssue(SINCE, UNTIL, 'oncall level 1 is uncovered'),
+                CoverageIssue(SINCE, UNTIL, 'oncall level 2 is uncovered')],
+        'Web': [CoverageIssue(SINCE, UNTIL, 'user c is oncall for both level 1 & 2')],
+    }
+    assert coverage.coverage_to_string({'Web': forecast.entities['Web']}) == \
+        'Web: user c is oncall for both level 1 & 2 (2018-03-01T00:00:00+00:00 - 2018-03-02T00:00:00+00:00)'
+    assert coverage.forecast_coverage(ep_name='operations').entities == {}
+    assert not coverage.forecast_coverage(ep_name='unknown').status.success
+
+    assert coverage.monitor_primary_secondary().content == \
+        'Monitored successfully, coverage issues:\n' \
+        'Amp: oncall level 1 is uncovered (2018-03-01T00:00:00+00:00 - 2018-03-02T00:00:00+00:00)\n' \
+        'Amp: oncall level 2 is uncovered (2018-03-01T00:00:00+00:00 - 2018-03-02T00:00:00+00:00)'
+
+
+@patch('src.pager_duty.coverage.datetime')
+@patch('src.pager_duty.coverage.get_all_entities_pages')
+@patch('src.pager_duty.coverage.fetch_oncall_entries')
+def test_forecast_coverage_from_index(mock_fetch_oncall_entries, mock_get_all_entities_pages, mock_datetime):
+    mock_datetime.now.return_value = _hours(1)
+    mock_get_all_entities_pages.return_value = EntitiesResp(Status(True, 'good'), [{'name': 'Operations'}])
+    eps, _ = oncall_index.build_indexes([
+        {'escalation_policy': {'summary': 'Operations'}, 'escalation_level': level, 'user': {'summary': user},
+         'start': None, 'end': None} for level, user in [(1, 'user a'), (2, 'user b')]
+    ], SINCE, SINCE + timedelta(days=7))
+
+    with patch.object(oncall_index, '_index', MemoryCache('test oncall index', MemoryBudget())), \
+            patch('src.pager_duty.oncall_index.datetime') as mock_index_datetime:
+        oncall_index._index.put('index', {'as_of': SINCE, 'since': SINCE, 'until': SINCE + timedelta(days=7),
+                                          'escalation_policies': eps, 'schedules': {}})
+        mock_index_datetime.now.return_value = SINCE + timedelta(minutes=10)
+        forecast = coverage.forecast_coverage(hours=48)
+
+        assert not mock_fetch_oncall_entries.called
+        assert forecast.entities == {}
+        assert forecast.status.content.endswith('oncalls as of 2018-03-01T00:00:00+00:00')
+
+        mock_fetch_oncall_entries.return_value = EntitiesResp(Status(True, 'good'), [])
+        mock_index_datetime.now.return_value = SINCE + timedelta(seconds=oncall_index.INDEX_MAX_AGE_SECONDS)
+        forecast = coverage.forecast_coverage(hours=48)
+
+    assert mock_fetch_oncall_entries.called
+    assert forecast.status.content.endswith('oncalls as of 2018-03-01T01:00:00+00:00')
@@ -0,0 +1,34 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from src.pager_duty import directory
+
+
+def test_lookup():
+    directory.clear()
+    assert directory.lookup('users', 'Test User') is None
+
+    assert directory.replace('users', [{'name': 'Test User', 'id': '000'}]) == 1
+    assert directory.lookup('users', 'test user') == {'name': 'Test User', 'id': '000'}
+    assert directory.lookup('users', 'Test User', ttl=0) is None
+    assert directory.lookup('services', 'Test User') is None
+
+    directory.clear()
+    assert not directory.is_fresh('users')
+
+
+def test_snapshot_lookup():
+    with tempfile.TemporaryDirectory() as tmp, \
+            patch('src.pager_duty.directory.SNAPSHOT_PATH', os.path.join(tmp, 'directory.snapshot')):
+        assert directory.lookup('users', 'Test User') is None
+
+        assert directory.publish({'users': [{'name': 'Test User', 'id': '000'}]}) == 1
+        assert directory.lookup('users', 'test user') == {'name': 'Test User', 'id': '000'}
+        assert directory.lookup('users', 'Test User', ttl=0) is None
+        assert directory.is_fresh('users')
+        assert not directory.is_fresh('services')
+
+        directory.publish({'users': [{'name': 'Test User', 'id': '001'}]})
+        assert directory.lookup('users', 'test user') == {'name': 'Test User', 'id': '001'}
+        directory.clear()
@@ -0,0 +1,80 @@
+from unittest.mock import MagicMock, patch
+
+from src.pager_duty import incident_dedup
+from src.pager_duty.incident_dedup import IncidentDeduplicator, SharedIncidentDeduplicator
+
+
+def test_incident_key():
+    assert incident_dedup.incident_key('users', 'Test User', 'Checkout', 'Checkout is DOWN!!') == \
+        incident_dedup.incident_key('users', 'test user', 'checkout', '  checkout  is down')
+    assert incident_dedup.incident_key('users', 'Test User', 'Checkout', 'Checkout is down') != \
+        incident_dedup.incident_key('escalation_policies', 'Test User', 'Checkout', 'Checkout is down')
+
+
+def test_incident_deduplicator():
+    dedup = IncidentDeduplicator(window_seconds=60)
+    key = incident_dedup.incident_key('users', 'Test User', 'Checkout', 'Checkout is down')
+
+    assert dedup.begin(key, 'Sender 1') == (True, None)
+    is_first, record = dedup.begin(key, 'Sender 2')
+    assert not is_first
+    assert incident_dedup.duplicate_summary(record) == \
+        'not sending a duplicate incident: the same incident is already being sent by Sender 1, 1 duplicate ' \
+        'request suppressed'
+
+    dedup.finish(key, {'id': 'PI1', 'incident_number': 42, 'html_url': 'https://pd.com/incidents/PI1'})
+    is_first, record = dedup.begin(key, 'Sender 3')
+    assert incident_dedup.duplicate_summary(record) == \
+        'not sending a duplicate incident: the same incident was already sent by Sender 1 0s ago ' \
+        '(#42 https://pd.com/incidents/PI1), 2 duplicate requests suppressed'
+
+    assert dedup.discard(key)
+    assert dedup.begin(key, 'Sender 3') == (True, None)
+
+
+def test_incident_deduplicator_window():
+    dedup = IncidentDeduplicator(window_seconds=60)
+    key = incident_dedup.incident_key('users', 'Test User', 'Checkout', 'Checkout is down')
+    dedup.begin(key, 'Sender 1')
+
+    with patch('src.pager_duty.incident_dedup.time.monotonic', return_value=10 ** 9):
+        assert dedup.begin(key, 'Sender 2') == (True, None)
+
+
+def test_incident_deduplicator_max_incidents():
+    dedup = IncidentDeduplicator(window_seconds=60, max_incidents=1)
+    key = incident_dedup.incident_key('users', 'Test User', 'Checkout', 'Checkout is down')
+    other_key = incident_dedup.incident_key('users', 'Test User', 'Search', 'Search is down')
+
+    assert dedup.begin(key, 'Sender 1') == (True, None)
+    assert dedup.begin(other_key, 'Sender 1') == (True, None)
+    assert dedup.begin(key, 'Sender 2') == (True, None)
+
+
+def test_shared_incident_deduplicator():
+    table = MagicMock()
+    table.claim.side_effect = [
+        (True, None),
+        (False, {'value': {'sender': 'Sender 1', 'incident': {'id': 'PI1', 'incident_number': 42, 'html_url': None}},
+                 'age': 3.7, 'duplicates': 2}),
+    ]
+    dedup = SharedIncidentDeduplicator(table, window_seconds=60)
+    key = incident_dedup.incident_key('users', 'Test User', 'Checkout', 'Checkout is down')
+
+    assert dedup.begin(key, 'Sender 1') == (True, None)
+    assert table.claim.call_args[0] == \
+        ('incident|checkout|users|test user|checkout is down', 60, {'sender': 'Sender 1', 'incident': None})
+
+    dedup.finish(key, {'id': 'PI1', 'incident_number': 42, 'html_url': None, 'title': 'Checkout is down'})
+    assert table.set_value.call_args[0] == ('incident|checkout|users|test user|checkout is down',
+                                            {'sender': 'Sender 1', 'incident': {'id': 'PI1', 'incident_number': 42,
+                                                                                'html_url': None}})
+
+    is_first, record = dedup.begin(key, 'Sender 2')
+    assert incident_dedup.duplicate_summary(record) == \
+        'not sending a duplicate incident: the same incident was already sent by Sender 1 3s ago (#42), ' \
+        '2 duplicate requests suppressed'
+
+    table.release.return_value = True
+    assert dedup.discard(key)
+    table.release.assert_called_once_with('incident|checkout|users|test user|checkout is down')
@@ -0,0 +1,40 @@
+from src.pager_duty import name_index
+
+
+def test_trigram_index_suggest():
+    index = name_index.TrigramIndex()
+    index.update(['Operations', 'OpsDirect', 'ops-delayed', 'Data Engineering', 'DataScience'])
+
+    assert index.suggest('Operatons')[0] == 'Operations'
+    assert index.suggest('data enginering')[0] == 'Data Engineering'
+    assert index.suggest('zzzz') == []
+
+
+def test_trigram_index_update():
+    index = name_index.TrigramIndex()
+    assert index.update(['Operations', 'Web']) == (2, 0)
+    assert index.update(['operations', 'Web Escalation']) == (1, 1)
+
+    assert index.suggest('Web') == ['Web Escalation']
+    assert not index.remove('Web')
+    assert index.remove('Web Escalation')
+    assert index.suggest('Web') == []
+
+
+def test_trigram_index_max_names():
+    index = name_index.TrigramIndex(max_names=2)
+    assert index.add('Operations') and index.add('Web')
+    assert index.add('Data Engineering')
+
+    assert sorted(index.names.values()) == ['Data Engineering', 'Web']
+    assert index.suggest('Operatons') == []
+
+
+def test_suggest():
+    name_index.clear()
+    assert name_index.suggest('users', 'Test Usr') == []
+
+    assert name_index.add_names('users', ['Test User', 'Test User']) == 1
+    assert name_index.suggest('users', 'Test Usr') == ['Test User']
+    assert name_index.suggest('services', 'Test Usr') == []
+    name_index.clear()
@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+from src.outbound.memory_cache import MemoryBudget, MemoryCache
+from src.pager_duty import oncall_index
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+SINCE = datetime(2018, 3, 1, tzinfo=timezone.utc)
+UNTIL = SINCE + timedelta(days=7)
+
+
+def _oncall(ep, level, user, start, end, schedule=None):
+    oncall = {'escalation_policy': {'summary': ep}, 'escalation_level': level, 'user': {'summary': user},
+              'start': start, 'end': end}
+    if schedule:
+        oncall['schedule'] = {'summary': schedule}
+    return oncall
+
+
+def test_parse_pd_time():
+    expected = datetime(2018, 3, 1, 4, tzinfo=timezone.utc)
+
+    assert oncall_index.parse_pd_time('2018-03-01T00:00:00-04:00') == expected
+    assert oncall_index.parse_pd_time('2018-03-01T04:00:00Z') == expected
+    assert oncall_index.parse_pd_time('2018-03-01T04:00') == expected
+
+
+def test_interval_index():
+    entries = [
+        oncall_index.OncallEntry(SINCE, SINCE + timedelta(days=1), 1, 'user a'),
+        oncall_index.OncallEntry(SINCE + timedelta(days=1), UNTIL, 1, 'user b'),
+        oncall_index.OncallEntry(SINCE, UNTIL, 2, 'user c'),
+    ]
+    index = oncall_index.IntervalIndex(entries)
+
+    assert [e.user for e in index.at(SINCE + timedelta(hours=12))] == ['user a', 'user c']
+    assert [e.user for e in index.at(SINCE + timedelta(days=1))] == ['user c', 'user b']
+    assert index.at(UNTIL) == []
+    assert [e.user for e in index.between(SINCE + timedelta(hours=12), SINCE + timedelta(days=2))] == \
+        ['user a', 'user c', 'user b']
+
+
+def test_build_indexes_dedups_schedule_shifts():
+    shift = ('2018-03-01T00:00:00Z', '2018-03-02T00:00:00Z')
+    eps, schedules = oncall_index.build_indexes([
+        _oncall('EP A', 1, 'user a', *shift, schedule='Primary'),
+        _oncall('EP B', 1, 'user a', *shift, schedule='Primary'),
+        _oncall('EP B', 2, 'user a', *shift, schedule='Primary'),
+        _oncall('EP B', 3, 'user b', *shift, schedule='Primary'),
+    ], SINCE, UNTIL)
+
+    assert [e.user for e in schedules['primary'].at(SINCE)] == ['user a', 'user b']
+    assert [(e.escalation_level, e.user) for e in eps['ep b'].at(SINCE)] == \
+        [(1, 'user a'), (2, 'user a'), (3, 'user b')]
+
+
+@patch('src.pager_duty.oncall_index.send')
+@patch('src.pager_duty.oncall_index._get_entities_resp_helper')
+def test_fetch_oncall_entries(mock_get_entities_resp_helper, mock_get):
+    mock_get_entities_resp_helper.side_effect = [
+        EntitiesResp(Status(True, 'good'), {'oncalls': [{'id': 1}], 'more': True}),
+        EntitiesResp(Status(True, 'good'), {'oncalls': [{'id': 2}], 'more': False}),
+    ]
+
+    assert oncall_index.fetch_oncall_entries(SINCE, UNTIL).entities == [{'id': 1}, {'id': 2}]
+    assert mock_get.call_args[1]['params']['offset'] == 1
+
+
+@patch('src.pager_duty.oncall_index.fetch_oncall_entries')
+def test_who_is_oncall(mock_fetch_oncall_entries):
+    now = datetime.now(timezone.utc)
+    mock_fetch_oncall_entries.return_value = EntitiesResp(Status(True, 'good'), [
+        _oncall('Operations', 1, 'user a', None, None, schedule='Ops Primary'),
+        _oncall('Operations', 2, 'user b', now.isoformat(), (now + timedelta(hours=1)).isoformat()),
+    ])
+    assert oncall_index.refresh_oncall_index().success
+
+    at_resp = oncall_index.who_is_oncall('escalation_policies', 'operations', now + timedelta(hours=2))
+    assert at_resp.status.success
+    assert at_resp.entity.startswith('1: user a (')
+
+    schedule_resp = oncall_index.who_is_oncall('schedules', 'Ops Primary', now, now + timedelta(days=1))
+    assert schedule_resp.entity.startswith('user a (')
+
+    assert not oncall_index.who_is_oncall('escalation_policies', 'operations', now + timedelta(days=30)).status.success
+    assert not oncall_index.who_is_oncall('escalation_policies', 'Web', now + timedelta(hours=2)).status.success
+
+
+@patch('src.pager_duty.oncall_index.fetch_oncall_entries')
+def test_who_is_oncall_refreshes_stale_index(mock_fetch_oncall_entries):
+    now = datetime.now(timezone.utc)
+    mock_fetch_oncall_entries.return_value = EntitiesResp(Status(True, 'good'), [
+        _oncall('Operations', 1, 'user a', None, None),
+    ])
+    stale = {'as_of': now - timedelta(days=8), 'since': now - timedelta(days=8), 'until': now - timedelta(days=1),
+             'escalation_policies': {}, 'schedules': {}}
+
+    with patch.object(oncall_index, '_index', MemoryCache('test oncall index', MemoryBudget())):
+        oncall_index._index.put('index', stale)
+        assert not oncall_index.is_fresh()
+        at_resp = oncall_index.who_is_oncall('escalation_policies', 'operations', now)
+        assert oncall_index.is_fresh()
+
+    assert at_resp.status.success
+    assert at_resp.entity.startswith('1: user a (')
+
+    mock_fetch_oncall_entries.return_value = EntitiesResp(Status(False, 'pager duty is down'))
+    with patch.object(oncall_index, '_index', MemoryCache('test oncall index', MemoryBudget())):
+        oncall_index._index.put('index', stale)
+        at_resp = oncall_index.who_is_oncall('escalation_policies', 'operations', now)
+
+    assert at_resp.status.content.startswith('the oncall index only covers')
+
+    mock_fetch_oncall_entries.return_value = EntitiesResp(Status(True, 'good'), [
+        _oncall('Operations', 1, 'user a', None, None),
+    ])
+    with patch.object(oncall_index, '_index', MemoryCache('test oncall index', MemoryBudget(limit_bytes=1024))):
+        at_resp = oncall_index.who_is_oncall('escalation_policies', 'operations', now)
+
+    assert at_resp.status.content.startswith('the oncall index of 1 oncall entries does not fit')
@@ -1,15 +1,25 @@
 import collections
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch
 
+import requests
+
 from src.pager_duty.pd import send_incident, override_schedule, ensure_oncalls, search_entity, list_specific_entity, \
     list_all_entities, list_ep_by_level, list_contact_methods, get_all_entities_resp, get_user_contact_methods, \
-    clean_contact_method, contact_methods_to_string
+    clean_contact_method, contact_methods_to_string, in_flight_gets, load_directory, \
+    stream_entities, _send_get, shared_lookups
+from src.outbound.deadline import DeadlineExceeded
+from src.pager_duty import directory, name_index, pd, snapshot
 from src.value_objects.entities_resp import EntitiesResp
 from src.value_objects.entity_resp import EntityResp
 from src.value_objects.status import Status
 
 
-@patch('src.pager_duty.pd.requests.post')
+@patch('src.pager_duty.pd.send')
 @patch('src.pager_duty.pd.search_entity')
 @patch('src.pager_duty.pd.search_entity')
 @patch('src.pager_duty.pd.get_user_login_email')
@@ -22,7 +32,7 @@ def test_send_user_incident(mock_get_user_login_email, mock_user_search_entity,
     assert send_incident('users', 'test@iheartradio.com', 'test_user', 'test_service', 'test_title', 'message').success
 
 
-@patch('src.pager_duty.pd.requests.post')
+@patch('src.pager_duty.pd.send')
 @patch('src.pager_duty.pd.search_entity')
 @patch('src.pager_duty.pd.search_entity')
 def test_override_schedule(mock_schedule_search, mock_user_search, mock_post):
@@ -42,6 +52,43 @@ def test_ensure_oncalls(mock_list_all_entities, mock_list_oncalls_by_ep):
     assert ensure_oncalls().entities == ['test_ep: oncall level 1 does not exist']
 
 
+@patch('src.pager_duty.pd.list_oncalls_by_ep')
+@patch('src.pager_duty.pd.list_all_entities')
+def test_ensure_oncalls_same_user(mock_list_all_entities, mock_list_oncalls_by_ep):
+    mock_list_all_entities.return_value = EntitiesResp(Status(True, 'good'), ['test_ep'])
+    mock_list_oncalls_by_ep.return_value = EntitiesResp(Status(True, 'good'), {'oncalls': [
+        {'escalation_level': 1, 'user': {'summary': 'Test User'}},
+        {'escalation_level': 2, 'user': {'summary': 'Test User'}},
+    ]})
+
+    assert ensure_oncalls().entities == ['test_ep: Test User is oncall for both level 1 & 2']
+
+
+@patch('src.pager_duty.pd.list_oncalls_by_ep')
+@patch('src.pager_duty.pd.list_all_entities')
+def test_ensure_oncalls_upstream_timeout(mock_list_all_entities, mock_list_oncalls_by_ep):
+    mock_list_all_entities.return_value = EntitiesResp(Status(True, 'good'), ['test_ep', 'test_ep_2'])
+    mock_list_oncalls_by_ep.side_effect = [requests.ReadTimeout('test timeout'),
+                                           EntitiesResp(Status(True, 'good'), {'oncalls': [{'escalation_level': 2}]})]
+
+    assert ensure_oncalls().entities == ['test_ep: could not be checked, pager duty took too long to answer',
+                                         'test_ep_2: oncall level 1 does not exist']
+
+
+@patch('src.pager_duty.pd.list_oncalls_by_ep')
+@patch('src.pager_duty.pd.list_all_entities')
+def test_ensure_oncalls_out_of_time(mock_list_all_entities, mock_list_oncalls_by_ep):
+    mock_list_all_entities.return_value = EntitiesResp(Status(True, 'good'), ['test_ep', 'test_ep_2', 'test_ep_3'])
+    mock_list_oncalls_by_ep.side_effect = [EntitiesResp(Status(True, 'good'), {'oncalls': [{'escalation_level': 2}]}),
+                                           DeadlineExceeded('test deadline')]
+
+    ensure_resp = ensure_oncalls()
+
+    assert ensure_resp.status.content == 'partially ensured all primary & secondary'
+    assert ensure_resp.entities == ['test_ep: oncall level 1 does not exist',
+                                    'ran out of time, only checked 1 of 3 escalation policies']
+
+
 @patch('src.pager_duty.pd.get_all_entities_resp')
 def test_search_entity(mock_get_all_users):
     mock_get_all_users.return_value = EntitiesResp(Status(True, 'good'),
@@ -50,12 +97,52 @@ def test_search_entity(mock_get_all_users):
     assert search_entity('Test User', 'users').entity == {'name': 'Test User'}
 
 
-@patch('src.pager_duty.pd.get_all_entities_resp')
-def test_list_all_entities(mock_get_all_users):
-    mock_get_all_users.return_value = EntitiesResp(Status(True, 'good'),
-                                                   {'users': [{'name': 'Test User'}, {'name': 'Test User 2'}]})
+@patch('src.pager_duty.pd.send')
+def test_list_all_entities(mock_send):
+    mock_send.return_value.ok = True
+    mock_send.return_value.iter_content.return_value = [b'{"users": [{"name": "Test User", "email": "a@b.com"}, ',
+                                                        b'{"name": "Test User 2"}], "limit": 100}']
 
     assert list_all_entities('users').entities == ['Test User', 'Test User 2']
+    assert mock_send.return_value.close.called
+
+
+@patch('src.pager_duty.pd.send')
+def test_list_all_entities_stream_error(mock_send):
+    def iter_content(chunk_size):
+        yield b'{"users": [{"name": "Test User"}, '
+        raise requests.exceptions.ChunkedEncodingError('connection broken')
+
+    mock_send.return_value.ok = True
+    mock_send.return_value.iter_content.side_effect = iter_content
+
+    assert list_all_entities('users').status.content == \
+        'error: connection broken\ncould not retrieve all users'
+    assert mock_send.return_value.close.called
+
+    mock_send.side_effect = requests.ConnectionError('connection refused')
+    assert not list_all_entities('users').status.success
+
+
+@patch('src.pager_duty.pd.in_flight_gets.do')
+def test_list_all_entities_single_flight(mock_do):
+    mock_do.return_value = EntitiesResp(Status(True, 'good'), ['Test User'])
+
+    assert list_all_entities('users').entities == ['Test User']
+    assert mock_do.call_args[0][0] == ('list_all_entities', 'users')
+
+
+@patch('src.pager_duty.pd.send')
+def test_stream_entities(mock_send):
+    mock_send.return_value.ok = True
+    mock_send.return_value.iter_content.return_value = [b'{"oncalls": [{"user": {"summary": "Test User", "id": 1}, ',
+                                                        b'"escalation_level": 1}]}']
+
+    assert list(stream_entities('oncalls', ['user.summary']).entities) == [{'user': {'summary': 'Test User'}}]
+
+    mock_send.return_value.ok = False
+    mock_send.return_value.text = 'error'
+    assert stream_entities('oncalls', ['user.summary']).status.content == 'could not retrieve all oncalls: error'
 
 
 @patch('src.pager_duty.pd.list_ep_by_level')
@@ -70,7 +157,7 @@ def test_list_specific_entity(mock_list_contact_methods, mock_list_ep_by_level):
 
 @patch('src.pager_duty.pd.list_contact_methods')
 @patch('src.pager_duty.pd._get_entities_resp_helper')
-@patch('src.pager_duty.pd.requests.get')
+@patch('src.pager_duty.pd.send')
 @patch('src.pager_duty.pd.search_entity')
 def test_list_ep_by_level(mock_search_entity, mock_get, mock_get_entities_resp_helper, mock_list_contact_methods):
     mock_search_entity.return_value = EntityResp(Status(True, 'good'), {'id': 1111})
@@ -100,7 +187,7 @@ def test_list_contact_methods(mock_search_entity, mock_get_user_contact_methods,
     assert list_contact_methods('test user').entities is not None
 
 
-@patch('src.pager_duty.pd.requests.get')
+@patch('src.pager_duty.pd.send')
 def test_get_all_entities_resp(mock_get):
     mock_get.return_value.ok = True
     mock_get.return_value.json.return_value = {'test entity': 'test value'}
@@ -111,7 +198,7 @@ def test_get_all_entities_resp(mock_get):
     assert entities_resp.entities == {'test entity': 'test value'}
 
 
-@patch('src.pager_duty.pd.requests.get')
+@patch('src.pager_duty.pd.send')
 def test_get_user_contact_methods(mock_get):
     mock_get.return_value.ok = True
 
@@ -161,3 +248,125 @@ def test_contact_methods_to_string():
 def test_sort_ep():
     mock_unsorted_data = {3: 'test 3', 1: 'test 1', 4: 'test 4', 2: 'test 2'}
     assert mock_unsorted_data == collections.OrderedDict({1: 'test 1', 2: 'test 2', 3: 'test 3', 4: 'test 4'})
+
+
+@patch('src.pager_duty.pd.send')
+def test_get_all_entities_resp_single_flight(mock_get):
+    release = threading.Event()
+    mock_get.return_value.ok = True
+    mock_get.return_value.json.return_value = {'users': []}
+    mock_get.side_effect = lambda *args, **kwargs: release.wait(5) and mock_get.return_value
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(get_all_entities_resp, 'users', 'Test User') for _ in range(2)]
+        while in_flight_gets.shared < 1:
+            time.sleep(0.001)
+        release.set()
+
+        assert futures[0].result() is futures[1].result()
+    assert mock_get.call_count == 1
+
+
+@patch('src.pager_duty.pd._get_entities')
+def test_load_directory(mock_get_entities):
+    mock_get_entities.side_effect = [
+        EntitiesResp(Status(True, 'good'), {'users': [{'name': 'Test User'}], 'more': True}),
+        EntitiesResp(Status(True, 'good'), {'users': [{'name': 'Test User 2'}], 'more': False}),
+    ]
+
+    assert load_directory(['users']).success
+    assert mock_get_entities.call_args[0][2]['offset'] == 1
+    assert search_entity('test user 2', 'users').entity == {'name': 'Test User 2'}
+    directory.clear()
+
+
+@patch('src.pager_duty.pd._get_entities')
+def test_load_directory_snapshot(mock_get_entities):
+    mock_get_entities.return_value = EntitiesResp(Status(True, 'good'), {'users': [{'name': 'Test User'}]})
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            patch('src.pager_duty.directory.SNAPSHOT_PATH', os.path.join(tmp, 'directory.snapshot')):
+        assert load_directory(['users']).content == 'published 1 entities to the directory snapshot'
+        assert load_directory(['users']).content == 'using the directory snapshot published by another worker'
+        with snapshot.refresh_lock(directory.SNAPSHOT_PATH):
+            assert load_directory(['users']).content == 'using the directory snapshot being refreshed by another worker'
+
+        assert mock_get_entities.call_count == 1
+        assert search_entity('test user', 'users').entity == {'name': 'Test User'}
+        directory.clear()
+
+
+@patch('src.pager_duty.pd.get_all_entities_resp')
+@patch('src.pager_duty.pd._get_entities')
+def test_stale_snapshot_lookup_refreshes(mock_get_entities, mock_get_all_entities_resp):
+    mock_get_entities.side_effect = lambda entity_type, url, params: \
+        EntitiesResp(Status(True, 'good'), {entity_type: [{'name': 'Test {}'.format(entity_type)}]})
+    mock_get_all_entities_resp.return_value = EntitiesResp(Status(True, 'good'), {'users': [{'name': 'Test users'}]})
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            patch('src.pager_duty.directory.SNAPSHOT_PATH', os.path.join(tmp, 'directory.snapshot')):
+        snapshot.write(directory.SNAPSHOT_PATH, {'users': [{'name': 'Test users'}]}, loaded_at=0)
+
+        assert search_entity('test users', 'users').entity == {'name': 'Test users'}
+        assert mock_get_all_entities_resp.call_count == 1
+        assert pd._snapshot_refresh[0].result().content == 'published 4 entities to the directory snapshot'
+        assert pd.refresh_stale_snapshot('users') is None
+
+        assert search_entity('test services', 'services').entity == {'name': 'Test services'}
+        assert mock_get_all_entities_resp.call_count == 1
+        directory.clear()
+
+
+@patch('src.pager_duty.pd.get_all_entities_resp')
+def test_search_entity_suggestions(mock_get_all_entities_resp):
+    name_index.clear()
+    name_index.add_names('escalation_policies', ['Operations', 'Web'])
+    mock_get_all_entities_resp.return_value = EntitiesResp(Status(True, 'good'), {'escalation_policies': []})
+
+    assert search_entity('Operatons', 'escalation_policies').status.content == \
+        'could not find entity name: \'Operatons\' of type \'escalation_policies\', did you mean: \'Operations\'?'
+    name_index.clear()
+
+
+@patch('src.pager_duty.pd.hedged_gets.call')
+@patch('src.pager_duty.pd.send')
+def test_send_get_hedging(mock_send, mock_hedged_call):
+    _send_get('users', 'https://test.com/users', {'limit': 100})
+    assert mock_send.called and not mock_hedged_call.called
+
+    with patch('src.pager_duty.pd.HEDGE_GETS', True):
+        _send_get('escalation_policies', 'https://test.com/escalation_policies', {'limit': 100})
+        assert not mock_hedged_call.called
+        assert _send_get('users', 'https://test.com/users', {'limit': 100}) == mock_hedged_call.return_value
+        assert mock_hedged_call.call_args[0][0] == 'users'
+
+
+@patch('src.pager_duty.pd.get_all_entities_resp')
+def test_search_entity_shared_lookups(mock_get_all_entities_resp):
+    mock_get_all_entities_resp.return_value = EntitiesResp(Status(True, 'good'), {'users': [{'name': 'Test User'}]})
+
+    with shared_lookups():
+        assert search_entity('Test User', 'users').entity == {'name': 'Test User'}
+        assert search_entity('test user', 'users').entity == {'name': 'Test User'}
+    assert mock_get_all_entities_resp.call_count == 1
+
+    search_entity('Test User', 'users')
+    assert mock_get_all_entities_resp.call_count == 2
+
+
+@patch('src.pager_duty.pd.send')
+@patch('src.pager_duty.pd.search_entity')
+@patch('src.pager_duty.pd.get_user_login_email')
+def test_send_incident_duplicates(mock_get_user_login_email, mock_search_entity, mock_post):
+    mock_get_user_login_email.return_value = EntityResp(Status(True, 'good'), 'testuser@iheart.com')
+    mock_search_entity.return_value = EntityResp(Status(True, 'good'), entity={'id': '000', 'type': 'test type'})
+    mock_post.return_value.ok = True
+    mock_post.return_value.json.return_value = {'incident': {'id': 'PI1', 'incident_number': 42}}
+
+    assert send_incident('users', 'Sender 1', 'test_user', 'dedup_service', 'Dedup is down!', 'message').success
+    duplicate = send_incident('users', 'Sender 2', 'Test_User', 'dedup_service', 'dedup is down', 'message')
+
+    assert duplicate.content == 'not sending a duplicate incident: the same incident was already sent by Sender 1 0s ' \
+                                'ago (#42), 1 duplicate request suppressed'
+    assert mock_post.call_count == 1
+    assert mock_post.call_args[1]['headers']['FROM'] == 'testuser@iheart.com'
@@ -0,0 +1,56 @@
+from unittest.mock import patch
+
+from src.outbound import deadline
+from src.pager_duty import roster
+from src.value_objects.entities_resp import EntitiesResp
+from src.value_objects.status import Status
+
+
+def _oncall(ep, level, user_id, user_name):
+    return {'escalation_policy': {'summary': ep}, 'escalation_level': level,
+            'user': {'id': user_id, 'summary': user_name}}
+
+
+@patch('src.pager_duty.roster.get_user_contact_methods')
+@patch('src.pager_duty.roster.get_all_entities_pages')
+def test_refresh_roster(mock_get_all_entities_pages, mock_get_user_contact_methods):
+    mock_get_all_entities_pages.return_value = EntitiesResp(Status(True, 'good'), [
+        _oncall('Operations', 2, 'U2', 'test user 2'),
+        _oncall('Operations', 1, 'U1', 'test user 1'),
+        _oncall('Web', 1, 'U1', 'test user 1'),
+    ])
+    mock_get_user_contact_methods.return_value = EntitiesResp(Status(True, 'good'), {'contact_methods': [
+        {'type': 'phone_contact_method', 'address': '1112223333'}]})
+
+    assert roster.refresh_roster().content == 'roster refreshed with 2 escalation policies, 2 contact lookups'
+    assert roster.refresh_roster().content == 'roster refreshed with 2 escalation policies, 0 contact lookups'
+
+    ep_levels = roster.get_ep_levels('operations')
+    assert ep_levels.status.content.startswith('as of ')
+    assert list(ep_levels.entity.items()) == [(1, ['test user 1, phone: 1112223333']),
+                                              (2, ['test user 2, phone: 1112223333'])]
+    assert roster.get_ep_levels('Amp') is None
+    assert roster.get_ep_levels('Operations', max_age=0) is None
+
+    assert roster.get_roster().entity == "Operations\n1: ['test user 1, phone: 1112223333']\n" \
+                                         "2: ['test user 2, phone: 1112223333']\n\nWeb\n" \
+                                         "1: ['test user 1, phone: 1112223333']"
+
+
+@patch('src.pager_duty.roster.get_user_contact_methods')
+@patch('src.pager_duty.roster.get_all_entities_pages')
+def test_refresh_roster_keeps_deadline(mock_get_all_entities_pages, mock_get_user_contact_methods):
+    roster._contacts.clear()
+    mock_get_all_entities_pages.return_value = EntitiesResp(Status(True, 'good'),
+                                                            [_oncall('Web', 1, 'U3', 'test user 3')])
+    budgets = []
+
+    def get_user_contact_methods(user_id):
+        budgets.append(deadline.budget())
+        return EntitiesResp(Status(True, 'good'), {'contact_methods': []})
+    mock_get_user_contact_methods.side_effect = get_user_contact_methods
+
+    with deadline.start(7):
+        assert roster.refresh_roster().success
+
+    assert budgets == [7]
@@ -0,0 +1,50 @@
+import os
+import tempfile
+
+from src.pager_duty import snapshot
+
+
+def test_write_and_lookup():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'directory.snapshot')
+        users = [{'name': 'Test User {}'.format(i), 'id': 'PU{}'.format(i)} for i in range(20)]
+
+        assert snapshot.write(path, {'users': users, 'services': [{'name': 'Ünïcode Service', 'id': 'PS1'}]},
+                              loaded_at=100.0) == 21
+        current = snapshot.Snapshot(path)
+
+        assert current.loaded_at('users') == 100.0
+        assert current.loaded_at('schedules') is None
+        assert current.lookup('users', 'test user 13') == {'name': 'Test User 13', 'id': 'PU13'}
+        assert current.lookup('services', 'ünïcode SERVICE') == {'name': 'Ünïcode Service', 'id': 'PS1'}
+        assert current.lookup('users', 'Test User 20') is None
+        assert current.lookup('schedules', 'Test User 1') is None
+        assert current.names('users')[:3] == ['Test User 0', 'Test User 1', 'Test User 10']
+        assert [f for f in os.listdir(tmp)] == ['directory.snapshot']
+        current.close()
+
+
+def test_published_versions():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'directory.snapshot')
+        assert snapshot.file_version(path) is None
+
+        snapshot.write(path, {'users': [{'name': 'Test User'}]})
+        old = snapshot.Snapshot(path)
+        snapshot.write(path, {'users': []})
+
+        assert snapshot.file_version(path) != old.version
+        assert old.lookup('users', 'Test User') == {'name': 'Test User'}
+        assert snapshot.Snapshot(path).lookup('users', 'Test User') is None
+
+
+def test_refresh_lock():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'directory.snapshot')
+        with snapshot.refresh_lock(path) as is_refresher:
+            assert is_refresher
+            with snapshot.refresh_lock(path) as is_other_refresher:
+                assert not is_other_refresher
+
+        with snapshot.refresh_lock(path) as is_refresher:
+            assert is_refresher